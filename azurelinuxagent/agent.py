@@ -38,6 +38,7 @@ from azurelinuxagent.common.future import ustr
 from azurelinuxagent.common.logcollector import LogCollector, OUTPUT_RESULTS_FILE_PATH
 from azurelinuxagent.common.osutil import get_osutil
 from azurelinuxagent.common.utils import fileutil, textutil
+from azurelinuxagent.common.utils.archive import GoalStateHistoryStore
 from azurelinuxagent.common.utils.flexible_version import FlexibleVersion
 from azurelinuxagent.common.utils.networkutil import AddFirewallRules
 from azurelinuxagent.common.version import AGENT_NAME, AGENT_LONG_VERSION, AGENT_VERSION, \
@@ -65,6 +66,7 @@ class AgentCommands(object):
     CollectLogs = "collect-logs"
     SetupFirewall = "setup-firewall"
     Provision = "provision"
+    ShowGoalStateHistory = "show-goal-state-history"
 
 
 class Agent(object):
@@ -227,6 +229,31 @@ class Agent(object):
             print("Detailed log output can be found at {0}".format(OUTPUT_RESULTS_FILE_PATH))
             sys.exit(1)
 
+    @staticmethod
+    def show_goal_state_history(incarnation):
+        """
+        Prints the documents of the given incarnation from the goal state history store or, if no incarnation is
+        given, the goal states in the store
+        """
+        history_store = GoalStateHistoryStore(conf.get_lib_dir())
+        if incarnation is None:
+            goal_states = []
+            for entry in history_store.get_index():
+                goal_state = (entry["timestamp"], entry["incarnation"], entry["etag"])
+                if goal_state not in goal_states:
+                    goal_states.append(goal_state)
+            for timestamp, goal_state_incarnation, etag in goal_states:
+                print("{0} Incarnation: {1} ETag: {2}".format(timestamp, goal_state_incarnation, etag))
+            return
+
+        documents = history_store.get_documents(incarnation=incarnation)
+        if documents is None:
+            print("Incarnation {0} is not in the goal state history".format(incarnation), file=sys.stderr)
+            sys.exit(1)
+        for name in sorted(documents.keys()):
+            print("==> {0} <==".format(name))
+            print(ustr(documents[name], encoding="utf-8", errors="replace"))
+
     @staticmethod
     def setup_firewall(firewall_metadata):
 
@@ -249,7 +276,7 @@ def main(args=None):
         args = []
     if len(args) <= 0:
         args = sys.argv[1:]
-    command, force, verbose, debug, conf_file_path, log_collector_full_mode, firewall_metadata = parse_args(args)
+    command, force, verbose, debug, conf_file_path, log_collector_full_mode, firewall_metadata, incarnation = parse_args(args)
     if command == AgentCommands.Version:
         version()
     elif command == AgentCommands.Help:
@@ -277,6 +304,8 @@ def main(args=None):
                 agent.collect_logs(log_collector_full_mode)
             elif command == AgentCommands.SetupFirewall:
                 agent.setup_firewall(firewall_metadata)
+            elif command == AgentCommands.ShowGoalStateHistory:
+                agent.show_goal_state_history(incarnation)
         except Exception as e:
             logger.error(u"Failed to run '{0}': {1}",
                          command,
@@ -298,6 +327,7 @@ def parse_args(sys_args):
         "uid": None,
         "wait": ""
     }
+    incarnation = None
 
     regex_cmd_format = "^([-/]*){0}"
 
@@ -350,11 +380,15 @@ def parse_args(sys_args):
             firewall_metadata['uid'] = re.match(regex_cmd_format.format("uid=(?P<uid>[\\d]+)"), arg).group('uid')
         elif re.match(regex_cmd_format.format("(w|wait)$"), arg):
             firewall_metadata['wait'] = "-w"
+        elif re.match(regex_cmd_format.format(AgentCommands.ShowGoalStateHistory), arg):
+            cmd = AgentCommands.ShowGoalStateHistory
+        elif re.match(regex_cmd_format.format("incarnation=(?P<incarnation>[\\d]+)$"), arg):
+            incarnation = re.match(regex_cmd_format.format("incarnation=(?P<incarnation>[\\d]+)$"), arg).group('incarnation')
         else:
             cmd = AgentCommands.Help
             break
 
-    return cmd, force, verbose, debug, conf_file_path, log_collector_full_mode, firewall_metadata
+    return cmd, force, verbose, debug, conf_file_path, log_collector_full_mode, firewall_metadata, incarnation
 
 
 def version():
@@ -378,7 +412,8 @@ def usage():
     s += ("usage: {0} [-verbose] [-force] [-help] "
            "-configuration-path:<path to configuration file>" 
            "-deprovision[+user]|-register-service|-version|-daemon|-start|"
-           "-run-exthandlers|-show-configuration|-collect-logs [-full]|-setup-firewall [-dst_ip=<IP> -uid=<UID> [-w/--wait]]"
+           "-run-exthandlers|-show-configuration|-collect-logs [-full]|-setup-firewall [-dst_ip=<IP> -uid=<UID> [-w/--wait]]|"
+           "-show-goal-state-history [-incarnation=<N>]"
            "").format(sys.argv[0])
     s += "\n"
     return s
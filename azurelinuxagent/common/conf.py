@@ -137,6 +137,21 @@ __SWITCH_OPTIONS__ = {
     "Debug.CgroupDisableOnProcessCheckFailure": True,
     "Debug.CgroupDisableOnQuotaCheckFailure": True,
     "Debug.EnableFastTrack": False,
+    "Debug.EnableHttpConnectionPool": False,
+    "Debug.EnableEventSpool": False,
+    "Debug.EnableTelemetryDeliveryLedger": False,
+    "Debug.EnableEventDirectoryWatcher": False,
+    "Debug.EnableStreamingXmlParser": False,
+    "Debug.EnableIncrementalExtensionProcessing": False,
+    "Debug.EnableGoalStateComponentCache": False,
+    "Debug.EnableInProcessCertificateParsing": False,
+    "Debug.EnableJitteredScheduling": False,
+    "Debug.EnableWarmStart": False,
+    "Debug.EnableVmSettingsExtensionProcessing": False,
+    "Debug.EnableGoalStateHistoryStore": False,
+    "Debug.EnableStreamingGoalStateCache": False,
+    "Debug.EnableDeltaPageBlobUpload": False,
+    "Debug.EnableExtensionStatusCache": False,
 }
 
 
@@ -182,6 +197,17 @@ __INTEGER_OPTIONS__ = {
     # versions of the Agent.
     #
     "Debug.CgroupCheckPeriod": 300,
+    "Debug.TelemetryQueueMaxEvents": 5000,
+    "Debug.TelemetryQueueMaxSizeKB": 8192,
+    "Debug.GoalStateHistoryMaxSizeKB": 10240,
+    "Debug.MaxConcurrentEventUploads": 1,
+    "Debug.MaxConcurrentExtensionOperations": 1,
+    "Debug.MinGoalStatePeriod": 2,
+    "Debug.MaxGoalStatePeriod": 0,
+    "Debug.MaxSchedulingJitter": 30,
+    "Debug.WireServerRequestRate": 0,
+    "Debug.WireServerRequestBurst": 10,
+    "Debug.StatusUploadRefreshPeriod": 0,
 }
 
 
@@ -539,3 +565,263 @@ def get_enable_fast_track(conf=__conf__):
     NOTE: This option is experimental and may be removed in later versions of the Agent.
     """
     return conf.get_switch("Debug.EnableFastTrack", False)
+
+
+def get_enable_http_connection_pool(conf=__conf__):
+    """
+    If True, the agent keeps HTTP connections alive and reuses them across requests to the same endpoint
+
+    NOTE: This option is experimental and may be removed in later versions of the Agent.
+    """
+    return conf.get_switch("Debug.EnableHttpConnectionPool", False)
+
+
+def get_enable_event_spool(conf=__conf__):
+    """
+    If True, the agent appends its events to size-rotated segment files in the events directory instead of
+    creating one file per event
+
+    NOTE: This option is experimental and may be removed in later versions of the Agent.
+    """
+    return conf.get_switch("Debug.EnableEventSpool", False)
+
+
+def get_enable_telemetry_delivery_ledger(conf=__conf__):
+    """
+    If True, the agent deletes event files only after the events in them have been sent to the WireServer, and
+    retries the files that could not be sent
+
+    NOTE: This option is experimental and may be removed in later versions of the Agent.
+    """
+    return conf.get_switch("Debug.EnableTelemetryDeliveryLedger", False)
+
+
+def get_telemetry_queue_max_events(conf=__conf__):
+    """
+    The maximum number of events waiting to be sent to the WireServer
+
+    NOTE: This option is experimental and may be removed in later versions of the Agent.
+    """
+    return conf.get_int("Debug.TelemetryQueueMaxEvents", 5000)
+
+
+def get_telemetry_queue_max_size_kb(conf=__conf__):
+    """
+    The maximum (approximate) size, in KB, of the events waiting to be sent to the WireServer
+
+    NOTE: This option is experimental and may be removed in later versions of the Agent.
+    """
+    return conf.get_int("Debug.TelemetryQueueMaxSizeKB", 8192)
+
+
+def get_enable_streaming_xml_parser(conf=__conf__):
+    """
+    If True, the agent parses the ExtensionsConfig, the extension manifests and the WireServer version info using
+    ElementTree.iterparse instead of minidom
+
+    NOTE: This option is experimental and may be removed in later versions of the Agent.
+    """
+    return conf.get_switch("Debug.EnableStreamingXmlParser", False)
+
+
+def get_enable_incremental_extension_processing(conf=__conf__):
+    """
+    If True, the handlers that did not change since the last goal state (and were processed successfully then) are
+    not processed again when a new goal state is received
+
+    NOTE: This option is experimental and may be removed in later versions of the Agent.
+    """
+    return conf.get_switch("Debug.EnableIncrementalExtensionProcessing", False)
+
+
+def get_enable_goal_state_component_cache(conf=__conf__):
+    """
+    If True, the HostingEnvironmentConfig, SharedConfig and Certificates of the previous goal state are reused when
+    their content did not change (the Certificates are not decrypted again)
+
+    NOTE: This option is experimental and may be removed in later versions of the Agent.
+    """
+    return conf.get_switch("Debug.EnableGoalStateComponentCache", False)
+
+
+def get_enable_in_process_certificate_parsing(conf=__conf__):
+    """
+    If True, the thumbprints of the goal state certificates and the public keys used to match them to their private
+    keys are computed in-process instead of invoking openssl for each certificate
+
+    NOTE: This option is experimental and may be removed in later versions of the Agent.
+    """
+    return conf.get_switch("Debug.EnableInProcessCertificateParsing", False)
+
+
+def get_min_goal_state_period(conf=__conf__):
+    """
+    The period (in seconds) used to poll the goal state while it is changing when Debug.MaxGoalStatePeriod is set.
+    It is never greater than Extensions.GoalStatePeriod.
+
+    NOTE: This option is experimental and may be removed in later versions of the Agent.
+    """
+    return conf.get_int("Debug.MinGoalStatePeriod", 2)
+
+
+def get_max_goal_state_period(conf=__conf__):
+    """
+    If greater than Extensions.GoalStatePeriod, the agent backs off up to this period (in seconds) when the goal state
+    and the status of the extensions do not change, and polls every Debug.MinGoalStatePeriod seconds after a change.
+
+    NOTE: This option is experimental and may be removed in later versions of the Agent.
+    """
+    return conf.get_int("Debug.MaxGoalStatePeriod", 0)
+
+
+def get_enable_jittered_scheduling(conf=__conf__):
+    """
+    If True, the first run of the periodic operations is delayed by an offset derived from the Container ID and
+    subsequent runs (and the iterations of the main loop) are delayed by a random jitter, both bounded by
+    Debug.MaxSchedulingJitter, so that the agents of VMs restarted together do not contact the WireServer in lockstep
+
+    NOTE: This option is experimental and may be removed in later versions of the Agent.
+    """
+    return conf.get_switch("Debug.EnableJitteredScheduling", False)
+
+
+def get_max_scheduling_jitter(conf=__conf__):
+    """
+    The maximum offset/jitter (in seconds) used when Debug.EnableJitteredScheduling is set; the jitter of each run
+    is also limited to a tenth of the period of the operation.
+
+    NOTE: This option is experimental and may be removed in later versions of the Agent.
+    """
+    return conf.get_int("Debug.MaxSchedulingJitter", 30)
+
+
+def get_wireserver_request_rate(conf=__conf__):
+    """
+    The maximum sustained number of requests per second to the WireServer and the HostGAPlugin; requests over this
+    rate are delayed. 0 means no limit.
+
+    NOTE: This option is experimental and may be removed in later versions of the Agent.
+    """
+    return conf.get_int("Debug.WireServerRequestRate", 0)
+
+
+def get_wireserver_request_burst(conf=__conf__):
+    """
+    The number of requests to the WireServer and the HostGAPlugin that can be issued in a burst when
+    Debug.WireServerRequestRate is set
+
+    NOTE: This option is experimental and may be removed in later versions of the Agent.
+    """
+    return conf.get_int("Debug.WireServerRequestBurst", 10)
+
+
+def get_enable_warm_start(conf=__conf__):
+    """
+    If True, the agent saves a snapshot of the last status it reported and, when it starts, reports that status
+    before fetching the goal state
+
+    NOTE: This option is experimental and may be removed in later versions of the Agent.
+    """
+    return conf.get_switch("Debug.EnableWarmStart", False)
+
+
+def get_enable_vm_settings_extension_processing(conf=__conf__):
+    """
+    If True (and Debug.EnableFastTrack is also True), the extensions are processed from the vmSettings fetched from the
+    HostGAPlugin whenever their ETag changes; the ExtensionsConfig is used if the vmSettings are not available.
+
+    NOTE: This option is experimental and may be removed in later versions of the Agent.
+    """
+    return conf.get_switch("Debug.EnableVmSettingsExtensionProcessing", False)
+
+
+def get_enable_goal_state_history_store(conf=__conf__):
+    """
+    If True, the goal state history is appended to a compressed container per day (with an index) instead of being
+    saved to a directory per goal state, and the history is compacted in a background thread
+
+    NOTE: This option is experimental and may be removed in later versions of the Agent.
+    """
+    return conf.get_switch("Debug.EnableGoalStateHistoryStore", False)
+
+
+def get_goal_state_history_max_size_kb(conf=__conf__):
+    """
+    Maximum size (in KB) of the goal state history when Debug.EnableGoalStateHistoryStore is set; the oldest days of
+    history are deleted when it is exceeded
+
+    NOTE: This option is experimental and may be removed in later versions of the Agent.
+    """
+    return conf.get_int("Debug.GoalStateHistoryMaxSizeKB", 10240)
+
+
+def get_enable_streaming_goal_state_cache(conf=__conf__):
+    """
+    If True, the goal state documents are redacted and written to the cache in bounded chunks, and the cache files are
+    replaced only when their content changes
+
+    NOTE: This option is experimental and may be removed in later versions of the Agent.
+    """
+    return conf.get_switch("Debug.EnableStreamingGoalStateCache", False)
+
+
+def get_enable_delta_page_blob_upload(conf=__conf__):
+    """
+    If True, the direct upload of a page blob status uploads only the pages that changed since the previous upload,
+    and the blob is created again only when its size (rounded up to 4 KB) changes
+
+    NOTE: This option is experimental and may be removed in later versions of the Agent.
+    """
+    return conf.get_switch("Debug.EnableDeltaPageBlobUpload", False)
+
+
+def get_enable_extension_status_cache(conf=__conf__):
+    """
+    If True, the status files of the extensions are read and parsed only when their modification time, size or inode
+    change, and status files that are too big are rejected without reading them. The config directories of the
+    extensions are listed only when their modification time changes.
+
+    NOTE: This option is experimental and may be removed in later versions of the Agent.
+    """
+    return conf.get_switch("Debug.EnableExtensionStatusCache", False)
+
+
+def get_status_upload_refresh_period(conf=__conf__):
+    """
+    If greater than 0, the status is uploaded only when its content changes (timestamps aside), or when this number
+    of seconds has elapsed since the last upload; if 0, the status is uploaded on every iteration of the main loop
+
+    NOTE: This option is experimental and may be removed in later versions of the Agent.
+    """
+    return conf.get_int("Debug.StatusUploadRefreshPeriod", 0)
+
+
+def get_max_concurrent_event_uploads(conf=__conf__):
+    """
+    The maximum number of requests sending telemetry events to the WireServer that can be in flight at the same time.
+    When greater than 1, the events of different providers are sent concurrently.
+
+    NOTE: This option is experimental and may be removed in later versions of the Agent.
+    """
+    return conf.get_int("Debug.MaxConcurrentEventUploads", 1)
+
+
+def get_max_concurrent_extension_operations(conf=__conf__):
+    """
+    The maximum number of extensions that can be processed at the same time. When greater than 1, the extensions with
+    the same dependency level are processed concurrently, and the agent waits for all of them to complete before
+    processing the next dependency level.
+
+    NOTE: This option is experimental and may be removed in later versions of the Agent.
+    """
+    return conf.get_int("Debug.MaxConcurrentExtensionOperations", 1)
+
+
+def get_enable_event_directory_watcher(conf=__conf__):
+    """
+    If True, the agent uses inotify to collect events as soon as they are written to the event directories, instead of
+    polling the directories periodically (the agent falls back to polling if inotify is not available)
+
+    NOTE: This option is experimental and may be removed in later versions of the Agent.
+    """
+    return conf.get_switch("Debug.EnableEventDirectoryWatcher", False)
@@ -28,7 +28,9 @@ Base class for data contracts between guest and host and utilities to manipulate
 
 
 class DataContract(object):
-    pass
+    # Derived classes can define __slots__ to avoid the per-instance __dict__ (those that do not define them still get
+    # a __dict__)
+    __slots__ = ()
 
 
 class DataContractList(list):
@@ -68,11 +70,21 @@ def set_properties(name, obj, data):
         return data
 
 
+def _get_slots(cls):
+    slots = []
+    for base in cls.__mro__:
+        slots.extend(getattr(base, "__slots__", ()))
+    return slots
+
+
 def get_properties(obj):
     if isinstance(obj, DataContract):
         data = {}
-        props = vars(obj)
-        for prob_name, prob in list(props.items()):
+        if hasattr(obj, "__dict__"):
+            props = list(vars(obj).items())
+        else:
+            props = [(name, getattr(obj, name)) for name in _get_slots(type(obj)) if hasattr(obj, name)]
+        for prob_name, prob in props:
             data[prob_name] = get_properties(prob)
         return data
     elif isinstance(obj, DataContractList):
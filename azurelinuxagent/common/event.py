@@ -32,9 +32,11 @@ from azurelinuxagent.common.AgentGlobals import AgentGlobals
 from azurelinuxagent.common.exception import EventError, OSUtilError
 from azurelinuxagent.common.future import ustr
 from azurelinuxagent.common.datacontract import get_properties, set_properties
+from azurelinuxagent.common.event_spool import EventSpool
 from azurelinuxagent.common.osutil import get_osutil
 from azurelinuxagent.common.telemetryevent import TelemetryEventParam, TelemetryEvent, CommonTelemetryEventSchema, \
-    GuestAgentGenericLogsSchema, GuestAgentExtensionEventsSchema, GuestAgentPerfCounterEventsSchema
+    GuestAgentGenericLogsSchema, GuestAgentExtensionEventsSchema, GuestAgentPerfCounterEventsSchema, \
+    TelemetryEventParamBlock
 from azurelinuxagent.common.utils import fileutil, textutil
 from azurelinuxagent.common.utils.textutil import parse_doc, findall, find, getattrib, str_to_encoded_ustr
 from azurelinuxagent.common.version import CURRENT_VERSION, CURRENT_AGENT, AGENT_NAME, DISTRO_NAME, DISTRO_VERSION, DISTRO_CODE_NAME, AGENT_EXECUTION_MODE
@@ -191,10 +193,48 @@ __event_status_operations__ = [
     ]
 
 
+_TELEMETRY_EVENT_PROPERTIES = frozenset(["eventId", "providerId", "parameters", "file_type"])
+_TELEMETRY_EVENT_PARAM_PROPERTIES = frozenset(["name", "value"])
+
+
+def _decode_telemetry_event(data):
+    """
+    Fast path for set_properties("TelemetryEvent", ...): builds the event directly from the decoded JSON, without the
+    reflection done by set_properties. Returns None if the data does not follow the TelemetryEvent schema (unknown
+    properties or unexpected types), in which case the caller falls back to set_properties, which handles (and
+    reports) those cases.
+    """
+    if not isinstance(data, dict):
+        return None
+    for key in data:
+        if key not in _TELEMETRY_EVENT_PROPERTIES:
+            return None
+
+    event = TelemetryEvent(data.get("eventId"), data.get("providerId"))
+    if "file_type" in data:
+        event.file_type = data["file_type"]
+
+    if "parameters" in data:
+        parameters = data["parameters"]
+        if not isinstance(parameters, list):
+            return None
+        for param_data in parameters:
+            if not isinstance(param_data, dict):
+                return None
+            for key in param_data:
+                if key not in _TELEMETRY_EVENT_PARAM_PROPERTIES:
+                    return None
+            event.parameters.append(TelemetryEventParam(param_data.get("name"), param_data.get("value")))
+
+    return event
+
+
 def parse_json_event(data_str):
     data = json.loads(data_str)
-    event = TelemetryEvent()
-    set_properties("TelemetryEvent", event, data)
+    event = _decode_telemetry_event(data)
+    if event is None:
+        event = TelemetryEvent()
+        set_properties("TelemetryEvent", event, data)
     event.file_type = "json"
     return event
 
@@ -287,7 +327,7 @@ class CollectOrReportEventDebugInfo(object):
     This class is used for capturing and reporting debug info that is captured during event collection and
     reporting to wireserver.
     It captures the count of unicode errors and any unexpected errors and also a subset of errors with stacks to help
-    with debugging any potential issues.
+    with debugging any potential issues, as well as the count of events dropped because the telemetry queue was full.
     """
     __MAX_ERRORS_TO_REPORT = 5
     OP_REPORT = "Report"
@@ -298,6 +338,8 @@ class CollectOrReportEventDebugInfo(object):
         self.__unicode_errors = set()
         self.__op_error_count = 0
         self.__op_errors = set()
+        self.__queue_overflow_count = 0
+        self.__queue_overflows = {}
 
         if operation == self.OP_REPORT:
             self.__unicode_error_event = WALAEventOperation.ReportEventUnicodeErrors
@@ -318,6 +360,13 @@ class CollectOrReportEventDebugInfo(object):
         report_dropped_events_error(self.__op_error_count, self.__op_errors, self.__op_errors_event)
         report_dropped_events_error(self.__unicode_error_count, self.__unicode_errors, self.__unicode_error_event)
 
+        if self.__queue_overflow_count > 0:
+            add_event(op=self.__op_errors_event,
+                      message="DroppedEventsCount: {0}\nReason: telemetry queue full; dropped events by priority: {1}".format(
+                          self.__queue_overflow_count,
+                          ', '.join(["{0}: {1}".format(k, v) for k, v in sorted(self.__queue_overflows.items())])),
+                      is_success=False)
+
     @staticmethod
     def _update_errors_and_get_count(error_count, errors, error):
         error_count += 1
@@ -332,11 +381,19 @@ class CollectOrReportEventDebugInfo(object):
     def update_op_error(self, op_err):
         self.__op_error_count = self._update_errors_and_get_count(self.__op_error_count, self.__op_errors, op_err)
 
+    def update_queue_overflow(self, priority, count):
+        self.__queue_overflow_count += count
+        self.__queue_overflows[priority] = self.__queue_overflows.get(priority, 0) + count
+
 
 class EventLogger(object):
     def __init__(self):
         self.event_dir = None
         self.periodic_events = {}
+        self._spool = None
+        self._spool_lock = threading.Lock()
+        self._event_file_lock = threading.Lock()
+        self._last_event_file_timestamp = 0
 
         #
         # All events should have these parameters.
@@ -378,6 +435,11 @@ class EventLogger(object):
         self._common_parameters.append(TelemetryEventParam(CommonTelemetryEventSchema.VMId, "VMId_UNINITIALIZED"))
         self._common_parameters.append(TelemetryEventParam(CommonTelemetryEventSchema.ImageOrigin, 0))
 
+        # The common parameters are the same for all the events, so the telemetry encoder can encode them only once
+        # (see get_common_parameter_blocks())
+        self._common_parameters_block = None
+        self._container_parameters_block = None
+
     @staticmethod
     def _get_os_version():
         return "{0}:{1}-{2}-{3}:{4}".format(platform.system(), DISTRO_NAME, DISTRO_VERSION, DISTRO_CODE_NAME, platform.release())
@@ -426,11 +488,41 @@ class EventLogger(object):
         except Exception as e:
             logger.warn("Failed to get IMDS info; will be missing from telemetry: {0}", ustr(e))
 
+        # the values of the common parameters changed; the block needs to be encoded again
+        self._common_parameters_block = None
+
+    def get_common_parameter_blocks(self):
+        """
+        Returns the parameters that add_common_event_parameters() adds, with the same values, to all the events as a
+        list of TelemetryEventParamBlock (the VM-wide parameters and the agent version/container ID).
+
+        The blocks are immutable; new blocks are created when the values of the parameters change (i.e. when the
+        container ID changes or when initialize_vminfo_common_parameters() is called).
+        """
+        common_parameters_block = self._common_parameters_block
+        if common_parameters_block is None:
+            common_parameters_block = TelemetryEventParamBlock(self._common_parameters)
+            self._common_parameters_block = common_parameters_block
+
+        container_id = AgentGlobals.get_container_id()
+        container_parameters_block = self._container_parameters_block
+        if container_parameters_block is None or container_parameters_block.params[1][1] != container_id:
+            container_parameters_block = TelemetryEventParamBlock([
+                TelemetryEventParam(CommonTelemetryEventSchema.GAVersion, CURRENT_AGENT),
+                TelemetryEventParam(CommonTelemetryEventSchema.ContainerId, container_id)])
+            self._container_parameters_block = container_parameters_block
+
+        return [container_parameters_block, common_parameters_block]
+
     def save_event(self, data):
         if self.event_dir is None:
             logger.warn("Cannot save event -- Event reporter is not initialized.")
             return
 
+        if conf.get_enable_event_spool():
+            self._save_event_to_spool(data)
+            return
+
         try:
             fileutil.mkdir(self.event_dir, mode=0o700)
         except (IOError, OSError) as e:
@@ -451,8 +543,7 @@ class EventLogger(object):
             msg = "Failed to remove old events from events folder {0}. Error: {1}".format(self.event_dir, ustr(e))
             raise EventError(msg)
 
-        filename = os.path.join(self.event_dir,
-                                ustr(int(time.time() * 1000000)))
+        filename = os.path.join(self.event_dir, ustr(self._get_event_file_timestamp()))
         try:
             with open(filename + ".tmp", 'wb+') as hfile:
                 hfile.write(data.encode("utf-8"))
@@ -461,6 +552,23 @@ class EventLogger(object):
             msg = "Failed to write events to file: {0}".format(e)
             raise EventError(msg)
 
+    def _get_event_file_timestamp(self):
+        # The timestamp is the name of the event file, so it must be unique even if several threads save events at the
+        # same time (e.g. while extensions are processed in parallel)
+        with self._event_file_lock:
+            timestamp = max(int(time.time() * 1000000), self._last_event_file_timestamp + 1)
+            self._last_event_file_timestamp = timestamp
+            return timestamp
+
+    def _save_event_to_spool(self, data):
+        with self._spool_lock:
+            if self._spool is None or self._spool.spool_dir != self.event_dir:
+                if self._spool is not None:
+                    self._spool.close()
+                self._spool = EventSpool(self.event_dir, MAX_NUMBER_OF_EVENTS)
+            spool = self._spool
+        spool.append(data)
+
     def reset_periodic(self):
         self.periodic_events = {}
 
@@ -0,0 +1,237 @@
+# Copyright 2020 Microsoft Corporation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# Requires Python 2.6+ and Openssl 1.0+
+#
+
+import errno
+import fcntl
+import os
+import re
+import struct
+import threading
+import time
+
+import azurelinuxagent.common.logger as logger
+from azurelinuxagent.common.exception import EventError
+from azurelinuxagent.common.future import ustr
+from azurelinuxagent.common.utils import fileutil
+
+#
+# Segment files are named <timestamp in microseconds>-<pid>.waagent.seg, with a suffix that indicates their state:
+#
+#     .active      -- the segment the process <pid> is currently appending to
+#     (no suffix)  -- a sealed segment (the writer reached the segment limits and moved on to a new segment)
+#     .collecting  -- a segment claimed by the collector
+#
+SEGMENT_FILE_EXTENSION = '.waagent.seg'
+ACTIVE_SEGMENT_SUFFIX = '.active'
+COLLECTING_SEGMENT_SUFFIX = '.collecting'
+SEGMENT_FILE_REGEX = re.compile(r'^\d+-\d+\.waagent\.seg(?P<state>\.active|\.collecting)?$')
+
+SEGMENT_MAX_EVENTS = 100
+SEGMENT_MAX_SIZE = 1024 * 1024  # 1 MB
+
+_RECORD_HEADER_FORMAT = ">I"
+_RECORD_HEADER_SIZE = struct.calcsize(_RECORD_HEADER_FORMAT)
+
+
+def is_segment_file(file_name):
+    return SEGMENT_FILE_REGEX.match(file_name) is not None
+
+
+class EventSpool(object):
+    """
+    Append-only spool for the events created by the agent.
+
+    Events are appended to a segment file owned by the current process as length-prefixed records (a 4-byte,
+    big-endian length followed by the UTF-8 encoded event). A segment is sealed once it holds SEGMENT_MAX_EVENTS
+    events or SEGMENT_MAX_SIZE bytes; only then the spool directory is listed to remove the oldest segments if the
+    spool holds more than max_events events.
+
+    The collector claims segments (sealed or active) by renaming them, waits for any in-progress append to complete
+    (writers lock the segment while appending) and then reads and deletes them. Writers detect that their active
+    segment was claimed because its path no longer refers to the file they have open, and start a new segment.
+    """
+    def __init__(self, spool_dir, max_events):
+        self.spool_dir = spool_dir
+        self._max_events = max_events
+        self._lock = threading.RLock()
+        self._segment = None
+        self._segment_path = None
+        self._segment_pid = None
+        self._segment_events = 0
+        self._segment_size = 0
+
+    def append(self, data):
+        record = data.encode("utf-8")
+        record = struct.pack(_RECORD_HEADER_FORMAT, len(record)) + record
+
+        with self._lock:
+            try:
+                while True:
+                    if self._segment is None or self._segment_pid != os.getpid():
+                        self._open_segment()
+
+                    fcntl.flock(self._segment.fileno(), fcntl.LOCK_EX)
+                    try:
+                        claimed = self._segment_was_claimed()
+                        if not claimed:
+                            self._segment.write(record)
+                            self._segment.flush()
+                    finally:
+                        fcntl.flock(self._segment.fileno(), fcntl.LOCK_UN)
+
+                    if claimed:
+                        self._close_segment()
+                        continue
+
+                    self._segment_events += 1
+                    self._segment_size += len(record)
+                    break
+
+                if self._segment_events >= SEGMENT_MAX_EVENTS or self._segment_size >= SEGMENT_MAX_SIZE:
+                    self._seal_segment()
+                    self._remove_oldest_segments()
+
+            except (IOError, OSError) as e:
+                self._close_segment()
+                raise EventError("Failed to write event to spool {0}: {1}".format(self.spool_dir, ustr(e)))
+
+    def close(self):
+        with self._lock:
+            self._close_segment()
+
+    def _open_segment(self):
+        self._close_segment()
+        fileutil.mkdir(self.spool_dir, mode=0o700)
+        self._segment_pid = os.getpid()
+        self._segment_path = os.path.join(self.spool_dir, "{0}-{1}{2}{3}".format(
+            int(time.time() * 1000000), self._segment_pid, SEGMENT_FILE_EXTENSION, ACTIVE_SEGMENT_SUFFIX))
+        self._segment = open(self._segment_path, "ab")
+        self._segment_events = 0
+        self._segment_size = 0
+
+    def _close_segment(self):
+        if self._segment is not None:
+            try:
+                # a segment inherited from the parent process belongs to the parent; just drop our reference to it
+                if self._segment_pid == os.getpid():
+                    self._segment.close()
+            except Exception as e:
+                logger.warn("Error closing event spool segment {0}: {1}", self._segment_path, ustr(e))
+        self._segment = None
+        self._segment_path = None
+
+    def _segment_was_claimed(self):
+        try:
+            return os.stat(self._segment_path).st_ino != os.fstat(self._segment.fileno()).st_ino
+        except OSError as e:
+            if e.errno == errno.ENOENT:
+                return True
+            raise
+
+    def _seal_segment(self):
+        try:
+            os.rename(self._segment_path, self._segment_path[:-len(ACTIVE_SEGMENT_SUFFIX)])
+        except OSError as e:
+            # the collector may have claimed the segment already
+            if e.errno != errno.ENOENT:
+                raise
+        self._close_segment()
+
+    def _remove_oldest_segments(self):
+        sealed_segments = sorted([f for f in os.listdir(self.spool_dir) if f.endswith(SEGMENT_FILE_EXTENSION) and is_segment_file(f)])
+        max_sealed_segments = max(1, self._max_events // SEGMENT_MAX_EVENTS - 1)
+        if len(sealed_segments) > max_sealed_segments:
+            logger.periodic_warn(logger.EVERY_MINUTE, "[PERIODIC] Too many event segments under: {0}, current count: {1}, "
+                                                      "removing oldest segments".format(self.spool_dir, len(sealed_segments)))
+            for segment in sealed_segments[:-max_sealed_segments]:
+                try:
+                    os.remove(os.path.join(self.spool_dir, segment))
+                except OSError as e:
+                    if e.errno != errno.ENOENT:
+                        raise
+
+    @staticmethod
+    def collect(spool_dir, file_names=None):
+        """
+        Claims the segments in the spool directory and yields the events in them (as UTF-8 encoded bytes), oldest
+        segment first.
+        Each segment is deleted after all its events have been yielded; if the caller stops iterating before that,
+        the segment is left in the spool and its events will be yielded again on the next call.
+
+        'file_names' can be used to pass the content of the spool directory, if the caller already listed it.
+        """
+        for segment_path in EventSpool.claim_segments(spool_dir, file_names):
+            for data in EventSpool.read_segment(segment_path):
+                yield data
+
+            os.remove(segment_path)
+
+    @staticmethod
+    def claim_segments(spool_dir, file_names=None):
+        """
+        Claims the segments in the spool directory and yields their paths, oldest segment first. Segments claimed by
+        a previous call that were not deleted are yielded again. The caller is responsible for deleting the segments.
+        """
+        if file_names is None:
+            file_names = os.listdir(spool_dir)
+
+        for file_name in sorted([f for f in file_names if is_segment_file(f)]):
+            file_path = os.path.join(spool_dir, file_name)
+
+            if file_name.endswith(COLLECTING_SEGMENT_SUFFIX):
+                collecting_path = file_path
+            else:
+                base_name = file_name[:-len(ACTIVE_SEGMENT_SUFFIX)] if file_name.endswith(ACTIVE_SEGMENT_SUFFIX) else file_name
+                collecting_path = os.path.join(spool_dir, base_name + COLLECTING_SEGMENT_SUFFIX)
+                try:
+                    os.rename(file_path, collecting_path)
+                except OSError as e:
+                    # the writer may have sealed the segment (it will be picked up on the next call) or a previous
+                    # iteration may have removed it
+                    if e.errno == errno.ENOENT:
+                        continue
+                    raise
+
+            yield collecting_path
+
+    @staticmethod
+    def read_segment(segment_path):
+        """
+        Returns the events in the given (claimed) segment, as a list of UTF-8 encoded bytes.
+        """
+        with open(segment_path, "rb") as segment:
+            # wait for any append that started before the segment was claimed
+            fcntl.flock(segment.fileno(), fcntl.LOCK_EX)
+            try:
+                content = segment.read()
+            finally:
+                fcntl.flock(segment.fileno(), fcntl.LOCK_UN)
+
+        records = []
+        offset = 0
+        while offset + _RECORD_HEADER_SIZE <= len(content):
+            length = struct.unpack(_RECORD_HEADER_FORMAT, content[offset:offset + _RECORD_HEADER_SIZE])[0]
+            offset += _RECORD_HEADER_SIZE
+            if offset + length > len(content):
+                break
+            records.append(content[offset:offset + length])
+            offset += length
+
+        if offset != len(content):
+            logger.warn("Event spool segment {0} has a truncated record at offset {1}; ignoring it", segment_path, offset)
+
+        return records
@@ -16,14 +16,155 @@
 #
 # Requires Python 2.6+ and Openssl 1.0+
 
+import json
 import re
 
+from azurelinuxagent.common.exception import ExtensionConfigError
+from azurelinuxagent.common.future import ustr
+from azurelinuxagent.common.protocol.restapi import Extension, ExtHandler, ExtHandlerList, ExtHandlerVersionUri, \
+    ExtensionState, InVMGoalStateMetaData, RequiredFeature
+from azurelinuxagent.common.utils.textutil import iter_redacted_text
+
+_PROTECTED_SETTINGS_PATTERN = re.compile(r'("protectedSettings"\s*:\s*)"[^"]+"')
+
 
 class ExtensionsGoalState(object):
     def __init__(self, etag, vm_settings):
         self.etag = etag
         self.vm_settings = vm_settings
+        # The members below are populated by parse()
+        self.ext_handlers = None
+        self.required_features = []
+        self.in_vm_gs_metadata = InVMGoalStateMetaData()
 
     def get_redacted_vm_settings(self):
-        return re.sub(r'("protectedSettings"\s*:\s*)"[^"]+"', r'\1"*** REDACTED ***"', self.vm_settings)
+        return _PROTECTED_SETTINGS_PATTERN.sub(r'\1"*** REDACTED ***"', self.vm_settings)
+
+    def iter_redacted_vm_settings(self):
+        """
+        Yields the vmSettings in chunks, with the protected settings replaced by "*** REDACTED ***"
+        """
+        return iter_redacted_text(self.vm_settings, _PROTECTED_SETTINGS_PATTERN, r'\1"*** REDACTED ***"')
+
+    def parse(self):
+        """
+        Parses the vmSettings into the same model the agent creates from the ExtensionsConfig (the ExtHandlers, the
+        required features and the InVMGoalStateMetaData). Sample vmSettings:
+
+            {
+                "activityId": "c86d8064-6f11-4145-8178-e0587e0584de",
+                "correlationId": "6609dcb1-fccc-474a-9a59-8bd71ba06983",
+                "extensionsLastModifiedTickCount": 637632862319659103,
+                "requiredFeatures": [ { "name": "MultipleExtensionsPerHandler" } ],
+                "extensionGoalStates": [
+                    {
+                        "name": "Microsoft.Azure.Extensions.CustomScript",
+                        "version": "2.1.3",
+                        "location": "https://.../Microsoft.Azure.Extensions_CustomScript_uscentraleuap_manifest.xml",
+                        "state": "enabled",
+                        "settingsSeqNo": 0,
+                        "settings": [ { "publicSettings": "{\"commandToExecute\":\"echo 'hello'\"}" } ]
+                    },
+                    ...
+                ]
+            }
+
+        The settings of multi-config handlers include the name, state and sequence number of each extension (the
+        "extensionName", "extensionState" and "seqNo" properties). Raises a ValueError if the vmSettings are not
+        valid JSON; errors in the settings of a specific handler are reported in the handler's invalid_setting_reason.
+        """
+        vm_settings = json.loads(self.vm_settings)
+
+        self.in_vm_gs_metadata = InVMGoalStateMetaData()
+        self.in_vm_gs_metadata.activity_id = vm_settings.get("activityId")
+        self.in_vm_gs_metadata.correlation_id = vm_settings.get("correlationId")
+        self.in_vm_gs_metadata.created_on_ticks = InVMGoalStateMetaData.ticks_to_datetime(vm_settings.get("extensionsLastModifiedTickCount"))
+
+        self.required_features = []
+        for feature in vm_settings.get("requiredFeatures") or []:
+            self.required_features.append(RequiredFeature(name=feature.get("name"), value=feature.get("value")))
+
+        ext_handlers = ExtHandlerList()
+        for extension_goal_state in vm_settings.get("extensionGoalStates") or []:
+            ext_handler = ExtHandler()
+            try:
+                ExtensionsGoalState._parse_extension_goal_state(ext_handler, extension_goal_state)
+            except ExtensionConfigError as error:
+                ext_handler.invalid_setting_reason = ustr(error)
+            ext_handlers.extHandlers.append(ext_handler)
+        self.ext_handlers = ext_handlers
+
+    @staticmethod
+    def _parse_extension_goal_state(ext_handler, extension_goal_state):
+        ext_handler.name = extension_goal_state.get("name")
+        ext_handler.properties.version = extension_goal_state.get("version")
+        if ext_handler.name in (None, "") or ext_handler.properties.version in (None, ""):
+            raise ExtensionConfigError("Received an extensionGoalState without name or version: {0}".format(ext_handler.name))
+
+        ext_handler.properties.state = extension_goal_state.get("state")
+        if ext_handler.properties.state in (None, ""):
+            raise ExtensionConfigError("Received empty extensionGoalStates.state, failing Handler")
+
+        locations = []
+        for name in ("location", "failoverLocation"):
+            location = extension_goal_state.get(name)
+            if location not in (None, ""):
+                locations.append(location)
+        locations.extend(extension_goal_state.get("additionalLocations") or [])
+        for uri in locations:
+            version_uri = ExtHandlerVersionUri()
+            version_uri.uri = uri
+            ext_handler.versionUris.append(version_uri)
+
+        settings = extension_goal_state.get("settings") or []
+        if len(settings) == 0:
+            return
+
+        # Multi-config handlers specify the extension name in each of the settings
+        if settings[0].get("extensionName") is not None:
+            ext_handler.supports_multi_config = True
+            for setting in settings:
+                name = setting.get("extensionName")
+                if name in (None, ""):
+                    raise ExtensionConfigError("Extension Name not specified in the settings for MultiConfig handler {0}".format(ext_handler.name))
+                state = setting.get("extensionState")
+                state = ustr(state.lower()) if state not in (None, "") else ExtensionState.Enabled
+                ExtensionsGoalState._add_extension(ext_handler, setting, name, setting.get("seqNo"), state,
+                                                   ExtensionsGoalState._get_dependency_level(setting))
+        else:
+            if len(settings) > 1:
+                raise ExtensionConfigError("Multiple settings found for the single-config handler {0} (Expected: 1; Available: {1})".format(ext_handler.name, len(settings)))
+            ExtensionsGoalState._add_extension(ext_handler, settings[0], ext_handler.name, extension_goal_state.get("settingsSeqNo"),
+                                               ExtensionState.Enabled, ExtensionsGoalState._get_dependency_level(extension_goal_state))
+
+    @staticmethod
+    def _get_dependency_level(node):
+        depends_on = node.get("dependsOn")
+        if not depends_on:
+            return 0
+        try:
+            return int(depends_on[0].get("dependencyLevel", 0))
+        except (ValueError, TypeError, AttributeError):
+            return 0
+
+    @staticmethod
+    def _add_extension(ext_handler, setting, name, seq_no, state, dependency_level):
+        if seq_no in (None, ""):
+            raise ExtensionConfigError("SeqNo not specified for the Extension: {0}".format(name))
+
+        # The public settings are a JSON document serialized as a string
+        public_settings = setting.get("publicSettings")
+        if public_settings in (None, ""):
+            public_settings = None
+        elif not isinstance(public_settings, dict):
+            try:
+                public_settings = json.loads(public_settings)
+            except ValueError as error:
+                raise ExtensionConfigError("Invalid public settings for the Extension {0}: {1}".format(name, ustr(error)))
+
+        extension = Extension(name=name, sequenceNumber=ustr(seq_no), state=state, dependencyLevel=dependency_level)
+        extension.publicSettings = public_settings
+        extension.protectedSettings = setting.get("protectedSettings")
+        extension.certificateThumbprint = setting.get("protectedSettingsCertThumbprint")
+        ext_handler.properties.extensions.append(extension)
 
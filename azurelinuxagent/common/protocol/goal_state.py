@@ -16,6 +16,7 @@
 #
 # Requires Python 2.6+ and Openssl 1.0+
 
+import hashlib
 import json
 import os
 import re
@@ -35,7 +36,8 @@ from azurelinuxagent.common.protocol.restapi import Cert, CertList, Extension, E
     VMAgentManifestUri, InVMGoalStateMetaData, RequiredFeature, ExtensionState
 from azurelinuxagent.common.utils import fileutil
 from azurelinuxagent.common.utils.cryptutil import CryptUtil
-from azurelinuxagent.common.utils.textutil import parse_doc, findall, find, findtext, getattrib, gettext
+from azurelinuxagent.common.utils.textutil import parse_doc, findall, find, findtext, getattrib, gettext, \
+    iterparse_doc, get_local_name, iter_redacted_text
 from azurelinuxagent.common.version import AGENT_NAME
 
 GOAL_STATE_URI = "http://{0}/machine/?comp=goalstate"
@@ -95,19 +97,33 @@ class GoalState(object):
             # We don't log the error here since fetching the goal state is done every few seconds
             raise ProtocolError(msg="Error fetching goal state", inner=exception)
 
-    def fetch_full_goal_state(self, wire_client):
+    def fetch_full_goal_state(self, wire_client, component_cache=None):
+        """
+        Fetches the inner properties of the goal state. If 'component_cache' is given, the HostingEnvironmentConfig,
+        SharedConfig and Certificates that did not change since the previous goal state are taken from the cache.
+        """
         try:
             logger.info('Fetching goal state [incarnation {0}]', self.incarnation)
 
-            xml_text = wire_client.fetch_config(self._hosting_env_uri, wire_client.get_header())
-            self.hosting_env = HostingEnv(xml_text)
+            if component_cache is None:
+                xml_text = wire_client.fetch_config(self._hosting_env_uri, wire_client.get_header())
+                self.hosting_env = HostingEnv(xml_text)
 
-            xml_text = wire_client.fetch_config(self._shared_conf_uri, wire_client.get_header())
-            self.shared_conf = SharedConfig(xml_text)
+                xml_text = wire_client.fetch_config(self._shared_conf_uri, wire_client.get_header())
+                self.shared_conf = SharedConfig(xml_text)
 
-            if self._certs_uri is not None:
-                xml_text = wire_client.fetch_config(self._certs_uri, wire_client.get_header_for_cert())
-                self.certs = Certificates(xml_text)
+                if self._certs_uri is not None:
+                    xml_text = wire_client.fetch_config(self._certs_uri, wire_client.get_header_for_cert())
+                    self.certs = Certificates(xml_text)
+            else:
+                self.hosting_env = component_cache.fetch(
+                    wire_client, "HostingEnvironmentConfig", self._hosting_env_uri, wire_client.get_header(), HostingEnv)
+                self.shared_conf = component_cache.fetch(
+                    wire_client, "SharedConfig", self._shared_conf_uri, wire_client.get_header(), SharedConfig)
+                if self._certs_uri is not None:
+                    self.certs = component_cache.fetch(
+                        wire_client, "Certificates", self._certs_uri, wire_client.get_header_for_cert(), Certificates,
+                        is_valid=Certificates.is_on_disk)
 
             if self._ext_conf_uri is None:
                 self.ext_conf = ExtensionsConfig(None)
@@ -125,6 +141,54 @@ class GoalState(object):
             logger.info('Fetch goal state completed')
 
 
+class _ComponentCacheEntry(object):
+    def __init__(self, uri, etag, digest, component):
+        self.uri = uri
+        self.etag = etag
+        self.digest = digest
+        self.component = component
+
+
+class GoalStateComponentCache(object):
+    """
+    Keeps the parsed components of the previous goal state (HostingEnv, SharedConfig, Certificates) together with the
+    URI, ETag and hash of their content. A component is parsed again only if its content changed; when the WireServer
+    supplied an ETag for the same URI the request is made conditional on it.
+    """
+    def __init__(self):
+        self._entries = {}
+
+    def fetch(self, wire_client, name, uri, headers, parse, is_valid=None):
+        """
+        Returns the component 'name' at the given 'uri', calling 'parse' on the fetched content only if the content
+        is different from the cached one. 'is_valid' is an optional function that checks that a cached component can
+        still be used (e.g. that its files are still on disk).
+        """
+        def can_reuse(cached):
+            return cached is not None and (is_valid is None or is_valid(cached.component))
+
+        entry = self._entries.get(name)
+        etag = entry.etag if can_reuse(entry) and entry.uri == uri else None
+
+        xml_text, response_etag = wire_client.fetch_config_if_modified(uri, headers, etag)
+        if xml_text is None:
+            logger.verbose("{0} was not modified [ETag: {1}]", name, etag)
+            return entry.component
+
+        digest = hashlib.sha256(xml_text.encode('utf-8')).hexdigest()
+        if can_reuse(entry) and entry.digest == digest:
+            logger.verbose("{0} did not change; reusing the cached copy", name)
+            component = entry.component
+        else:
+            component = parse(xml_text)
+
+        self._entries[name] = _ComponentCacheEntry(uri, response_etag, digest, component)
+        return component
+
+    def reset(self):
+        self._entries = {}
+
+
 class HostingEnv(object):
     def __init__(self, xml_text):
         self.xml_text = xml_text
@@ -143,6 +207,10 @@ class SharedConfig(object):
 
 
 class Certificates(object):
+    # Public keys of the certificates and private keys in the last goal state, indexed by the SHA-1 of their PEM text.
+    # Used only if Debug.EnableInProcessCertificateParsing is set.
+    _public_keys = {}
+
     def __init__(self, xml_text):
         self.cert_list = CertList()
 
@@ -179,6 +247,9 @@ class Certificates(object):
         # decrypt certificates
         cryptutil.decrypt_p7m(p7m_file, trans_prv_file, trans_cert_file, pem_file)
 
+        in_process = conf.get_enable_in_process_certificate_parsing()
+        public_keys = {}
+
         # The parsing process use public key to match prv and crt.
         buf = []
         begin_crt = False  # pylint: disable=W0612
@@ -196,15 +267,22 @@ class Certificates(object):
                     begin_crt = True
                 elif re.match(r'[-]+END.*KEY[-]+', line):
                     tmp_file = Certificates._write_to_tmp_file(index, 'prv', buf)
-                    pub = cryptutil.get_pubkey_from_prv(tmp_file)
+                    if in_process:
+                        pub = Certificates._get_public_key(cryptutil, buf, tmp_file, cryptutil.get_pubkey_from_prv, public_keys)
+                    else:
+                        pub = cryptutil.get_pubkey_from_prv(tmp_file)
                     prvs[pub] = tmp_file
                     buf = []
                     index += 1
                     begin_prv = False
                 elif re.match(r'[-]+END.*CERTIFICATE[-]+', line):
                     tmp_file = Certificates._write_to_tmp_file(index, 'crt', buf)
-                    pub = cryptutil.get_pubkey_from_crt(tmp_file)
-                    thumbprint = cryptutil.get_thumbprint_from_crt(tmp_file)
+                    if in_process:
+                        pub = Certificates._get_public_key(cryptutil, buf, tmp_file, cryptutil.get_pubkey_from_crt, public_keys)
+                        thumbprint = cryptutil.get_thumbprint_from_pem("".join(buf))
+                    else:
+                        pub = cryptutil.get_pubkey_from_crt(tmp_file)
+                        thumbprint = cryptutil.get_thumbprint_from_crt(tmp_file)
                     thumbprints[pub] = thumbprint
                     # Rename crt with thumbprint as the file name
                     crt = "{0}.crt".format(thumbprint)
@@ -242,6 +320,37 @@ class Certificates(object):
             set_properties("certs", cert, v1_cert)
             self.cert_list.certificates.append(cert)
 
+        if in_process:
+            Certificates._public_keys = public_keys
+
+    @staticmethod
+    def _get_public_key(cryptutil, buf, file_name, get_pubkey_from_file, public_keys):
+        """
+        Returns the public key of the certificate or private key in 'buf', computed in-process for RSA keys and with
+        openssl otherwise (using 'get_pubkey_from_file'). Keys seen in the previous goal state are not computed again.
+        """
+        pem = "".join(buf)
+        digest = hashlib.sha1(pem.encode('utf-8')).hexdigest()
+        pub = Certificates._public_keys.get(digest)
+        if pub is None:
+            pub = cryptutil.get_rsa_pubkey_from_pem(pem)
+            if pub is None:
+                pub = get_pubkey_from_file(file_name)
+        public_keys[digest] = pub
+        return pub
+
+    @staticmethod
+    def is_on_disk(certificates):
+        """
+        Returns True if the certificate files created when parsing 'certificates' still exist
+        """
+        if not os.path.isfile(os.path.join(conf.get_lib_dir(), CERTS_FILE_NAME)):
+            return False
+        for cert in certificates.cert_list.certificates:
+            if not os.path.isfile(os.path.join(conf.get_lib_dir(), "{0}.crt".format(cert.thumbprint))):
+                return False
+        return True
+
     @staticmethod
     def _write_to_tmp_file(index, suffix, buf):
         file_name = os.path.join(conf.get_lib_dir(), "{0}.{1}".format(index, suffix))
@@ -263,21 +372,21 @@ class ExtensionsConfig(object):
         if xml_text is None:
             return
 
-        xml_doc = parse_doc(self.xml_text)
+        if conf.get_enable_streaming_xml_parser():
+            self._parse_streaming(xml_text)
+        else:
+            self._parse(xml_text)
+
+        logger.verbose("Extension config shows status blob type as [{0}]", self.status_upload_blob_type)
+
+    def _parse(self, xml_text):
+        xml_doc = parse_doc(xml_text)
 
         ga_families_list = find(xml_doc, "GAFamilies")
         ga_families = findall(ga_families_list, "GAFamily")
 
         for ga_family in ga_families:
-            family = findtext(ga_family, "Name")
-            uris_list = find(ga_family, "Uris")
-            uris = findall(uris_list, "Uri")
-            manifest = VMAgentManifest()
-            manifest.family = family
-            for uri in uris:
-                manifest_uri = VMAgentManifestUri(uri=gettext(uri))
-                manifest.versionsManifestUris.append(manifest_uri)
-            self.vmagent_manifests.vmAgentManifests.append(manifest)
+            self._parse_ga_family(ga_family)
 
         self.__parse_plugins_and_settings_and_populate_ext_handlers(xml_doc)
 
@@ -290,10 +399,74 @@ class ExtensionsConfig(object):
 
         status_upload_node = find(xml_doc, "StatusUploadBlob")
         self.status_upload_blob_type = getattrib(status_upload_node, "statusBlobType")
-        logger.verbose("Extension config shows status blob type as [{0}]", self.status_upload_blob_type)
 
         self.in_vm_gs_metadata.parse_node(find(xml_doc, "InVMGoalStateMetaData"))
 
+    def _parse_streaming(self, xml_text):
+        """
+        Produces the same ExtHandler/Extension model as _parse(), but in a single pass over the document using
+        ElementTree.iterparse instead of minidom (which builds a much larger in-memory tree and requires a tree walk
+        for each lookup). GAFamilies and Plugins are parsed (and discarded) as soon as their elements end; the
+        PluginSettings are indexed by handler name, so each handler looks up its settings directly.
+        """
+        # The first element with each tag (the minidom implementation uses find() on the document, which returns
+        # the first matching element)
+        first = {}
+        plugins = []
+        plugin_settings = defaultdict(list)
+
+        def is_in_first(ancestors, tag):
+            node = first.get(tag)
+            return node is not None and any(a is node for a in ancestors)
+
+        for event, element, ancestors in iterparse_doc(xml_text):
+            tag = get_local_name(element)
+            if event == "start":
+                if tag not in first:
+                    first[tag] = element
+                continue
+
+            if tag == "GAFamily" and is_in_first(ancestors, "GAFamilies"):
+                self._parse_ga_family(element)
+                element.clear()
+            elif tag == "Plugin" and is_in_first(ancestors, "Plugins"):
+                plugins.append(ExtensionsConfig.__parse_plugin_and_create_ext_handler(element))
+                element.clear()
+            elif tag == "Plugin" and is_in_first(ancestors, "PluginSettings"):
+                plugin_settings[getattrib(element, "name").lower()].append(element)
+
+        for ext_handler, error in plugins:
+            if error is None:
+                try:
+                    ExtensionsConfig._parse_plugin_settings(ext_handler, plugin_settings.get(ext_handler.name.lower(), []))
+                except ExtensionConfigError as e:
+                    error = e
+            if error is not None:
+                ext_handler.invalid_setting_reason = ustr(error)
+            self.ext_handlers.extHandlers.append(ext_handler)
+
+        required_features_list = first.get("RequiredFeatures")
+        if required_features_list is not None:
+            self._parse_required_features(required_features_list)
+
+        status_upload_node = first.get("StatusUploadBlob")
+        self.status_upload_blob = gettext(status_upload_node)
+        self.status_upload_blob_type = getattrib(status_upload_node, "statusBlobType")
+        self.artifacts_profile_blob = gettext(first.get("InVMArtifactsProfileBlob"))
+
+        self.in_vm_gs_metadata.parse_node(first.get("InVMGoalStateMetaData"))
+
+    def _parse_ga_family(self, ga_family):
+        family = findtext(ga_family, "Name")
+        uris_list = find(ga_family, "Uris")
+        uris = findall(uris_list, "Uri")
+        manifest = VMAgentManifest()
+        manifest.family = family
+        for uri in uris:
+            manifest_uri = VMAgentManifestUri(uri=gettext(uri))
+            manifest.versionsManifestUris.append(manifest_uri)
+        self.vmagent_manifests.vmAgentManifests.append(manifest)
+
     def _parse_required_features(self, required_features_list):
         for required_feature in findall(required_features_list, "RequiredFeature"):
             feature_name = findtext(required_feature, "Name")
@@ -310,6 +483,27 @@ class ExtensionsConfig(object):
                     xml_text = xml_text.replace(extension.protectedSettings, "*** REDACTED ***")
         return xml_text
 
+    def iter_redacted_xml_text(self):
+        """
+        Yields the XML text in chunks, with the protected settings replaced by "*** REDACTED ***", in a single pass
+        over the text
+        """
+        if self.xml_text is None:
+            yield "<None/>"
+            return
+        protected_settings = set()
+        for ext_handler in self.ext_handlers.extHandlers:
+            for extension in ext_handler.properties.extensions:
+                if extension.protectedSettings not in (None, ""):
+                    protected_settings.add(extension.protectedSettings)
+        if len(protected_settings) == 0:
+            yield self.xml_text
+            return
+        # longest first, so that a setting that contains another one is redacted in full
+        pattern = re.compile("|".join([re.escape(s) for s in sorted(protected_settings, key=len, reverse=True)]))
+        for chunk in iter_redacted_text(self.xml_text, pattern, "*** REDACTED ***"):
+            yield chunk
+
     def __parse_plugins_and_settings_and_populate_ext_handlers(self, xml_doc):
         """
         Sample ExtensionConfig Plugin and PluginSettings:
@@ -364,6 +558,18 @@ class ExtensionsConfig(object):
 
             self.ext_handlers.extHandlers.append(ext_handler)
 
+    @staticmethod
+    def __parse_plugin_and_create_ext_handler(plugin):
+        """
+        Returns a tuple with the ExtHandler for the given Plugin and the error (if any) found while parsing it
+        """
+        ext_handler = ExtHandler()
+        try:
+            ExtensionsConfig._parse_plugin(ext_handler, plugin)
+        except ExtensionConfigError as error:
+            return ext_handler, error
+        return ext_handler, None
+
     @staticmethod
     def _parse_plugin(ext_handler, plugin):
         """
@@ -487,7 +693,7 @@ class ExtensionsConfig(object):
         runtime_settings_nodes = findall(plugin_settings_node, "RuntimeSettings")
         extension_runtime_settings_nodes = findall(plugin_settings_node, "ExtensionRuntimeSettings")
 
-        if any(runtime_settings_nodes) and any(extension_runtime_settings_nodes):
+        if len(runtime_settings_nodes) > 0 and len(extension_runtime_settings_nodes) > 0:
             # There can only be a single RuntimeSettings node or multiple ExtensionRuntimeSettings nodes per Plugin
             msg = "Both RuntimeSettings and ExtensionRuntimeSettings found for the same handler: {0} and version: {1}".format(
                 handler_name, version)
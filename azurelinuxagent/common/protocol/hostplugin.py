@@ -257,7 +257,7 @@ class HostPluginProtocol(object):
         if not self.ensure_initialized():
             raise ProtocolError("HostGAPlugin: HostGAPlugin is not available")
 
-        if status_blob is None or status_blob.vm_status is None:
+        if status_blob is None or (status_blob.vm_status is None and status_blob.data is None):
             raise ProtocolError("HostGAPlugin: Status blob was not provided")
 
         logger.verbose("HostGAPlugin: Posting VM status")
@@ -291,6 +291,9 @@ class HostPluginProtocol(object):
     def _put_page_blob_status(self, sas_url, status_blob):
         url = URI_FORMAT_PUT_VM_STATUS.format(self.endpoint, HOST_PLUGIN_PORT)
 
+        # the blob is rewritten here, so the next direct upload cannot be a delta of the content it uploaded last
+        status_blob.discard_page_image(sas_url)
+
         # Convert the status into a blank-padded string whose length is modulo 512
         status = bytearray(status_blob.data, encoding='utf-8')
         status_size = int((len(status) + 511) / 512) * 512
@@ -203,22 +203,22 @@ class InVMGoalStateMetaData(DataContract):
         self.activity_id = None
         self.correlation_id = None
 
-    def parse_node(self, in_vm_metadata_node):
-
-        def __ticks_to_datetime(ticks):
-            if ticks in (None, ""):
-                return None
-            try:
-                # C# ticks is a number of ticks since midnight 0001-01-01 00:00:00 (every tick is 1/10000000 of second)
-                # and UNIX timestamp is number of seconds since beginning of the UNIX epoch (1970-01-01 01:00:00).
-                # This function converts the ticks to datetime object that Python recognises.
-                return datetime.min + timedelta(seconds=float(ticks) / 10 ** 7)
-            except Exception:
-                return None
+    @staticmethod
+    def ticks_to_datetime(ticks):
+        if ticks in (None, ""):
+            return None
+        try:
+            # C# ticks is a number of ticks since midnight 0001-01-01 00:00:00 (every tick is 1/10000000 of second)
+            # and UNIX timestamp is number of seconds since beginning of the UNIX epoch (1970-01-01 01:00:00).
+            # This function converts the ticks to datetime object that Python recognises.
+            return datetime.min + timedelta(seconds=float(ticks) / 10 ** 7)
+        except Exception:
+            return None
 
+    def parse_node(self, in_vm_metadata_node):
         self.correlation_id = getattrib(in_vm_metadata_node, "correlationId")
         self.activity_id = getattrib(in_vm_metadata_node, "activityId")
-        self.created_on_ticks = __ticks_to_datetime(getattrib(in_vm_metadata_node, "createdOnTicks"))
+        self.created_on_ticks = InVMGoalStateMetaData.ticks_to_datetime(getattrib(in_vm_metadata_node, "createdOnTicks"))
         self.in_svd_seq_no = getattrib(in_vm_metadata_node, "inSvdSeqNo")
 
 
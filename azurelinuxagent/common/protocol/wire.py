@@ -16,13 +16,14 @@
 #
 # Requires Python 2.6+ and Openssl 1.0+
 
+import hashlib
 import json
 import os
 import random
+import threading
 import time
 import uuid
 import xml.sax.saxutils as saxutils
-from collections import defaultdict
 from datetime import datetime, timedelta
 
 import azurelinuxagent.common.conf as conf
@@ -31,21 +32,22 @@ import azurelinuxagent.common.utils.textutil as textutil
 from azurelinuxagent.common.agent_supported_feature import get_agent_supported_features_list_for_crp
 from azurelinuxagent.common.datacontract import validate_param
 from azurelinuxagent.common.event import add_event, WALAEventOperation, report_event, \
-    CollectOrReportEventDebugInfo, add_periodic
+    CollectOrReportEventDebugInfo, add_periodic, get_event_logger
 from azurelinuxagent.common.exception import ProtocolNotFoundError, \
     ResourceGoneError, ExtensionDownloadError, InvalidContainerError, ProtocolError, HttpError
-from azurelinuxagent.common.future import httpclient, bytebuffer, ustr
+from azurelinuxagent.common.future import httpclient, bytebuffer, ustr, Queue
 from azurelinuxagent.common.protocol.extensions_goal_state import ExtensionsGoalState
-from azurelinuxagent.common.protocol.goal_state import GoalState, TRANSPORT_CERT_FILE_NAME, TRANSPORT_PRV_FILE_NAME
+from azurelinuxagent.common.protocol.goal_state import GoalState, GoalStateComponentCache, TRANSPORT_CERT_FILE_NAME, \
+    TRANSPORT_PRV_FILE_NAME
 from azurelinuxagent.common.protocol.hostplugin import HostPluginProtocol
 from azurelinuxagent.common.protocol.restapi import DataContract, ExtHandlerPackage, \
     ExtHandlerPackageList, ExtHandlerVersionUri, ProvisionStatus, VMInfo, VMStatus
 from azurelinuxagent.common.telemetryevent import GuestAgentExtensionEventsSchema
 from azurelinuxagent.common.utils import fileutil, restutil
-from azurelinuxagent.common.utils.archive import StateFlusher
+from azurelinuxagent.common.utils.archive import StateFlusher, GoalStateHistoryStore
 from azurelinuxagent.common.utils.cryptutil import CryptUtil
 from azurelinuxagent.common.utils.textutil import parse_doc, findall, find, \
-    findtext, gettext, remove_bom, get_bytes_from_pem, parse_json
+    findtext, gettext, remove_bom, get_bytes_from_pem, parse_json, iterparse_doc, get_local_name
 from azurelinuxagent.common.version import AGENT_NAME, CURRENT_VERSION
 
 VERSION_INFO_URI = "http://{0}/?comp=versions"
@@ -62,6 +64,10 @@ SHARED_CONF_FILE_NAME = "SharedConfig.xml"
 REMOTE_ACCESS_FILE_NAME = "RemoteAccess.{0}.xml"
 EXT_CONF_FILE_NAME = "ExtensionsConfig.{0}.xml"
 MANIFEST_FILE_NAME = "{0}.{1}.manifest.xml"
+WARM_START_FILE_NAME = "WarmStart.json"
+
+# snapshots older than this are not used to report status on startup
+WARM_START_SNAPSHOT_MAX_AGE_IN_SECONDS = 60 * 60
 
 PROTOCOL_VERSION = "2012-11-30"
 ENDPOINT_FINE_NAME = "WireServer"
@@ -127,9 +133,15 @@ class WireProtocol(DataContract):
         return self.client.get_etag()
 
     def get_in_vm_gs_metadata(self):
+        extensions_goal_state = self.client.get_vm_settings_extensions_goal_state()
+        if extensions_goal_state is not None:
+            return extensions_goal_state.in_vm_gs_metadata
         return self.client.get_ext_conf().in_vm_gs_metadata
 
     def get_required_features(self):
+        extensions_goal_state = self.client.get_vm_settings_extensions_goal_state()
+        if extensions_goal_state is not None:
+            return extensions_goal_state.required_features
         return self.client.get_ext_conf().required_features
 
     def get_vmagent_manifests(self):
@@ -146,6 +158,11 @@ class WireProtocol(DataContract):
     def get_ext_handlers(self):
         logger.verbose("Get extension handler config")
         goal_state = self.client.get_goal_state()
+        # The status of the extensions is still reported against the incarnation of the goal state, so that is what
+        # we return as ETag even when the handlers come from the vmSettings
+        extensions_goal_state = self.client.get_vm_settings_extensions_goal_state()
+        if extensions_goal_state is not None:
+            return extensions_goal_state.ext_handlers, goal_state.incarnation
         ext_conf = self.client.get_ext_conf()
         # In wire protocol, incarnation is equivalent to ETag
         return ext_conf.ext_handlers, goal_state.incarnation
@@ -194,8 +211,8 @@ class WireProtocol(DataContract):
         self.client.status_blob.set_vm_status(vm_status)
         self.client.upload_status_blob()
 
-    def report_event(self, events_iterator):
-        self.client.report_event(events_iterator)
+    def report_event(self, events_iterator, event_acknowledger=None):
+        self.client.report_event(events_iterator, event_acknowledger=event_acknowledger)
 
     def upload_logs(self, logs):
         self.client.upload_logs(logs)
@@ -203,6 +220,13 @@ class WireProtocol(DataContract):
     def get_status_blob_data(self):
         return self.client.status_blob.data
 
+    def get_status_report(self):
+        """
+        Returns the last status that was prepared for upload, in the format of the status blob (a dictionary that must
+        not be modified), or None if no status has been prepared yet
+        """
+        return self.client.status_blob.report
+
 
 def _build_role_properties(container_id, role_instance_id, thumbprint):
     xml = (u"<?xml version=\"1.0\" encoding=\"utf-8\"?>"
@@ -324,10 +348,11 @@ def ext_substatus_to_v1(sub_status_list):
     return status_list
 
 
-def ext_status_to_v1(ext_status):
+def ext_status_to_v1(ext_status, timestamp=None):
     if ext_status is None:
         return None
-    timestamp = _get_utc_timestamp_for_status_reporting()
+    if timestamp is None:
+        timestamp = _get_utc_timestamp_for_status_reporting()
     v1_sub_status = ext_substatus_to_v1(ext_status.substatusList)
     v1_ext_status = {
         "status": {
@@ -346,7 +371,7 @@ def ext_status_to_v1(ext_status):
     return v1_ext_status
 
 
-def ext_handler_status_to_v1(ext_handler_status):
+def ext_handler_status_to_v1(ext_handler_status, timestamp=None):
     v1_handler_status = {
         'handlerVersion': ext_handler_status.version,
         'handlerName': ext_handler_status.name,
@@ -357,7 +382,7 @@ def ext_handler_status_to_v1(ext_handler_status):
     if ext_handler_status.message is not None:
         v1_handler_status["formattedMessage"] = __get_formatted_msg_for_status_reporting(ext_handler_status.message)
 
-    v1_ext_status = ext_status_to_v1(ext_handler_status.extension_status)
+    v1_ext_status = ext_status_to_v1(ext_handler_status.extension_status, timestamp=timestamp)
     if ext_handler_status.extension_status is not None and v1_ext_status is not None:
         v1_handler_status["runtimeSettingsStatus"] = {
             'settingsStatus': v1_ext_status,
@@ -390,8 +415,13 @@ def vm_artifacts_aggregate_status_to_v1(vm_artifacts_aggregate_status):
     return v1_artifact_aggregate_status
 
 
-def vm_status_to_v1(vm_status):
-    timestamp = _get_utc_timestamp_for_status_reporting()
+def vm_status_to_v1(vm_status, timestamp=None):
+    """
+    Converts the VMStatus to the format of the status blob; all the timestamps in the status are set to 'timestamp'
+    (the current time if it is None)
+    """
+    if timestamp is None:
+        timestamp = _get_utc_timestamp_for_status_reporting()
 
     v1_ga_guest_info = ga_status_to_guest_info(vm_status.vmAgent)
     v1_ga_status = ga_status_to_v1(vm_status.vmAgent)
@@ -399,7 +429,7 @@ def vm_status_to_v1(vm_status):
         vm_status.vmAgent.vm_artifacts_aggregate_status)
     v1_handler_status_list = []
     for handler_status in vm_status.vmAgent.extensionHandlers:
-        v1_handler_status_list.append(ext_handler_status_to_v1(handler_status))
+        v1_handler_status_list.append(ext_handler_status_to_v1(handler_status, timestamp=timestamp))
 
     v1_agg_status = {
         'guestAgentStatus': v1_ga_status,
@@ -431,11 +461,18 @@ def vm_status_to_v1(vm_status):
 
 
 class StatusBlob(object):
+    _PAGE_SIZE = 512
+    _PAGE_BLOB_SIZE_CLASS = 4096  # with delta uploads, page blobs are created with a size that is a multiple of this value
+
     def __init__(self, client):
         self.vm_status = None
         self.client = client
         self.type = None
         self.data = None
+        self.report = None  # the status in the format of the status blob (a dictionary), before it is serialized to 'data'
+        self.digest = None
+        self._timestamp = None  # the time of the report prepared by prepare()
+        self._page_images = {}  # url -> content of the page blob after the last successful delta upload
 
     def set_vm_status(self, vm_status):
         validate_param("vmAgent", vm_status, VMStatus)
@@ -449,8 +486,27 @@ class StatusBlob(object):
 
     def prepare(self, blob_type):
         logger.verbose("Prepare status blob")
-        self.data = self.to_json()
+        self._timestamp = _get_utc_timestamp_for_status_reporting()
+        self.report = vm_status_to_v1(self.vm_status, timestamp=self._timestamp)
+        self.data = json.dumps(self.report)
         self.type = blob_type
+        # The digest is needed only to skip the upload of unchanged statuses (see WireClient.upload_status_blob), so it
+        # is computed here only if that is enabled
+        self.digest = None
+        if conf.get_status_upload_refresh_period() > 0:
+            self.get_digest()
+
+    def get_digest(self):
+        """
+        Returns a digest of the status prepared by prepare(), or None if no status has been prepared. The digest covers
+        everything in the status except the time of the report, which changes on every call. All the timestamps of the
+        report are the same, so they can be blanked out of the serialized data instead of serializing the report again
+        (the quotes within JSON strings are escaped, so the pattern can only match a key and its value).
+        """
+        if self.digest is None and self.data is not None and self._timestamp is not None:
+            timestamp_item = '"timestampUTC": "{0}"'.format(self._timestamp)
+            self.digest = hashlib.sha256(self.data.replace(timestamp_item, '"timestampUTC": ""').encode("utf-8")).hexdigest()
+        return self.digest
 
     def upload(self, url):
         try:
@@ -502,9 +558,64 @@ class StatusBlob(object):
             "x-ms-version": self.__class__.__storage_version__
         }
 
+    def discard_page_image(self, url):
+        """
+        Must be called when the page blob at 'url' is written by other means than put_page_blob (e.g. by the
+        HostGAPlugin), so that the next delta upload does not assume its previous content
+        """
+        self._page_images.pop(url, None)
+
+    @staticmethod
+    def _get_changed_page_ranges(previous, current, max_range_size):
+        """
+        Returns the ranges (start, end) of the pages that differ between 'previous' and 'current' (which have the same
+        size, a multiple of the page size); adjacent pages are merged into ranges of up to 'max_range_size' bytes.
+        """
+        ranges = []
+        page_size = StatusBlob._PAGE_SIZE
+        for start in range(0, len(current), page_size):
+            end = start + page_size
+            if previous[start:end] == current[start:end]:
+                continue
+            if len(ranges) > 0 and ranges[-1][1] == start and end - ranges[-1][0] <= max_range_size:
+                ranges[-1] = (ranges[-1][0], end)
+            else:
+                ranges.append((start, end))
+        return ranges
+
+    def _put_page_blob_delta(self, url, data):
+        page_blob_size = int((len(data) + self._PAGE_BLOB_SIZE_CLASS - 1) / self._PAGE_BLOB_SIZE_CLASS) * self._PAGE_BLOB_SIZE_CLASS
+        image = bytearray(page_blob_size)
+        image[0:len(data)] = data
+
+        # The image is removed until the upload completes, in case it fails half way
+        previous = self._page_images.pop(url, None)
+        if previous is None or len(previous) != page_blob_size:
+            headers = self.get_page_blob_create_headers(page_blob_size)
+            resp = self.client.call_storage_service(restutil.http_put, url, "", headers)
+            if resp.status != httpclient.CREATED:
+                raise UploadError("Failed to clean up page blob: {0}".format(resp.status))
+            # a new page blob is filled with zeros
+            previous = bytearray(page_blob_size)
+
+        page_url = "{0}?comp=page".format(url) if url.count("?") <= 0 else "{0}&comp=page".format(url)
+        ranges = self._get_changed_page_ranges(previous, image, 4 * 1024 * 1024)
+        logger.verbose("Upload page blob: {0} bytes in {1} range(s)", sum([end - start for start, end in ranges]), len(ranges))
+        for start, end in ranges:
+            headers = self.get_page_blob_page_headers(start, end)
+            resp = self.client.call_storage_service(restutil.http_put, page_url, bytebuffer(image[start:end]), headers)
+            if resp is None or resp.status != httpclient.CREATED:
+                raise UploadError("Failed to upload page blob: {0}".format(resp.status if resp is not None else None))
+
+        self._page_images[url] = image
+
     def put_page_blob(self, url, data):
         logger.verbose("Put page blob")
 
+        if conf.get_enable_delta_page_blob_upload():
+            self._put_page_blob_delta(url, bytearray(data, encoding='utf-8'))
+            return
+
         # Convert string into bytes and align to 512 bytes
         data = bytearray(data, encoding='utf-8')
         page_blob_size = int((len(data) + 511) / 512) * 512
@@ -563,12 +674,143 @@ def event_param_to_v1(param):
                                attr_type)
 
 
-def event_to_v1_encoded(event, encoding='utf-8'):
-    params = ""
-    for param in event.parameters:
-        params += event_param_to_v1(param)
-    event_str = ustr('<Event id="{0}"><![CDATA[{1}]]></Event>').format(event.eventId, params)
-    return event_str.encode(encoding)
+def event_to_v1_encoded(event, encoding='utf-8', param_blocks=None):
+    """
+    Encodes the event for the WireServer. 'param_blocks' is an optional list of TelemetryEventParamBlock (see
+    EventLogger.get_common_parameter_blocks()); the parameters of the event that match one of those blocks are not
+    encoded again, the (cached) encoding of the block is used instead. The result is the same either way.
+    """
+    blocks = {}
+    if param_blocks is not None:
+        for block in param_blocks:
+            start = block.find(event.parameters)
+            if start is not None:
+                blocks[start] = block
+
+    if len(blocks) == 0:
+        params = ustr("").join([event_param_to_v1(param) for param in event.parameters])
+        event_str = ustr('<Event id="{0}"><![CDATA[{1}]]></Event>').format(event.eventId, params)
+        return event_str.encode(encoding)
+
+    chunks = [ustr('<Event id="{0}"><![CDATA[').format(event.eventId).encode(encoding)]
+    params = []
+    i = 0
+    while i < len(event.parameters):
+        block = blocks.get(i)
+        if block is None:
+            params.append(event_param_to_v1(event.parameters[i]))
+            i += 1
+        else:
+            if len(params) > 0:
+                chunks.append(ustr("").join(params).encode(encoding))
+                params = []
+            chunks.append(block.get_encoded(event_param_to_v1, encoding))
+            i += len(block)
+    params.append(ustr(']]></Event>'))
+    chunks.append(ustr("").join(params).encode(encoding))
+    return b"".join(chunks)
+
+
+class _EventBuffer(object):
+    """
+    Accumulates the encoded events for a single provider. The events are kept as a list of chunks together with a
+    running byte count, so adding an event does not copy the events already in the buffer.
+
+    If 'keep_events' is True the buffer also keeps the original events, so that they can be acknowledged once the
+    buffer is sent.
+    """
+    def __init__(self, keep_events=False):
+        self._keep_events = keep_events
+        self._chunks = []
+        self.events = []
+        self.size = 0
+        self.count = 0
+
+    def add(self, event_str, event):
+        self._chunks.append(event_str)
+        if self._keep_events:
+            self.events.append(event)
+        self.size += len(event_str)
+        self.count += 1
+
+    def get_and_reset(self):
+        data = b"".join(self._chunks)
+        events = self.events
+        self._chunks = []
+        self.events = []
+        self.size = 0
+        self.count = 0
+        return data, events
+
+
+class _EventUploader(object):
+    """
+    Sends the buffers of events passed to submit() using the given 'send' function. If 'max_uploads' is greater than 1,
+    the buffers are sent concurrently by a pool of up to 'max_uploads' worker threads; otherwise they are sent
+    synchronously. wait() waits for all the submitted buffers to be sent.
+
+    All the buffers of a provider are sent by the same worker, so they are sent in the order they were submitted; only
+    the buffers of different providers are sent concurrently.
+
+    The number of buffers being sent at the same time is also capped globally (across all uploaders) to 'max_uploads'.
+    The 'send' function is expected to handle its own errors.
+    """
+    _in_flight_lock = threading.Lock()
+    _in_flight_semaphore = threading.BoundedSemaphore(1)
+    _in_flight_max = 1
+
+    def __init__(self, send, max_uploads):
+        self._send = send
+        self._max_uploads = max(max_uploads, 1)
+        self._workers = []  # list of (thread, queue of the buffers to send)
+        self._provider_queues = {}
+        self._in_flight = _EventUploader._get_in_flight_semaphore(self._max_uploads)
+
+    @staticmethod
+    def _get_in_flight_semaphore(max_uploads):
+        with _EventUploader._in_flight_lock:
+            if _EventUploader._in_flight_max != max_uploads:
+                _EventUploader._in_flight_semaphore = threading.BoundedSemaphore(max_uploads)
+                _EventUploader._in_flight_max = max_uploads
+            return _EventUploader._in_flight_semaphore
+
+    def submit(self, provider_id, data, events):
+        if self._max_uploads == 1:
+            self._upload((provider_id, data, events))
+            return
+
+        queue = self._provider_queues.get(provider_id)
+        if queue is None:
+            if len(self._workers) < self._max_uploads:
+                queue = Queue()
+                worker = threading.Thread(target=self._run_worker, args=(queue,))
+                worker.setName("EventUploader-{0}".format(len(self._workers)))
+                worker.setDaemon(True)
+                worker.start()
+                self._workers.append((worker, queue))
+            else:
+                queue = self._workers[len(self._provider_queues) % self._max_uploads][1]
+            self._provider_queues[provider_id] = queue
+        queue.put((provider_id, data, events))
+
+    def wait(self):
+        for _, queue in self._workers:
+            queue.put(None)
+        for worker, _ in self._workers:
+            worker.join()
+        self._workers = []
+        self._provider_queues = {}
+
+    def _run_worker(self, queue):
+        while True:
+            item = queue.get()
+            if item is None:
+                return
+            self._upload(item)
+
+    def _upload(self, item):
+        with self._in_flight:
+            self._send(*item)
 
 
 class WireClient(object):
@@ -580,18 +822,24 @@ class WireClient(object):
         self._extensions_goal_state = None
         self._host_plugin = None
         self.status_blob = StatusBlob(self)
-        self.goal_state_flusher = StateFlusher(conf.get_lib_dir())
+        history_store = GoalStateHistoryStore(conf.get_lib_dir()) if conf.get_enable_goal_state_history_store() else None
+        self.goal_state_flusher = StateFlusher(conf.get_lib_dir(), history_store=history_store)
+        self._goal_state_component_cache = GoalStateComponentCache()
+        self._saved_file_digests = {}
+        self._last_status_upload = None  # (status upload blob, digest of the status, time of the upload)
+        self._last_warm_start_snapshot = None  # (digest of the status, incarnation, etag, time the snapshot was saved)
 
     def get_endpoint(self):
         return self._endpoint
 
     def call_wireserver(self, http_req, *args, **kwargs):
+        ok_codes = kwargs.pop('ok_codes', None)
         try:
             # Never use the HTTP proxy for wireserver
             kwargs['use_proxy'] = False
             resp = http_req(*args, **kwargs)
 
-            if restutil.request_failed(resp):
+            if restutil.request_failed(resp, ok_codes=ok_codes):
                 msg = "[Wireserver Failed] URI {0} ".format(args[0])
                 if resp is not None:
                     msg += " [HTTP Failed] Status Code {0}".format(resp.status)
@@ -620,6 +868,28 @@ class WireClient(object):
                                     headers=headers)
         return self.decode_config(resp.read())
 
+    def fetch_config_if_modified(self, uri, headers, etag=None):
+        """
+        Similar to fetch_config(), but if 'etag' is not None the request is conditional on the content having changed.
+
+        Returns a tuple with the content and the ETag of the response; the content is None if the WireServer
+        indicated that it was not modified.
+        """
+        if etag is not None:
+            headers = dict(headers)
+            headers['if-none-match'] = etag
+        resp = self.call_wireserver(restutil.http_get, uri, headers=headers, ok_codes=restutil.OK_CODES + restutil.NOT_MODIFIED_CODES)
+
+        response_etag = None
+        for h in resp.getheaders():
+            if h[0].lower() == 'etag':
+                response_etag = h[1]
+                break
+
+        if restutil.request_not_modified(resp):
+            return None, etag
+        return self.decode_config(resp.read()), response_etag
+
     def fetch_cache(self, local_file):
         if not os.path.isfile(local_file):
             raise ProtocolError("{0} is missing.".format(local_file))
@@ -637,6 +907,18 @@ class WireClient(object):
             fileutil.clean_ioerror(e, paths=[file_name])
             raise ProtocolError("Failed to write cache: {0}".format(e))
 
+    def _save_cache_chunks(self, get_chunks, file_name):
+        """
+        Streams the text produced by 'get_chunks' (a function that returns an iterable of strings) to the cache file;
+        the file is not written if its content did not change since the last time it was saved
+        """
+        try:
+            file_path = os.path.join(conf.get_lib_dir(), file_name)
+            fileutil.write_chunks_if_changed(file_path, get_chunks, self._saved_file_digests)
+        except IOError as e:
+            fileutil.clean_ioerror(e, paths=[file_name])
+            raise ProtocolError("Failed to write cache: {0}".format(e))
+
     @staticmethod
     def call_storage_service(http_req, *args, **kwargs):
         # Default to use the configured HTTP proxy
@@ -791,7 +1073,8 @@ class WireClient(object):
                 logger.info("Forcing an update of the goal state..")
 
             if force_update or self._goal_state is None or self._goal_state.incarnation != goal_state.incarnation:
-                goal_state.fetch_full_goal_state(self)
+                component_cache = self._goal_state_component_cache if conf.get_enable_goal_state_component_cache() else None
+                goal_state.fetch_full_goal_state(self, component_cache=component_cache)
                 self._goal_state = goal_state
                 updated = True
 
@@ -837,7 +1120,14 @@ class WireClient(object):
                 return False
 
             logger.info("Fetched new vmSettings [correlation ID: {0} New eTag: {1}]", correlation_id, response_etag)
-            self._extensions_goal_state = ExtensionsGoalState(response_etag, vm_settings)
+            extensions_goal_state = ExtensionsGoalState(response_etag, vm_settings)
+            if conf.get_enable_vm_settings_extension_processing():
+                try:
+                    extensions_goal_state.parse()
+                except Exception as exception:
+                    # ext_handlers remains None and the extensions are processed from the ExtensionsConfig
+                    logger.warn("Failed to parse vmSettings [eTag: {0}], will use the ExtensionsConfig instead: {1}", response_etag, ustr(exception))
+            self._extensions_goal_state = extensions_goal_state
             return True
 
         except Exception as exception:
@@ -855,21 +1145,37 @@ class WireClient(object):
             logger.warn("Failed to save the previous goal state to the history folder: {0}", ustr(e))
 
         try:
+            streaming = conf.get_enable_streaming_goal_state_cache()
+
+            def save_text(text, file_name):
+                if streaming:
+                    self._save_cache_chunks(lambda: [text], file_name)
+                else:
+                    self._save_cache(text, file_name)
+
             def save_if_not_none(goal_state_property, file_name):
                 if goal_state_property is not None and goal_state_property.xml_text is not None:
-                    self._save_cache(goal_state_property.xml_text, file_name)
+                    save_text(goal_state_property.xml_text, file_name)
 
             # NOTE: Certificates are saved in Certificate.__init__
-            self._save_cache(self._goal_state.incarnation, INCARNATION_FILE_NAME)
+            save_text(ustr(self._goal_state.incarnation), INCARNATION_FILE_NAME)
             save_if_not_none(self._goal_state, GOAL_STATE_FILE_NAME.format(self._goal_state.incarnation))
             save_if_not_none(self._goal_state.hosting_env, HOSTING_ENV_FILE_NAME)
             save_if_not_none(self._goal_state.shared_conf, SHARED_CONF_FILE_NAME)
             save_if_not_none(self._goal_state.remote_access, REMOTE_ACCESS_FILE_NAME.format(self._goal_state.incarnation))
             if self._goal_state.ext_conf is not None and self._goal_state.ext_conf.xml_text is not None:
-                self._save_cache(self._goal_state.ext_conf.get_redacted_xml_text(), EXT_CONF_FILE_NAME.format(self._goal_state.incarnation))
+                file_name = EXT_CONF_FILE_NAME.format(self._goal_state.incarnation)
+                if streaming:
+                    self._save_cache_chunks(self._goal_state.ext_conf.iter_redacted_xml_text, file_name)
+                else:
+                    self._save_cache(self._goal_state.ext_conf.get_redacted_xml_text(), file_name)
 
             if self._extensions_goal_state is not None:
-                self._save_cache(self._extensions_goal_state.get_redacted_vm_settings(), VM_SETTINGS_FILE_NAME.format(self._extensions_goal_state.etag))
+                file_name = VM_SETTINGS_FILE_NAME.format(self._extensions_goal_state.etag)
+                if streaming:
+                    self._save_cache_chunks(self._extensions_goal_state.iter_redacted_vm_settings, file_name)
+                else:
+                    self._save_cache(self._extensions_goal_state.get_redacted_vm_settings(), file_name)
 
         except Exception as e:
             logger.warn("Failed to save the goal state to disk: {0}", ustr(e))
@@ -892,6 +1198,18 @@ class WireClient(object):
             raise ProtocolError("Trying to fetch the extensions goal state before initialization!")
         return self._extensions_goal_state
 
+    def get_vm_settings_extensions_goal_state(self):
+        """
+        Returns the ExtensionsGoalState if the extensions should be processed from the vmSettings, or None if they should
+        be processed from the ExtensionsConfig (FastTrack or Debug.EnableVmSettingsExtensionProcessing are disabled, or
+        the vmSettings were not fetched, or could not be parsed).
+        """
+        if not conf.get_enable_fast_track() or not conf.get_enable_vm_settings_extension_processing():
+            return None
+        if self._extensions_goal_state is None or self._extensions_goal_state.ext_handlers is None:
+            return None
+        return self._extensions_goal_state
+
     def get_goal_state(self):
         if self._goal_state is None:
             raise ProtocolError("Trying to fetch goal state before initialization!")
@@ -1106,6 +1424,21 @@ class WireClient(object):
         except Exception as e:
             raise ProtocolError("Exception creating status blob: {0}".format(ustr(e)))
 
+        refresh_period = conf.get_status_upload_refresh_period()
+        if refresh_period > 0 and self._last_status_upload is not None:
+            last_blob, last_digest, last_upload_time = self._last_status_upload
+            if last_blob == ext_conf.status_upload_blob and last_digest == self.status_blob.digest and time.time() - last_upload_time < refresh_period:
+                logger.verbose("The status did not change since the last upload, skipping it")
+                return
+
+        if self._upload_status_blob(ext_conf.status_upload_blob, ext_conf.status_upload_blob_type):
+            self._last_status_upload = (ext_conf.status_upload_blob, self.status_blob.digest, time.time())
+
+    def _upload_status_blob(self, status_upload_blob, status_upload_blob_type):
+        """
+        Uploads the status blob; returns True if the upload succeeded, or False if it needs to be retried on the next
+        iteration of the main loop. Raises a ProtocolError if the upload failed.
+        """
         # Swap the order of use for the HostPlugin vs. the "direct" route.
         # Prefer the use of HostPlugin. If HostPlugin fails fall back to the
         # direct route.
@@ -1117,26 +1450,109 @@ class WireClient(object):
         # wrong. This is why we try HostPlugin then direct.
         try:
             host = self.get_host_plugin()
-            host.put_vm_status(self.status_blob, ext_conf.status_upload_blob, ext_conf.status_upload_blob_type)
-            return
+            host.put_vm_status(self.status_blob, status_upload_blob, status_upload_blob_type)
+            return True
         except ResourceGoneError:
             # refresh the host plugin client and try again on the next iteration of the main loop
             self.update_host_plugin_from_goal_state()
-            return
+            return False
         except Exception as e:
             # for all other errors, fall back to direct
             msg = "Falling back to direct upload: {0}".format(ustr(e))
             self.report_status_event(msg, is_success=True)
 
         try:
-            if self.status_blob.upload(ext_conf.status_upload_blob):
-                return
+            if self.status_blob.upload(status_upload_blob):
+                return True
         except Exception as e:
             msg = "Exception uploading status blob: {0}".format(ustr(e))
             self.report_status_event(msg, is_success=False)
 
         raise ProtocolError("Failed to upload status blob via either channel")
 
+    def save_warm_start_snapshot(self):
+        """
+        Saves the data needed to report status on the next start of the agent, before the goal state is fetched:
+        the Container ID and RoleConfigName used by the HostGAPlugin, the status upload blob and the last status
+        that was reported. The incarnation and ETag of the goal state are saved to check whether the snapshot is
+        still current once the goal state is fetched.
+
+        The snapshot is saved only if the status (timestamps aside), incarnation or ETag changed since it was last saved,
+        or if it is older than half its maximum age.
+
+        NOTE: The goal state itself is not included, since it has protected settings and those are never saved to disk.
+        """
+        if self._goal_state is None or self.status_blob.data is None:
+            return
+        ext_conf = self._goal_state.ext_conf
+        if ext_conf is None or ext_conf.status_upload_blob is None:
+            return
+
+        now = time.time()
+        digest, incarnation, etag = self.status_blob.get_digest(), self._goal_state.incarnation, self.get_etag()
+        if digest is not None and self._last_warm_start_snapshot is not None:
+            last_digest, last_incarnation, last_etag, last_save_time = self._last_warm_start_snapshot
+            if (last_digest, last_incarnation, last_etag) == (digest, incarnation, etag) and 0 <= now - last_save_time < WARM_START_SNAPSHOT_MAX_AGE_IN_SECONDS / 2:
+                return
+
+        snapshot = {
+            "timestamp": now,
+            "incarnation": incarnation,
+            "etag": etag,
+            "containerId": self._goal_state.container_id,
+            "roleConfigName": self._goal_state.role_config_name,
+            "statusUploadBlob": ext_conf.status_upload_blob,
+            "statusUploadBlobType": ext_conf.status_upload_blob_type,
+            "status": self.status_blob.data
+        }
+
+        file_name = os.path.join(conf.get_lib_dir(), WARM_START_FILE_NAME)
+        try:
+            fileutil.write_file(file_name + ".tmp", json.dumps(snapshot))
+            os.rename(file_name + ".tmp", file_name)
+            self._last_warm_start_snapshot = (digest, incarnation, etag, now)
+        except (IOError, OSError) as e:
+            logger.warn("Failed to save the warm start snapshot: {0}", ustr(e))
+
+    @staticmethod
+    def load_warm_start_snapshot():
+        """
+        Returns the snapshot saved by save_warm_start_snapshot(), or None if there is no snapshot or it is too old
+        """
+        file_name = os.path.join(conf.get_lib_dir(), WARM_START_FILE_NAME)
+        if not os.path.exists(file_name):
+            return None
+        try:
+            snapshot = json.loads(fileutil.read_file(file_name))
+            age = time.time() - snapshot["timestamp"]
+            if not 0 <= age <= WARM_START_SNAPSHOT_MAX_AGE_IN_SECONDS:
+                logger.info("The warm start snapshot is too old ({0:.0f} seconds); ignoring it", age)
+                return None
+            return snapshot
+        except Exception as e:
+            logger.warn("Failed to load the warm start snapshot: {0}", ustr(e))
+            return None
+
+    def report_warm_start_status(self, snapshot):
+        """
+        Reports the status in the given snapshot (see save_warm_start_snapshot()), updated with the current time and
+        version of the agent
+        """
+        self._set_host_plugin(HostPluginProtocol(self.get_endpoint(), snapshot["containerId"], snapshot["roleConfigName"]))
+
+        status = json.loads(snapshot["status"])
+        status["timestampUTC"] = _get_utc_timestamp_for_status_reporting()
+        status["aggregateStatus"]["guestAgentStatus"]["version"] = str(CURRENT_VERSION)
+
+        blob_type = snapshot["statusUploadBlobType"]
+        if blob_type not in ["BlockBlob", "PageBlob"]:
+            blob_type = "BlockBlob"
+        self.status_blob.report = status
+        self.status_blob.data = json.dumps(status)
+        self.status_blob.type = blob_type
+
+        self._upload_status_blob(snapshot["statusUploadBlob"], blob_type)
+
     def report_role_prop(self, thumbprint):
         goal_state = self.get_goal_state()
         role_prop = _build_role_properties(goal_state.container_id,
@@ -1208,56 +1624,83 @@ class WireClient(object):
             raise ProtocolError(
                 "Failed to send events:{0}".format(resp.status))
 
-    def report_event(self, events_iterator):
+    def report_event(self, events_iterator, event_acknowledger=None):
+        """
+        Sends the given events to the WireServer, batched by provider.
+
+        If given, 'event_acknowledger' (e.g. an EventDeliveryLedger) is notified of the outcome of each event: ack() is
+        called with the events that were sent or that were dropped because they can never be sent (e.g. they are too
+        large), and nack() with the events that failed to be sent and can be retried.
+        """
         buf = {}
         debug_info = CollectOrReportEventDebugInfo(operation=CollectOrReportEventDebugInfo.OP_REPORT)
-        events_per_provider = defaultdict(int)
+        keep_events = event_acknowledger is not None
+        param_blocks = get_event_logger().get_common_parameter_blocks()
+        debug_info_lock = threading.Lock()
 
-        def _send_event(provider_id, debug_info):
+        def _upload_events(provider_id, data, events):
             try:
-                self.send_encoded_event(provider_id, buf[provider_id])
+                self.send_encoded_event(provider_id, data)
             except UnicodeError as uni_error:
-                debug_info.update_unicode_error(uni_error)
+                with debug_info_lock:
+                    debug_info.update_unicode_error(uni_error)
             except Exception as error:
-                debug_info.update_op_error(error)
+                with debug_info_lock:
+                    debug_info.update_op_error(error)
+                if keep_events:
+                    event_acknowledger.nack(events)
+                return
+            if keep_events:
+                event_acknowledger.ack(events)
 
-        # Group events by providerId
-        for event in events_iterator:
-            try:
-                if event.providerId not in buf:
-                    buf[event.providerId] = b""
-                event_str = event_to_v1_encoded(event)
-
-                if len(event_str) >= MAX_EVENT_BUFFER_SIZE:
-                    # Ignore single events that are too large to send out
-                    details_of_event = [ustr(x.name) + ":" + ustr(x.value) for x in event.parameters if x.name in
-                                        [GuestAgentExtensionEventsSchema.Name, GuestAgentExtensionEventsSchema.Version,
-                                         GuestAgentExtensionEventsSchema.Operation,
-                                         GuestAgentExtensionEventsSchema.OperationSuccess]]
-                    logger.periodic_warn(logger.EVERY_HALF_HOUR,
-                                         "Single event too large: {0}, with the length: {1} more than the limit({2})"
-                                         .format(str(details_of_event), len(event_str), MAX_EVENT_BUFFER_SIZE))
-                    continue
-
-                # If buffer is full, send out the events in buffer and reset buffer
-                if len(buf[event.providerId] + event_str) >= MAX_EVENT_BUFFER_SIZE:
-                    logger.verbose("No of events this request = {0}".format(events_per_provider[event.providerId]))
-                    _send_event(event.providerId, debug_info)
-                    buf[event.providerId] = b""
-                    events_per_provider[event.providerId] = 0
-
-                # Add encoded events to the buffer
-                buf[event.providerId] = buf[event.providerId] + event_str
-                events_per_provider[event.providerId] += 1
+        # The buffers of different providers may be sent concurrently; the buffers of each provider are sent in order
+        uploader = _EventUploader(_upload_events, conf.get_max_concurrent_event_uploads())
 
-            except Exception as error:
-                logger.warn("Unexpected error when generating Events:{0}", textutil.format_exception(error))
+        def _send_event(provider_id):
+            logger.verbose("No of events this request = {0}".format(buf[provider_id].count))
+            data, events = buf[provider_id].get_and_reset()
+            uploader.submit(provider_id, data, events)
 
-        # Send out all events left in buffer.
-        for provider_id in list(buf.keys()):
-            if buf[provider_id]:
-                logger.verbose("No of events this request = {0}".format(events_per_provider[provider_id]))
-                _send_event(provider_id, debug_info)
+        try:
+            # Group events by providerId
+            for event in events_iterator:
+                try:
+                    if event.providerId not in buf:
+                        buf[event.providerId] = _EventBuffer(keep_events=keep_events)
+                    event_str = event_to_v1_encoded(event, param_blocks=param_blocks)
+
+                    if len(event_str) >= MAX_EVENT_BUFFER_SIZE:
+                        # Ignore single events that are too large to send out
+                        details_of_event = [ustr(x.name) + ":" + ustr(x.value) for x in event.parameters if x.name in
+                                            [GuestAgentExtensionEventsSchema.Name, GuestAgentExtensionEventsSchema.Version,
+                                             GuestAgentExtensionEventsSchema.Operation,
+                                             GuestAgentExtensionEventsSchema.OperationSuccess]]
+                        logger.periodic_warn(logger.EVERY_HALF_HOUR,
+                                             "Single event too large: {0}, with the length: {1} more than the limit({2})"
+                                             .format(str(details_of_event), len(event_str), MAX_EVENT_BUFFER_SIZE))
+                        if keep_events:
+                            event_acknowledger.ack([event])
+                        continue
+
+                    # If buffer is full, send out the events in buffer and reset buffer
+                    if buf[event.providerId].size + len(event_str) >= MAX_EVENT_BUFFER_SIZE:
+                        _send_event(event.providerId)
+
+                    # Add encoded events to the buffer
+                    buf[event.providerId].add(event_str, event)
+
+                except Exception as error:
+                    logger.warn("Unexpected error when generating Events:{0}", textutil.format_exception(error))
+                    if keep_events:
+                        event_acknowledger.ack([event])
+
+            # Send out all events left in buffer.
+            for provider_id in list(buf.keys()):
+                if buf[provider_id].count > 0:
+                    _send_event(provider_id)
+        finally:
+            # wait for all the events to be sent (if the uploads are concurrent)
+            uploader.wait()
 
         debug_info.report_debug_info()
 
@@ -1367,21 +1810,46 @@ class VersionInfo(object):
         self.parse(xml_text)
 
     def parse(self, xml_text):
-        xml_doc = parse_doc(xml_text)
-        preferred = find(xml_doc, "Preferred")
-        self.preferred = findtext(preferred, "Version")
+        if conf.get_enable_streaming_xml_parser():
+            preferred_version, supported_version = self._parse_streaming(xml_text)
+        else:
+            xml_doc = parse_doc(xml_text)
+            preferred = find(xml_doc, "Preferred")
+            preferred_version = find(preferred, "Version")
+            supported = find(xml_doc, "Supported")
+            supported_version = findall(supported, "Version")
+
+        self.preferred = gettext(preferred_version)
         logger.info("Fabric preferred wire protocol version:{0}",
                     self.preferred)
 
         self.supported = []
-        supported = find(xml_doc, "Supported")
-        supported_version = findall(supported, "Version")
         for node in supported_version:
             version = gettext(node)
             logger.verbose("Fabric supported wire protocol version:{0}",
                            version)
             self.supported.append(version)
 
+    @staticmethod
+    def _parse_streaming(xml_text):
+        """
+        Returns the Version node of the first Preferred node and the Version nodes of the first Supported node, using
+        ElementTree.iterparse
+        """
+        first = {}
+        preferred_version = None
+        supported_version = []
+        for event, element, ancestors in iterparse_doc(xml_text):
+            tag = get_local_name(element)
+            if event == "start":
+                first.setdefault(tag, element)
+                if tag == "Version":
+                    if preferred_version is None and any(a is first.get("Preferred") for a in ancestors):
+                        preferred_version = element
+                    if any(a is first.get("Supported") for a in ancestors):
+                        supported_version.append(element)
+        return preferred_version, supported_version
+
     def get_preferred(self):
         return self.preferred
 
@@ -1398,6 +1866,9 @@ class ExtensionManifest(object):
         self._parse(xml_text)
 
     def _parse(self, xml_text):
+        if conf.get_enable_streaming_xml_parser():
+            self._parse_streaming(xml_text)
+            return
         xml_doc = parse_doc(xml_text)
         self._handle_packages(findall(find(xml_doc,
                                            "Plugins"),
@@ -1408,6 +1879,27 @@ class ExtensionManifest(object):
                                       "Plugin"),
                               True)
 
+    def _parse_streaming(self, xml_text):
+        """
+        Same as _parse(), but in a single pass over the document using ElementTree.iterparse; each Plugin is parsed
+        (and discarded) as soon as its element ends.
+        """
+        first = {}
+        internal_packages = []
+        for event, element, ancestors in iterparse_doc(xml_text):
+            tag = get_local_name(element)
+            if event == "start":
+                first.setdefault(tag, element)
+            elif tag == "Plugin":
+                if any(a is first.get("Plugins") for a in ancestors):
+                    self._handle_packages([element], False)
+                if any(a is first.get("InternalPlugins") for a in ancestors):
+                    # the internal packages go after all the other packages
+                    internal_packages.append(element)
+                else:
+                    element.clear()
+        self._handle_packages(internal_packages, True)
+
     def _handle_packages(self, packages, isinternal):
         for package in packages:
             version = findtext(package, "Version")
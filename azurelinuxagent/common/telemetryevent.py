@@ -18,6 +18,7 @@
 #
 
 from azurelinuxagent.common.datacontract import DataContract, DataContractList
+from azurelinuxagent.common.future import ustr
 from azurelinuxagent.common.version import AGENT_NAME
 
 
@@ -79,6 +80,8 @@ class GuestAgentPerfCounterEventsSchema(CommonTelemetryEventSchema):
 
 
 class TelemetryEventParam(DataContract):
+    __slots__ = ("name", "value")
+
     def __init__(self, name=None, value=None):
         self.name = name
         self.value = value
@@ -87,28 +90,154 @@ class TelemetryEventParam(DataContract):
         return isinstance(other, TelemetryEventParam) and other.name == self.name and other.value == self.value
 
 
+class TelemetryEventParamList(DataContractList):
+    """
+    List of the parameters of a TelemetryEvent; it keeps a map from parameter name to the index of the first parameter
+    with that name for fast lookups. The map is maintained incrementally by append() and extend() (the common case)
+    and rebuilt on demand after any other modification of the list.
+
+    NOTE: The map assumes that the name of a parameter does not change after it is added to the list (its value can
+    change).
+    """
+    def __init__(self, params=None):
+        super(TelemetryEventParamList, self).__init__(TelemetryEventParam)
+        self._index = {}
+        if params is not None:
+            self.extend(params)
+
+    def append(self, param):
+        if self._index is not None and param.name not in self._index:
+            self._index[param.name] = len(self)
+        super(TelemetryEventParamList, self).append(param)
+
+    def extend(self, params):
+        for param in params:
+            self.append(param)
+
+    def __iadd__(self, params):
+        self.extend(params)
+        return self
+
+    def get_index(self, name):
+        """
+        Returns the index of the first parameter with the given name, or None if there is no such parameter.
+        """
+        if self._index is None:
+            self._index = {}
+            for i, param in enumerate(self):
+                if param.name not in self._index:
+                    self._index[param.name] = i
+        return self._index.get(name)
+
+    def _invalidate_index(self):
+        self._index = None
+
+    def _invalidating(method):  # pylint: disable=no-self-argument
+        def wrapper(self, *args, **kwargs):
+            self._invalidate_index()
+            return method(self, *args, **kwargs)  # pylint: disable=not-callable
+        return wrapper
+
+    insert = _invalidating(DataContractList.insert)
+    remove = _invalidating(DataContractList.remove)
+    pop = _invalidating(DataContractList.pop)
+    sort = _invalidating(DataContractList.sort)
+    reverse = _invalidating(DataContractList.reverse)
+    __setitem__ = _invalidating(DataContractList.__setitem__)
+    __delitem__ = _invalidating(DataContractList.__delitem__)
+    if hasattr(DataContractList, "__setslice__"):  # Python 2
+        __setslice__ = _invalidating(getattr(DataContractList, "__setslice__"))
+        __delslice__ = _invalidating(getattr(DataContractList, "__delslice__"))
+    del _invalidating
+
+
+class TelemetryEventParamBlock(object):
+    """
+    Immutable run of parameters that is added, as is, to many events (e.g. the VM-wide parameters added by the
+    EventLogger). The telemetry encoder looks for the block in the parameters of each event and, when found, splices
+    the encoded block (computed only once) instead of encoding each of its parameters.
+    """
+    __slots__ = ("params", "_encoded")
+
+    def __init__(self, params):
+        self.params = tuple((param.name, param.value) for param in params)
+        self._encoded = {}
+
+    def __len__(self):
+        return len(self.params)
+
+    def find(self, parameters):
+        """
+        Returns the index of the block in the given TelemetryEventParamList, or None if the list does not include the
+        block (with the same names, values and types of values).
+        """
+        if len(self.params) == 0:
+            return None
+        start = parameters.get_index(self.params[0][0])
+        if start is None or start + len(self.params) > len(parameters):
+            return None
+        for i, (name, value) in enumerate(self.params):
+            param = parameters[start + i]
+            if param.name != name or param.value != value or \
+                    (type(param.value) is not type(value) and not (isinstance(param.value, ustr) and isinstance(value, ustr))):  # pylint: disable=unidiomatic-typecheck
+                return None
+        return start
+
+    def get_encoded(self, encode_param, encoding):
+        """
+        Returns the block encoded with the given function, as bytes in the given encoding; the result is cached.
+        """
+        encoded = self._encoded.get(encoding)
+        if encoded is None:
+            encoded = ustr("").join([encode_param(TelemetryEventParam(name, value)) for name, value in self.params]).encode(encoding)
+            self._encoded[encoding] = encoded
+        return encoded
+
+
 class TelemetryEvent(DataContract):
+    """
+    NOTE: TelemetryEvent and TelemetryEventParam use __slots__ to minimize their memory footprint, since the agent may
+    keep thousands of them in memory while they are waiting to be sent. The parameters are kept in a
+    TelemetryEventParamList, which provides fast lookups by name (assigning any other list to 'parameters' converts it
+    to a TelemetryEventParamList).
+    """
+    __slots__ = ("eventId", "providerId", "parameters", "file_type")
+
     def __init__(self, eventId=None, providerId=None):
         self.eventId = eventId
         self.providerId = providerId
-        self.parameters = DataContractList(TelemetryEventParam)
+        self.parameters = TelemetryEventParamList()
         self.file_type = ""
 
+    def __setattr__(self, name, value):
+        if name == "parameters" and not isinstance(value, TelemetryEventParamList):
+            value = TelemetryEventParamList(value)
+        super(TelemetryEvent, self).__setattr__(name, value)
+
     # Checking if the particular param name is in the TelemetryEvent.
     def __contains__(self, param_name):
-        return param_name in [param.name for param in self.parameters]
+        return self.parameters.get_index(param_name) is not None
+
+    def get_param_value(self, param_name, default=None):
+        index = self.parameters.get_index(param_name)
+        return default if index is None else self.parameters[index].value
+
+    def set_param_value(self, param_name, value):
+        """
+        Replaces the value of the given parameter or, if the event does not have that parameter, adds it.
+        """
+        index = self.parameters.get_index(param_name)
+        if index is None:
+            self.parameters.append(TelemetryEventParam(param_name, value))
+        else:
+            self.parameters[index].value = value
 
     def is_extension_event(self):
         # Events originating from the agent have "WALinuxAgent" as the Name parameter, or they don't have a Name
         # parameter, in the case of log and metric events. So, in case the Name parameter exists and it is not
         # "WALinuxAgent", it is an extension event.
-        for param in self.parameters:
-            if param.name == GuestAgentExtensionEventsSchema.Name:
-                return param.value != AGENT_NAME
-        return False
+        index = self.parameters.get_index(GuestAgentExtensionEventsSchema.Name)
+        return index is not None and self.parameters[index].value != AGENT_NAME
 
     def get_version(self):
-        for param in self.parameters:
-            if param.name == GuestAgentExtensionEventsSchema.Version:
-                return param.value
-        return None
+        return self.get_param_value(GuestAgentExtensionEventsSchema.Version)
@@ -1,13 +1,20 @@
 # Copyright (c) Microsoft Corporation. All rights reserved.
 # Licensed under the Apache License.
 import errno
+import fcntl
+import hashlib
+import json
 import os
+import platform
 import re
 import shutil
+import threading
 import zipfile
+import zlib
 from datetime import datetime
 
 import azurelinuxagent.common.logger as logger
+from azurelinuxagent.common.future import ustr
 from azurelinuxagent.common.utils import fileutil
 
 # pylint: disable=W0105
@@ -33,10 +40,15 @@ The process works as follows whenever a new incarnation arrives.
 is /var/lib/waagent.
 
 The timestamp is an ISO8601 formatted value.
+
+When Debug.EnableGoalStateHistoryStore is set, the flush appends the state
+files to a GoalStateHistoryStore instead (see the documentation of that
+class), and the periodic archive and purge run in a background thread.
 """
 # pylint: enable=W0105
 
 ARCHIVE_DIRECTORY_NAME = 'history'
+PACKED_HISTORY_DIRECTORY_NAME = 'packed'
 
 _MAX_ARCHIVED_STATES = 50
 
@@ -49,6 +61,9 @@ _CACHE_PATTERNS = [
 ]
 
 _GOAL_STATE_PATTERN = re.compile(r"^(.*)/GoalState\.(\d+)\.xml$", re.IGNORECASE)
+_VM_SETTINGS_PATTERN = re.compile(r"^(.*)/VmSettings\.(\d+)\.json$")
+
+_PACK_PATTERN = re.compile(r"^(\d{4}-\d{2}-\d{2})\.pack$")
 
 # Old names didn't have incarnation, new ones do. Ensure the regex captures both cases.
 # 2018-04-06T08:21:37.142697_incarnation_N
@@ -58,8 +73,9 @@ _ARCHIVE_PATTERNS_ZIP = re.compile(r"^\d{4}\-\d{2}\-\d{2}T\d{2}:\d{2}:\d{2}\.\d+
 
 
 class StateFlusher(object):
-    def __init__(self, lib_dir):
+    def __init__(self, lib_dir, history_store=None):
         self._source = lib_dir
+        self._history_store = history_store
 
         directory = os.path.join(self._source, ARCHIVE_DIRECTORY_NAME)
         if not os.path.exists(directory):
@@ -74,6 +90,16 @@ class StateFlusher(object):
         if not files:
             return
 
+        if self._history_store is not None:
+            incarnation, etag = self._get_incarnation_and_etag(files)
+            if incarnation is not None or etag is not None:
+                try:
+                    self._history_store.add(incarnation, etag, files)
+                    self._purge(files)
+                    return
+                except Exception as exception:
+                    logger.warn("Failed to add the goal state to the history store, will archive it to a directory instead: {0}", ustr(exception))
+
         archive_name = self._get_archive_name(files)
         if archive_name is None:
             return
@@ -111,6 +137,18 @@ class StateFlusher(object):
             return datetime.utcfromtimestamp(latest_timestamp_ms).isoformat() + "_incarnation_{0}".format(incarnation)
         return None
 
+    @staticmethod
+    def _get_incarnation_and_etag(files):
+        incarnation, etag = None, None
+        for current_file in files:
+            match = _GOAL_STATE_PATTERN.match(current_file)
+            if match:
+                incarnation = match.groups()[1]
+            match = _VM_SETTINGS_PATTERN.match(current_file)
+            if match:
+                etag = match.groups()[1]
+        return incarnation, etag
+
     def _get_files_to_archive(self):
         files = []
         for current_file in os.listdir(self._source):
@@ -250,3 +288,212 @@ class StateArchiver(object):
                 states.append(StateZip(full_path, match.group(0)))
 
         return states
+
+
+# Appends to the packs and deletions of packs in the same process are serialized with this lock; appends from different
+# processes (the daemon and the extension handler) are serialized with a lock on the pack file
+_HISTORY_STORE_LOCK = threading.Lock()
+
+
+class GoalStateHistoryStore(object):
+    """
+    Packed history of goal states. The documents of the goal states received during a day are appended, compressed
+    with zlib, to a single container (history/packed/<YYYY-MM-DD>.pack); for each document, a line of JSON is appended
+    to the index of the container (history/packed/<YYYY-MM-DD>.index):
+
+        {"incarnation": "2", "etag": "888", "timestamp": "2021-08-06T17:03:41.295832", "name": "GoalState.2.xml",
+         "offset": 1024, "length": 371, "digest": "..."}
+
+    A document that is identical to a document already in the container (e.g. the SharedConfig) is not appended again;
+    its index entry points to the existing data. Data is written before its index entry, so an interrupted append
+    leaves, at most, unreferenced data in the container (and incomplete index lines are ignored).
+
+    Retention is based on size: purge() deletes the oldest containers until the total size of the history is within
+    the given limit. The containers for the current day are never deleted.
+    """
+    def __init__(self, lib_dir):
+        self._directory = os.path.join(lib_dir, ARCHIVE_DIRECTORY_NAME, PACKED_HISTORY_DIRECTORY_NAME)
+        self._digests = {}  # digests of the documents in the current container, day -> {digest: (offset, length)}
+        self._compaction_thread = None
+
+    def _get_pack_path(self, day):
+        return os.path.join(self._directory, "{0}.pack".format(day))
+
+    def _get_index_path(self, day):
+        return os.path.join(self._directory, "{0}.index".format(day))
+
+    def add(self, incarnation, etag, files, timestamp=None):
+        """
+        Appends the given files (full paths) to the container for the day of 'timestamp' (defaults to the current time)
+        """
+        if timestamp is None:
+            timestamp = datetime.utcnow()
+        day = timestamp.strftime("%Y-%m-%d")
+
+        with _HISTORY_STORE_LOCK:
+            if not os.path.isdir(self._directory):
+                fileutil.mkdir(self._directory, mode=0o700)
+
+            if day not in self._digests:
+                self._digests = {day: self._load_digests(day)}
+            digests = self._digests[day]
+
+            entries = []
+            with open(self._get_pack_path(day), "ab") as pack:
+                # the offsets are taken from the end of the pack, so another process must not append to it until the
+                # index entries are written
+                fcntl.flock(pack.fileno(), fcntl.LOCK_EX)
+                try:
+                    pack.seek(0, os.SEEK_END)
+                    for current_file in files:
+                        with open(current_file, "rb") as file_:
+                            data = file_.read()
+                        digest = hashlib.sha256(data).hexdigest()
+                        if digest not in digests:
+                            compressed = zlib.compress(data)
+                            digests[digest] = (pack.tell(), len(compressed))
+                            pack.write(compressed)
+                        offset, length = digests[digest]
+                        entries.append({
+                            "incarnation": incarnation,
+                            "etag": etag,
+                            "timestamp": timestamp.isoformat(),
+                            "name": os.path.basename(current_file),
+                            "offset": offset,
+                            "length": length,
+                            "digest": digest
+                        })
+                    pack.flush()
+                    os.fsync(pack.fileno())
+
+                    with open(self._get_index_path(day), "a") as index:
+                        for entry in entries:
+                            index.write(json.dumps(entry) + "\n")
+                finally:
+                    fcntl.flock(pack.fileno(), fcntl.LOCK_UN)
+
+    def _load_digests(self, day):
+        digests = {}
+        for entry in self._read_index(day):
+            digests[entry["digest"]] = (entry["offset"], entry["length"])
+        return digests
+
+    def _read_index(self, day):
+        entries = []
+        index_path = self._get_index_path(day)
+        if not os.path.exists(index_path):
+            return entries
+        with open(index_path, "r") as index:
+            for line in index:
+                try:
+                    entries.append(json.loads(line))
+                except ValueError:
+                    # an incomplete line from an interrupted append
+                    continue
+        return entries
+
+    def _get_days(self):
+        """
+        Returns the days that have a container, most recent first
+        """
+        if not os.path.isdir(self._directory):
+            return []
+        days = []
+        for current_file in os.listdir(self._directory):
+            match = _PACK_PATTERN.match(current_file)
+            if match is not None:
+                days.append(match.group(1))
+        days.sort(reverse=True)
+        return days
+
+    def get_index(self):
+        """
+        Returns the index entries of all the goal states in the history, most recent first
+        """
+        entries = []
+        for day in self._get_days():
+            entries.extend(reversed(self._read_index(day)))
+        return entries
+
+    def get_documents(self, incarnation=None, etag=None):
+        """
+        Returns a dictionary of document name -> content (bytes) with the documents of the most recent goal state with
+        the given incarnation and/or ETag, or None if there is no such goal state in the history. Only the indexes of
+        the days up to the one that contains the goal state are read.
+        """
+        if incarnation is None and etag is None:
+            raise ValueError("Either the incarnation or the ETag must be specified")
+
+        def matches(entry):
+            return (incarnation is None or entry["incarnation"] == ustr(incarnation)) and (etag is None or entry["etag"] == ustr(etag))
+
+        for day in self._get_days():
+            entries = [e for e in self._read_index(day) if matches(e)]
+            if len(entries) == 0:
+                continue
+            timestamp = entries[-1]["timestamp"]
+            documents = {}
+            with open(self._get_pack_path(day), "rb") as pack:
+                for entry in entries:
+                    if entry["timestamp"] != timestamp:
+                        continue
+                    pack.seek(entry["offset"])
+                    documents[entry["name"]] = zlib.decompress(pack.read(entry["length"]))
+            return documents
+        return None
+
+    def get_size(self):
+        size = 0
+        for day in self._get_days():
+            for path in (self._get_pack_path(day), self._get_index_path(day)):
+                if os.path.exists(path):
+                    size += os.path.getsize(path)
+        return size
+
+    def purge(self, max_size):
+        """
+        Deletes the oldest containers until the size of the history is at most 'max_size' bytes
+        """
+        today = datetime.utcnow().strftime("%Y-%m-%d")
+        with _HISTORY_STORE_LOCK:
+            days = self._get_days()
+            size = self.get_size()
+            for day in reversed(days):
+                if size <= max_size or day >= today:
+                    break
+                for path in (self._get_pack_path(day), self._get_index_path(day)):
+                    if os.path.exists(path):
+                        size -= os.path.getsize(path)
+                        os.remove(path)
+                logger.info("Removed goal state history for {0} [history size: {1} bytes]", day, size)
+
+    def start_compaction(self, max_size, archiver=None):
+        """
+        Runs purge() (and the purge and archive of the given StateArchiver, which handles the history that was not
+        stored in packs) in a background thread. On Linux the thread runs with the lowest CPU priority, and its I/O
+        priority follows its CPU priority unless an I/O priority was set explicitly; on other systems os.nice() would
+        lower the priority of the whole process, so the priority is not changed. Returns False if a previous
+        compaction is still running.
+        """
+        if self._compaction_thread is not None and self._compaction_thread.is_alive():
+            return False
+
+        def compact():
+            try:
+                if 'Linux' in platform.system():
+                    try:
+                        os.nice(19)
+                    except Exception as exception:
+                        logger.verbose("Could not lower the priority of the goal state history compaction: {0}", ustr(exception))
+                if archiver is not None:
+                    archiver.purge()
+                    archiver.archive()
+                self.purge(max_size)
+            except Exception as exception:
+                logger.warn("Error compacting the goal state history: {0}", ustr(exception))
+
+        self._compaction_thread = threading.Thread(target=compact)
+        self._compaction_thread.setName("GoalStateHistoryCompaction")
+        self._compaction_thread.setDaemon(True)
+        self._compaction_thread.start()
+        return True
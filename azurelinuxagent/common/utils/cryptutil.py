@@ -19,6 +19,8 @@
 
 import base64
 import errno
+import hashlib
+import re
 import struct
 import os.path
 import subprocess
@@ -32,6 +34,85 @@ import azurelinuxagent.common.utils.shellutil as shellutil
 
 DECRYPT_SECRET_CMD = "{0} cms -decrypt -inform DER -inkey {1} -in /dev/stdin"
 
+_PEM_RE = re.compile(r'-+BEGIN ([A-Z0-9 ]+)-+\s*(.*?)\s*-+END \1-+', re.DOTALL)
+
+# DER encoding of the rsaEncryption OID (1.2.840.113549.1.1.1)
+_RSA_ENCRYPTION_OID = bytearray(b"\x2a\x86\x48\x86\xf7\x0d\x01\x01\x01")
+
+_DER_SEQUENCE = 0x30
+_DER_BIT_STRING = 0x03
+_DER_OCTET_STRING = 0x04
+_DER_INTEGER = 0x02
+_DER_OBJECT_IDENTIFIER = 0x06
+_DER_CONTEXT_0 = 0xa0
+
+
+def _read_der_element(data, offset):
+    """
+    Reads the DER element at the given offset of 'data' (a bytearray); returns a tuple with its tag and the start and
+    end offsets of its content.
+    """
+    tag = data[offset]
+    length = data[offset + 1]
+    offset += 2
+    if length & 0x80:
+        num_bytes = length & 0x7f
+        if num_bytes == 0 or num_bytes > 4:
+            raise CryptError("Unsupported DER length encoding")
+        length = 0
+        for i in range(num_bytes):
+            length = (length << 8) | data[offset + i]
+        offset += num_bytes
+    if offset + length > len(data):
+        raise CryptError("Truncated DER element")
+    return tag, offset, offset + length
+
+
+def _read_der_children(data, start, end):
+    children = []
+    while start < end:
+        tag, content_start, content_end = _read_der_element(data, start)
+        children.append((tag, content_start, content_end))
+        start = content_end
+    return children
+
+
+def _expect(element, tag):
+    if element[0] != tag:
+        raise CryptError("Unexpected DER tag {0} (expected {1})".format(element[0], tag))
+    return element
+
+
+def _get_rsa_public_numbers(data, start, private):
+    """
+    Returns the modulus and public exponent of the RSAPublicKey (or, if 'private' is True, the RSAPrivateKey) at the
+    given offset
+    """
+    integers = _read_der_children(data, *_expect(_read_der_element(data, start), _DER_SEQUENCE)[1:])
+    if private:
+        # skip the version
+        integers = integers[1:]
+    modulus = _expect(integers[0], _DER_INTEGER)
+    exponent = _expect(integers[1], _DER_INTEGER)
+    return bytes(data[modulus[1]:modulus[2]]).lstrip(b"\x00"), bytes(data[exponent[1]:exponent[2]]).lstrip(b"\x00")
+
+
+def _is_rsa_algorithm(data, algorithm):
+    oid = _expect(_read_der_children(data, algorithm[1], algorithm[2])[0], _DER_OBJECT_IDENTIFIER)
+    return data[oid[1]:oid[2]] == _RSA_ENCRYPTION_OID
+
+
+def get_der_from_pem(pem):
+    """
+    Returns the DER bytes of the first PEM block in 'pem' and its label (e.g. "CERTIFICATE" or "PRIVATE KEY"), or
+    (None, None) if 'pem' does not include a PEM block.
+    """
+    match = _PEM_RE.search(pem)
+    if match is None:
+        return None, None
+    body = "".join(match.group(2).split())
+    return match.group(1), bytearray(base64.b64decode(body))
+
 
 class CryptUtil(object):
     def __init__(self, openssl_cmd):
@@ -75,6 +156,52 @@ class CryptUtil(object):
             thumbprint = thumbprint.rstrip().split('=')[1].replace(':', '').upper()
             return thumbprint
 
+    @staticmethod
+    def get_thumbprint_from_pem(pem):
+        """
+        Returns the thumbprint (SHA-1 of the DER encoding) of the certificate in the given PEM text, formatted the
+        same as get_thumbprint_from_crt(). This does not spawn openssl.
+        """
+        label, der = get_der_from_pem(pem)
+        if label != "CERTIFICATE":
+            raise CryptError("The PEM text does not include a certificate")
+        return hashlib.sha1(bytes(der)).hexdigest().upper()
+
+    @staticmethod
+    def get_rsa_pubkey_from_pem(pem):
+        """
+        Returns the public key of the RSA certificate or private key (PKCS#1 or unencrypted PKCS#8) in the given PEM
+        text as a tuple of its modulus and public exponent, so that private keys can be matched to their certificates
+        without spawning openssl. Returns None if the key is not an RSA key.
+        """
+        label, der = get_der_from_pem(pem)
+        if der is None:
+            raise CryptError("The PEM text does not include a certificate or key")
+        try:
+            if label == "CERTIFICATE":
+                certificate = _read_der_children(der, *_expect(_read_der_element(der, 0), _DER_SEQUENCE)[1:])
+                tbs_certificate = _read_der_children(der, *_expect(certificate[0], _DER_SEQUENCE)[1:])
+                if tbs_certificate[0][0] == _DER_CONTEXT_0:
+                    tbs_certificate = tbs_certificate[1:]
+                # serialNumber, signature, issuer, validity, subject, subjectPublicKeyInfo
+                public_key_info = _read_der_children(der, *_expect(tbs_certificate[5], _DER_SEQUENCE)[1:])
+                if not _is_rsa_algorithm(der, public_key_info[0]):
+                    return None
+                bit_string = _expect(public_key_info[1], _DER_BIT_STRING)
+                # the first byte of the bit string is the number of unused bits
+                return _get_rsa_public_numbers(der, bit_string[1] + 1, private=False)
+            if label == "RSA PRIVATE KEY":
+                return _get_rsa_public_numbers(der, 0, private=True)
+            if label == "PRIVATE KEY":
+                private_key_info = _read_der_children(der, *_expect(_read_der_element(der, 0), _DER_SEQUENCE)[1:])
+                if not _is_rsa_algorithm(der, private_key_info[1]):
+                    return None
+                octet_string = _expect(private_key_info[2], _DER_OCTET_STRING)
+                return _get_rsa_public_numbers(der, octet_string[1], private=True)
+            return None
+        except IndexError:
+            raise CryptError("Invalid DER encoding for {0}".format(label))
+
     def decrypt_p7m(self, p7m_file, trans_prv_file, trans_cert_file, pem_file):
         if not os.path.exists(p7m_file):
             raise IOError(errno.ENOENT, "File not found", p7m_file)
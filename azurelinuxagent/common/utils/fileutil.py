@@ -23,6 +23,7 @@ File operation util functions
 
 import errno as errno
 import glob
+import hashlib
 import os
 import pwd
 import re
@@ -77,6 +78,45 @@ def write_file(filepath, contents, asbin=False, encoding='utf-8', append=False):
         out_file.write(data)
 
 
+def write_chunks_if_changed(filepath, get_chunks, digests, encoding='utf-8', chunk_size=64 * 1024):
+    """
+    Writes the text produced by 'get_chunks' (a function that returns an iterable of strings) to 'filepath', unless the
+    file already has that content. 'digests' is a dictionary of path -> (sha256, size) of the files written previously
+    by this function, and it is updated when the file is written. Returns True if the file was written.
+
+    The chunks are encoded in slices of at most 'chunk_size' characters. 'get_chunks' is called once to hash the
+    content and, only if the content changed, a second time to write it to a temporary file that then replaces
+    'filepath'; unchanged content is not written at all.
+    """
+    def iter_encoded_pieces():
+        for chunk in get_chunks():
+            for piece in textutil.iter_chunks(chunk, chunk_size=chunk_size):
+                yield piece.encode(encoding)
+
+    digest = hashlib.sha256()
+    size = 0
+    for data in iter_encoded_pieces():
+        digest.update(data)
+        size += len(data)
+    content_digest = (digest.hexdigest(), size)
+
+    if digests.get(filepath) == content_digest and os.path.isfile(filepath) and os.path.getsize(filepath) == size:
+        return False
+
+    temp_file = filepath + ".tmp"
+    try:
+        with open(temp_file, "wb") as out_file:
+            for data in iter_encoded_pieces():
+                out_file.write(data)
+        os.rename(temp_file, filepath)
+    except Exception:
+        if os.path.exists(temp_file):
+            os.remove(temp_file)
+        raise
+    digests[filepath] = content_digest
+    return True
+
+
 def append_file(filepath, contents, asbin=False, encoding='utf-8'):
     """
     Append 'contents' to 'filepath'.
@@ -0,0 +1,183 @@
+# Microsoft Azure Linux Agent
+#
+# Copyright 2020 Microsoft Corporation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# Requires Python 2.6+ and Openssl 1.0+
+#
+import ctypes
+import ctypes.util
+import errno
+import os
+import select
+import struct
+import threading
+
+from azurelinuxagent.common import logger
+from azurelinuxagent.common.future import ustr
+
+#
+# Constants from <sys/inotify.h>
+#
+IN_MODIFY = 0x00000002
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+
+_IN_NONBLOCK = 0o4000
+_IN_CLOEXEC = 0o2000000
+
+# struct inotify_event { int wd; uint32_t mask; uint32_t cookie; uint32_t len; char name[]; }
+_EVENT_HEADER_FORMAT = "iIII"
+_EVENT_HEADER_SIZE = struct.calcsize(_EVENT_HEADER_FORMAT)
+_READ_BUFFER_SIZE = 64 * 1024
+
+
+class DirectoryWatcher(object):
+    """
+    Watches a set of directories using inotify (through ctypes over libc) and waits for changes in them.
+
+    If inotify is not available is_available() returns False and wait() simply sleeps until its timeout, so callers
+    can fall back to polling the directories.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._libc = None
+        self._fd = None
+        self._watches = {}  # watch descriptor -> directory
+        self._directories = {}  # directory -> watch descriptor
+        self._interrupt_read, self._interrupt_write = os.pipe()
+
+        try:
+            self._libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+            fd = self._libc.inotify_init1(_IN_NONBLOCK | _IN_CLOEXEC)
+            if fd < 0:
+                raise OSError(ctypes.get_errno(), os.strerror(ctypes.get_errno()))
+            self._fd = fd
+        except (OSError, AttributeError) as e:
+            logger.info("inotify is not available, will poll the event directories: {0}", ustr(e))
+
+    def is_available(self):
+        return self._fd is not None
+
+    def watch(self, directory, mask=IN_CLOSE_WRITE | IN_MOVED_TO):
+        """
+        Starts watching the given directory for the events in 'mask'; returns False if the directory cannot be
+        watched (e.g. it does not exist). Watching a directory that is already being watched is a no-op.
+        """
+        if not self.is_available():
+            return False
+
+        with self._lock:
+            if directory in self._directories:
+                return True
+            path = directory.encode("utf-8") if isinstance(directory, ustr) else directory
+            wd = self._libc.inotify_add_watch(self._fd, ctypes.c_char_p(path), mask | IN_ONLYDIR)
+            if wd < 0:
+                error = ctypes.get_errno()
+                if error not in (errno.ENOENT, errno.ENOTDIR):
+                    logger.warn("Cannot watch {0}: {1}", directory, os.strerror(error))
+                return False
+            self._watches[wd] = directory
+            self._directories[directory] = wd
+            return True
+
+    def get_watched_directories(self):
+        with self._lock:
+            return list(self._directories.keys())
+
+    def wait(self, timeout):
+        """
+        Waits up to 'timeout' seconds for changes in the watched directories and returns the set of directories that
+        changed. Returns an empty set on timeout, or if the wait was interrupted with interrupt().
+        """
+        handles = [self._interrupt_read]
+        if self.is_available():
+            handles.append(self._fd)
+
+        try:
+            ready, _, _ = select.select(handles, [], [], max(timeout, 0))
+        except (select.error, OSError) as e:
+            if e.args[0] == errno.EINTR:
+                return set()
+            raise
+
+        if self._interrupt_read in ready:
+            os.read(self._interrupt_read, _READ_BUFFER_SIZE)
+
+        if self.is_available() and self._fd in ready:
+            return self._read_events()
+
+        return set()
+
+    def interrupt(self):
+        """
+        Makes the current (or next) call to wait() return immediately.
+        """
+        with self._lock:
+            if self._interrupt_write is not None:
+                os.write(self._interrupt_write, b"x")
+
+    def close(self):
+        with self._lock:
+            if self._fd is not None:
+                os.close(self._fd)
+                self._fd = None
+            self._watches = {}
+            self._directories = {}
+            if self._interrupt_write is not None:
+                os.close(self._interrupt_read)
+                os.close(self._interrupt_write)
+                self._interrupt_read = self._interrupt_write = None
+
+    def _read_events(self):
+        changed = set()
+
+        with self._lock:
+            while True:
+                try:
+                    data = os.read(self._fd, _READ_BUFFER_SIZE)
+                except OSError as e:
+                    if e.errno in (errno.EAGAIN, errno.EWOULDBLOCK, errno.EINTR):
+                        break
+                    raise
+                if not data:
+                    break
+
+                offset = 0
+                while offset + _EVENT_HEADER_SIZE <= len(data):
+                    wd, mask, _, length = struct.unpack_from(_EVENT_HEADER_FORMAT, data, offset)
+                    offset += _EVENT_HEADER_SIZE + length
+
+                    if mask & IN_Q_OVERFLOW:
+                        # events were lost; report all the directories as changed
+                        changed.update(self._directories.keys())
+                        continue
+
+                    directory = self._watches.get(wd)
+                    if directory is None:
+                        continue
+
+                    if mask & IN_IGNORED:
+                        # the directory was deleted (or unmounted) and the kernel removed the watch
+                        del self._watches[wd]
+                        del self._directories[directory]
+                        continue
+
+                    changed.add(directory)
+
+        return changed
@@ -100,6 +100,9 @@ REQUEST_ROLE_CONFIG_FILE_NOT_FOUND = "RequestRoleConfigFileNotFound"
 KNOWN_WIRESERVER_IP = '168.63.129.16'
 HOST_PLUGIN_PORT = 32526
 
+HTTP_CONNECTION_POOL_MAX_SIZE_PER_HOST = 4
+HTTP_CONNECTION_POOL_IDLE_TIMEOUT_IN_SECONDS = 30
+
 
 class IOErrorCounter(object):
     _lock = threading.RLock()
@@ -134,6 +137,177 @@ class IOErrorCounter(object):
         IOErrorCounter._protocol_endpoint = endpoint
 
 
+class _PooledConnection(object):
+    def __init__(self, conn):
+        self.conn = conn
+        self.response = None
+        self.in_use = True
+        self.reused = False
+        self.last_used = time.time()
+
+    def is_idle(self):
+        """
+        The connection can be used for a new request only after the response to the previous request has been
+        read completely and the server did not ask to close the connection
+        """
+        if self.in_use:
+            return False
+        return self.response is None or (self.response.isclosed() and not self.response.will_close)
+
+    def is_expired(self, now):
+        if self.in_use:
+            return False
+        if self.response is not None and self.response.isclosed() and self.response.will_close:
+            return True
+        return now - self.last_used > HTTP_CONNECTION_POOL_IDLE_TIMEOUT_IN_SECONDS
+
+    def close(self):
+        # If the caller has not finished reading the response we only drop our reference to the connection;
+        # it will be closed when the response is closed or garbage-collected.
+        if self.response is None or self.response.isclosed():
+            try:
+                self.conn.close()
+            except Exception as e:
+                logger.verbose("Error closing pooled HTTP connection: {0}", ustr(e))
+
+
+class HttpConnectionPool(object):
+    """
+    Thread-safe pool of keep-alive HTTP(S) connections, keyed by (scheme, host, port, proxy host, proxy port).
+
+    A connection is handed out to a single request at a time and can be reused only after its previous response
+    has been read completely. At most HTTP_CONNECTION_POOL_MAX_SIZE_PER_HOST connections are kept per key;
+    when that limit is reached acquire() returns None and the caller should use a one-off connection. Connections
+    that have been idle for more than HTTP_CONNECTION_POOL_IDLE_TIMEOUT_IN_SECONDS are evicted.
+    """
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._connections = {}
+
+    def acquire(self, key, create_connection):
+        """
+        Returns a _PooledConnection for the given key, reusing an idle connection if there is one, or None if the
+        pool for that key is full
+        """
+        with self._lock:
+            self._evict_expired_connections()
+
+            pooled = self._connections.setdefault(key, [])
+            for entry in pooled:
+                if entry.is_idle():
+                    entry.in_use = True
+                    entry.reused = True
+                    entry.response = None
+                    return entry
+
+            if len(pooled) >= HTTP_CONNECTION_POOL_MAX_SIZE_PER_HOST:
+                return None
+
+            entry = _PooledConnection(create_connection())
+            pooled.append(entry)
+            return entry
+
+    def release(self, entry, response):
+        """
+        Returns the connection to the pool; it becomes available once 'response' has been read completely
+        """
+        with self._lock:
+            entry.response = response
+            entry.last_used = time.time()
+            entry.in_use = False
+
+    def discard(self, key, entry):
+        """
+        Removes the connection from the pool and closes it (used when the connection failed)
+        """
+        with self._lock:
+            pooled = self._connections.get(key, [])
+            if entry in pooled:
+                pooled.remove(entry)
+            entry.response = None
+            entry.close()
+
+    def close_all(self):
+        with self._lock:
+            for pooled in self._connections.values():
+                for entry in pooled:
+                    entry.close()
+            self._connections = {}
+
+    def _evict_expired_connections(self):
+        now = time.time()
+        for key in list(self._connections.keys()):
+            expired = [entry for entry in self._connections[key] if entry.is_expired(now)]
+            for entry in expired:
+                self._connections[key].remove(entry)
+                entry.close()
+            if len(self._connections[key]) == 0:
+                del self._connections[key]
+
+
+_HTTP_CONNECTION_POOL = HttpConnectionPool()
+
+
+def get_http_connection_pool():
+    return _HTTP_CONNECTION_POOL
+
+
+class TokenBucket(object):
+    """
+    Thread-safe token bucket that limits requests to 'rate' per second with bursts of up to 'capacity' requests.
+
+    acquire() reserves a token and returns the number of seconds the caller needs to wait before issuing its request
+    (0 if a token was available); the balance of the bucket can go negative, so that waiting callers are served in
+    order.
+    """
+    def __init__(self, rate, capacity):
+        self._lock = threading.Lock()
+        self._rate = float(rate)
+        self._capacity = float(capacity)
+        self._tokens = self._capacity
+        self._last_refill = time.time()
+
+    def configure(self, rate, capacity):
+        """
+        Changes the rate and capacity of the bucket; a no-op if they did not change
+        """
+        with self._lock:
+            if self._rate != rate or self._capacity != capacity:
+                self._rate = float(rate)
+                self._capacity = float(capacity)
+                self._tokens = self._capacity
+                self._last_refill = time.time()
+
+    def acquire(self):
+        with self._lock:
+            now = time.time()
+            self._tokens = min(self._capacity, self._tokens + (now - self._last_refill) * self._rate)
+            self._last_refill = now
+            self._tokens -= 1
+            if self._tokens >= 0:
+                return 0
+            return -self._tokens / self._rate
+
+
+_WIRESERVER_TOKEN_BUCKET = TokenBucket(1, 1)
+
+
+def _wait_for_wireserver_token(host):
+    """
+    Delays requests to the WireServer and the HostGAPlugin (which share the same address) according to
+    Debug.WireServerRequestRate and Debug.WireServerRequestBurst
+    """
+    rate = conf.get_wireserver_request_rate()
+    if rate <= 0 or host not in (KNOWN_WIRESERVER_IP, IOErrorCounter._protocol_endpoint):  # pylint: disable=protected-access
+        return
+
+    _WIRESERVER_TOKEN_BUCKET.configure(rate, max(1, conf.get_wireserver_request_burst()))
+    delay = _WIRESERVER_TOKEN_BUCKET.acquire()
+    if delay > 0:
+        logger.verbose("[HTTP] Delaying request to {0} by {1:.2f} seconds to stay within the request rate", host, delay)
+        time.sleep(delay)
+
+
 def _compute_delay(retry_attempt=1, delay=DELAY_IN_SECONDS):
     fib = (1, 1)
     for _ in range(retry_attempt):
@@ -300,11 +474,24 @@ def redact_sas_tokens_in_urls(url):
     return SAS_TOKEN_RETRIEVAL_REGEX.sub(r"\1" + REDACTED_TEXT + r"\3", url)
 
 
+def _create_connection(host, port, secure, conn_host, conn_port, use_proxy):
+    if secure:
+        conn = httpclient.HTTPSConnection(conn_host,
+                                          conn_port,
+                                          timeout=10)
+        if use_proxy:
+            conn.set_tunnel(host, port)
+    else:
+        conn = httpclient.HTTPConnection(conn_host,
+                                         conn_port,
+                                         timeout=10)
+    return conn
+
+
 def _http_request(method, host, rel_uri, port=None, data=None, secure=False,
                   headers=None, proxy_host=None, proxy_port=None, redact_data=False):
 
     headers = {} if headers is None else headers
-    headers['Connection'] = 'close'
 
     use_proxy = proxy_host is not None and proxy_port is not None
 
@@ -314,24 +501,29 @@ def _http_request(method, host, rel_uri, port=None, data=None, secure=False,
     if 'User-Agent' not in headers:
         headers['User-Agent'] = HTTP_USER_AGENT
 
+    scheme = "https" if secure else "http"
+
     if use_proxy:
         conn_host, conn_port = proxy_host, proxy_port
-        scheme = "https" if secure else "http"
         url = "{0}://{1}:{2}{3}".format(scheme, host, port, rel_uri)
     else:
         conn_host, conn_port = host, port
         url = rel_uri
 
-    if secure:
-        conn = httpclient.HTTPSConnection(conn_host,
-                                          conn_port,
-                                          timeout=10)
-        if use_proxy:
-            conn.set_tunnel(host, port)
+    def create_connection():
+        return _create_connection(host, port, secure, conn_host, conn_port, use_proxy)
+
+    pool_key = (scheme, host, port, proxy_host, proxy_port)
+    pooled = None
+    if conf.get_enable_http_connection_pool():
+        pooled = _HTTP_CONNECTION_POOL.acquire(pool_key, create_connection)
+
+    if pooled is None:
+        headers['Connection'] = 'close'
+        conn = create_connection()
     else:
-        conn = httpclient.HTTPConnection(conn_host,
-                                         conn_port,
-                                         timeout=10)
+        headers.pop('Connection', None)
+        conn = pooled.conn
 
     payload = data
     if redact_data:
@@ -344,8 +536,26 @@ def _http_request(method, host, rel_uri, port=None, data=None, secure=False,
                    textutil.str_to_encoded_ustr(payload),
                    headers)
 
-    conn.request(method=method, url=url, body=data, headers=headers)
-    return conn.getresponse()
+    if pooled is None:
+        conn.request(method=method, url=url, body=data, headers=headers)
+        return conn.getresponse()
+
+    try:
+        conn.request(method=method, url=url, body=data, headers=headers)
+        resp = conn.getresponse()
+    except (httpclient.HTTPException, IOError) as e:
+        _HTTP_CONNECTION_POOL.discard(pool_key, pooled)
+        if not pooled.reused:
+            raise
+        # The server (or some middlebox) may have closed the idle connection; retry once on a fresh connection
+        logger.verbose("Pooled HTTP connection to [{0}:{1}] failed ({2}); retrying on a new connection", conn_host, conn_port, ustr(e))
+        headers['Connection'] = 'close'
+        conn = create_connection()
+        conn.request(method=method, url=url, body=data, headers=headers)
+        return conn.getresponse()
+
+    _HTTP_CONNECTION_POOL.release(pooled, resp)
+    return resp
 
 
 def http_request(method,
@@ -426,6 +636,8 @@ def http_request(method,
 
         attempt += 1
 
+        _wait_for_wireserver_token(host)
+
         try:
             resp = _http_request(method,
                                  host,
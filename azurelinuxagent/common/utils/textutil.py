@@ -26,6 +26,7 @@ import struct
 import sys
 import traceback
 import xml.dom.minidom as minidom
+import xml.etree.ElementTree as ElementTree
 import zlib
 
 from azurelinuxagent.common.future import ustr
@@ -41,6 +42,74 @@ def parse_doc(xml_text):
     return minidom.parseString(xml_text)
 
 
+class _Utf8Reader(object):
+    """
+    File-like object that returns the given string encoded as utf-8, a chunk at a time (so that the encoded document
+    does not need to be kept in memory while parsing)
+    """
+    def __init__(self, text):
+        self._text = text
+        self._position = 0
+
+    def read(self, size=-1):
+        if size is None or size < 0:
+            size = len(self._text) - self._position
+        chunk = self._text[self._position:self._position + size]
+        self._position += len(chunk)
+        return chunk.encode('utf-8')
+
+
+def iterparse_doc(xml_text):
+    """
+    Parse xml document from string in a single pass using ElementTree.iterparse. Yields a tuple (event, element,
+    ancestors) at the start ("start" event) and at the end ("end" event) of each element; 'ancestors' is the list of
+    the ancestors of the element, starting at the root, and must not be modified by the caller.
+
+    The elements can be used with findall(), find(), gettext() and getattrib(). Note that, unlike minidom, ElementTree
+    does not distinguish CDATA sections from text, so gettext() includes their content.
+    """
+    ancestors = []
+    for event, element in ElementTree.iterparse(_Utf8Reader(xml_text), events=("start", "end")):
+        if event == "start":
+            yield event, element, ancestors
+            ancestors.append(element)
+        else:
+            ancestors.pop()
+            yield event, element, ancestors
+
+
+def get_local_name(element):
+    """
+    Get the tag of an ElementTree element, without its namespace
+    """
+    tag = element.tag
+    return tag[tag.index('}') + 1:] if tag.startswith('{') else tag
+
+
+def _etree_iter(root):
+    # Element.iter() is not available in Python 2.6
+    return root.iter() if hasattr(root, "iter") else root.getiterator()
+
+
+def _etree_findall(root, tag, namespace):
+    # Same semantics as minidom's getElementsByTagName: all the descendants of root (excluding root itself) in
+    # document order
+    if namespace is None:
+        return [node for node in _etree_iter(root) if node is not root and get_local_name(node) == tag]
+    qualified_tag = "{{{0}}}{1}".format(namespace, tag)
+    return [node for node in _etree_iter(root) if node is not root and node.tag == qualified_tag]
+
+
+def _etree_gettext(node):
+    # Same semantics as gettext() on minidom nodes: the first text node in the children of the element
+    if node.text is not None:
+        return node.text
+    for child in node:
+        if child.tail is not None:
+            return child.tail
+    return None
+
+
 def findall(root, tag, namespace=None):
     """
     Get all nodes by tag and namespace under Node root.
@@ -48,6 +117,9 @@ def findall(root, tag, namespace=None):
     if root is None:
         return []
 
+    if ElementTree.iselement(root):
+        return _etree_findall(root, tag, namespace)
+
     if namespace is None:
         return root.getElementsByTagName(tag)
     else:
@@ -72,6 +144,9 @@ def gettext(node):
     if node is None:
         return None
 
+    if ElementTree.iselement(node):
+        return _etree_gettext(node)
+
     for child in node.childNodes:
         if child.nodeType == child.TEXT_NODE:
             return child.data
@@ -91,6 +166,9 @@ def getattrib(node, attr_name):
     Get attribute of xml node
     """
     if node is not None:
+        if ElementTree.iselement(node):
+            # minidom returns an empty string for attributes that do not exist
+            return node.get(attr_name, "")
         return node.getAttribute(attr_name)
     else:
         return None
@@ -367,6 +445,32 @@ def parse_json(json_str):
     return result
 
 
+def iter_chunks(text, start=0, end=None, chunk_size=64 * 1024):
+    """
+    Yields text[start:end] in slices of at most 'chunk_size' characters
+    """
+    end = len(text) if end is None else end
+    while start < end:
+        yield text[start:min(start + chunk_size, end)]
+        start += chunk_size
+
+
+def iter_redacted_text(text, pattern, replacement, chunk_size=64 * 1024):
+    """
+    Yields the text between the matches of 'pattern' (a compiled regular expression), in slices of at most 'chunk_size'
+    characters, and, in place of each match, 'replacement' expanded with the groups of the match. The concatenation of
+    the slices is the same as pattern.sub(replacement, text), but no copy of the entire text is created.
+    """
+    start = 0
+    for match in pattern.finditer(text):
+        for chunk in iter_chunks(text, start, match.start(), chunk_size):
+            yield chunk
+        yield match.expand(replacement)
+        start = match.end()
+    for chunk in iter_chunks(text, start, chunk_size=chunk_size):
+        yield chunk
+
+
 def is_str_none_or_whitespace(s):
     return s is None or len(s) == 0 or s.isspace()
 
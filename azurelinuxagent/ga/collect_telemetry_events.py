@@ -29,12 +29,14 @@ from azurelinuxagent.common.agent_supported_feature import get_supported_feature
 from azurelinuxagent.common.event import EVENTS_DIRECTORY, TELEMETRY_LOG_EVENT_ID, \
     TELEMETRY_LOG_PROVIDER_ID, add_event, WALAEventOperation, add_log_event, get_event_logger, \
     CollectOrReportEventDebugInfo, EVENT_FILE_REGEX, parse_event
+from azurelinuxagent.common.event_spool import EventSpool
 from azurelinuxagent.common.exception import InvalidExtensionEventError, ServiceStoppedError
 from azurelinuxagent.common.future import ustr
 from azurelinuxagent.common.interfaces import ThreadHandlerInterface
-from azurelinuxagent.common.telemetryevent import TelemetryEvent, TelemetryEventParam, \
+from azurelinuxagent.common.telemetryevent import TelemetryEvent, \
     GuestAgentGenericLogsSchema, GuestAgentExtensionEventsSchema
 from azurelinuxagent.common.utils import textutil
+from azurelinuxagent.common.utils.inotifyutil import DirectoryWatcher, IN_CLOSE_WRITE, IN_CREATE, IN_MODIFY, IN_MOVED_TO
 from azurelinuxagent.ga.exthandlers import HANDLER_NAME_PATTERN
 from azurelinuxagent.ga.periodic_operation import PeriodicOperation
 
@@ -43,6 +45,16 @@ def get_collect_telemetry_events_handler(send_telemetry_events_handler):
     return CollectTelemetryEventsHandler(send_telemetry_events_handler)
 
 
+def _get_delivery_ledger(send_telemetry_events_handler):
+    """
+    Returns the EventDeliveryLedger of the send handler, or None if the event files should be deleted as soon as their
+    events are enqueued.
+    """
+    if not conf.get_enable_telemetry_delivery_ledger():
+        return None
+    return send_telemetry_events_handler.get_delivery_ledger()
+
+
 class ExtensionEventSchema(object):
     """
     Class for defining the schema for Extension Events.
@@ -85,9 +97,10 @@ class _ProcessExtensionEvents(PeriodicOperation):
 
     _EXTENSION_EVENT_REQUIRED_FIELDS = [attr.lower() for attr in dir(ExtensionEventSchema) if
                                         not callable(getattr(ExtensionEventSchema, attr)) and not attr.startswith("__")]
+    _EXTENSION_EVENT_REQUIRED_FIELDS_SET = frozenset(_EXTENSION_EVENT_REQUIRED_FIELDS)
 
-    def __init__(self, send_telemetry_events_handler):
-        super(_ProcessExtensionEvents, self).__init__(_ProcessExtensionEvents._EXTENSION_EVENT_COLLECTION_PERIOD)
+    def __init__(self, send_telemetry_events_handler, period=_EXTENSION_EVENT_COLLECTION_PERIOD):
+        super(_ProcessExtensionEvents, self).__init__(period)
         self._send_telemetry_events_handler = send_telemetry_events_handler
 
     def _operation(self):
@@ -99,6 +112,7 @@ class _ProcessExtensionEvents(PeriodicOperation):
 
         delete_all_event_files = True
         extension_handler_with_event_dirs = []
+        delivery_ledger = _get_delivery_ledger(self._send_telemetry_events_handler)
 
         try:
             extension_handler_with_event_dirs = self._get_extension_events_dir_with_handler_name(conf.get_ext_log_dir())
@@ -110,7 +124,7 @@ class _ProcessExtensionEvents(PeriodicOperation):
             for extension_handler_with_event_dir in extension_handler_with_event_dirs:
                 handler_name = extension_handler_with_event_dir[0]
                 handler_event_dir_path = extension_handler_with_event_dir[1]
-                self._capture_extension_events(handler_name, handler_event_dir_path)
+                self._capture_extension_events(handler_name, handler_event_dir_path, delivery_ledger)
         except ServiceStoppedError:
             # Since the service stopped, we should not delete the extension files and retry sending them whenever
             # the telemetry service comes back up
@@ -123,7 +137,7 @@ class _ProcessExtensionEvents(PeriodicOperation):
             # Always ensure that the events directory are being deleted each run except when Telemetry Service is stopped,
             # even if we run into an error and dont process them this run.
             if delete_all_event_files:
-                self._ensure_all_events_directories_empty(extension_handler_with_event_dirs)
+                self._ensure_all_events_directories_empty(extension_handler_with_event_dirs, delivery_ledger)
 
     @staticmethod
     def _get_extension_events_dir_with_handler_name(extension_log_dir):
@@ -160,11 +174,12 @@ class _ProcessExtensionEvents(PeriodicOperation):
             return False
         return True
 
-    def _capture_extension_events(self, handler_name, handler_event_dir_path):
+    def _capture_extension_events(self, handler_name, handler_event_dir_path, delivery_ledger=None):
         """
         Capture Extension events and add them to the events_list
         :param handler_name: Complete Handler Name. Eg: Microsoft.CPlat.Core.RunCommandLinux
         :param handler_event_dir_path: Full path. Eg: '/var/log/azure/Microsoft.CPlat.Core.RunCommandLinux/events'
+        :param delivery_ledger: If not None, the event files are deleted by the ledger once their events are sent
         """
 
         # Filter out the files that do not follow the pre-defined EXTENSION_EVENT_FILE_NAME_REGEX
@@ -180,6 +195,13 @@ class _ProcessExtensionEvents(PeriodicOperation):
             for event_file in event_files:
 
                 event_file_path = os.path.join(handler_event_dir_path, event_file)
+
+                if delivery_ledger is not None:
+                    if delivery_ledger.is_pending(event_file_path):
+                        continue
+                    delivery_ledger.begin(event_file_path)
+
+                service_stopped = False
                 try:
                     logger.verbose("Processing event file: {0}", event_file_path)
 
@@ -189,7 +211,8 @@ class _ProcessExtensionEvents(PeriodicOperation):
                     # We support multiple events in a file, read the file and parse events.
                     captured_extension_events_count = self._enqueue_events_and_get_count(handler_name, event_file_path,
                                                                                          captured_extension_events_count,
-                                                                                         dropped_events_with_error_count)
+                                                                                         dropped_events_with_error_count,
+                                                                                         delivery_ledger)
 
                     # We only allow MAX_NUMBER_OF_EVENTS_PER_EXTENSION_PER_PERIOD=300 maximum events per period per handler
                     if captured_extension_events_count >= self._MAX_NUMBER_OF_EVENTS_PER_EXTENSION_PER_PERIOD:
@@ -202,6 +225,8 @@ class _ProcessExtensionEvents(PeriodicOperation):
                     # Not logging here as already logged once, re-raising
                     # Since we already started processing this file, deleting it as we could've already sent some events out
                     # This is a trade-off between data replication vs data loss.
+                    # (When using the delivery ledger the file is kept and collected again on the next run)
+                    service_stopped = True
                     raise
                 except Exception as error:
                     msg = "Failed to process event file {0}:{1}".format(event_file,
@@ -209,10 +234,14 @@ class _ProcessExtensionEvents(PeriodicOperation):
                     logger.warn(msg)
                     add_log_event(level=logger.LogLevel.WARNING, message=msg, forced=True)
                 finally:
-                    # Todo: We should delete files after ensuring that we sent the data to Wireserver successfully
-                    # from our end rather than deleting first and sending later. This is to ensure the data reliability
-                    # of the agent telemetry pipeline.
-                    os.remove(event_file_path)
+                    # Without the delivery ledger, the file is deleted before its events are sent; the ledger deletes
+                    # it only after the events are sent successfully.
+                    if delivery_ledger is None:
+                        os.remove(event_file_path)
+                    elif service_stopped:
+                        delivery_ledger.abort(event_file_path)
+                    else:
+                        delivery_ledger.end(event_file_path)
 
         finally:
             if dropped_events_with_error_count:
@@ -225,7 +254,7 @@ class _ProcessExtensionEvents(PeriodicOperation):
                 logger.info("Collected {0} events for extension: {1}".format(captured_extension_events_count, handler_name))
 
     @staticmethod
-    def _ensure_all_events_directories_empty(extension_events_directories):
+    def _ensure_all_events_directories_empty(extension_events_directories, delivery_ledger=None):
         if not extension_events_directories:
             return
 
@@ -237,8 +266,12 @@ class _ProcessExtensionEvents(PeriodicOperation):
             log_err = True
             # Delete any residue files in the events directory
             for residue_file in os.listdir(event_dir_path):
+                residue_file_path = os.path.join(event_dir_path, residue_file)
+                # Keep the files whose events are being sent (or will be retried)
+                if delivery_ledger is not None and delivery_ledger.is_pending(residue_file_path):
+                    continue
                 try:
-                    os.remove(os.path.join(event_dir_path, residue_file))
+                    os.remove(residue_file_path)
                 except Exception as error:
                     # Only log the first error once per handler per run to keep the logfile clean
                     if log_err:
@@ -247,7 +280,7 @@ class _ProcessExtensionEvents(PeriodicOperation):
                         log_err = False
 
     def _enqueue_events_and_get_count(self, handler_name, event_file_path, captured_events_count,
-                                      dropped_events_with_error_count):
+                                      dropped_events_with_error_count, delivery_ledger=None):
 
         event_file_time = datetime.datetime.fromtimestamp(os.path.getmtime(event_file_path))
 
@@ -265,9 +298,10 @@ class _ProcessExtensionEvents(PeriodicOperation):
 
         for event in events:
             try:
-                self._send_telemetry_events_handler.enqueue_event(
-                    self._parse_telemetry_event(handler_name, event, event_file_time)
-                )
+                telemetry_event = self._parse_telemetry_event(handler_name, event, event_file_time)
+                if delivery_ledger is not None:
+                    delivery_ledger.track(event_file_path, telemetry_event)
+                self._send_telemetry_events_handler.enqueue_event(telemetry_event)
                 captured_events_count += 1
             except InvalidExtensionEventError as invalid_error:
                 # These are the errors thrown if there's an error parsing the event. We want to report these back to the
@@ -324,15 +358,16 @@ class _ProcessExtensionEvents(PeriodicOperation):
         :return: Verified Json event that qualifies the contract.
         """
 
-        clean_string = lambda x: x.strip() if x is not None else x
-
         event_size = 0
         key_err_msg = "{0}: {1} not found"
 
         # Convert the dict to all lower keys to avoid schema confusion.
         # Only pick the params that we care about and skip the rest.
-        event = dict((k.lower(), clean_string(v)) for k, v in extension_event.items() if
-                     k.lower() in self._EXTENSION_EVENT_REQUIRED_FIELDS)
+        event = {}
+        for key, value in extension_event.items():
+            key = key.lower()
+            if key in self._EXTENSION_EVENT_REQUIRED_FIELDS_SET:
+                event[key] = value.strip() if value is not None else value
 
         # Trim message and only pick the first 3k chars
         message_key = ExtensionEventSchema.Message.lower()
@@ -365,17 +400,8 @@ class _ProcessExtensionEvents(PeriodicOperation):
 
     @staticmethod
     def _replace_or_add_param_in_event(event, replace_or_add_params):
-        for param in event.parameters:
-            if param.name in replace_or_add_params:
-                param.value = replace_or_add_params.pop(param.name)
-
-        if not replace_or_add_params:
-            # All values replaced, return
-            return
-
-        # Add the remaining params to the event
-        for param_name in replace_or_add_params:
-            event.parameters.append(TelemetryEventParam(param_name, replace_or_add_params[param_name]))
+        for param_name, param_value in replace_or_add_params.items():
+            event.set_param_value(param_name, param_value)
 
 
 class _CollectAndEnqueueEvents(PeriodicOperation):
@@ -386,8 +412,8 @@ class _CollectAndEnqueueEvents(PeriodicOperation):
 
     _EVENT_COLLECTION_PERIOD = datetime.timedelta(minutes=1)
 
-    def __init__(self, send_telemetry_events_handler):
-        super(_CollectAndEnqueueEvents, self).__init__(_CollectAndEnqueueEvents._EVENT_COLLECTION_PERIOD)
+    def __init__(self, send_telemetry_events_handler, period=_EVENT_COLLECTION_PERIOD):
+        super(_CollectAndEnqueueEvents, self).__init__(period)
         self._send_telemetry_events_handler = send_telemetry_events_handler
 
     def _operation(self):
@@ -412,6 +438,9 @@ class _CollectAndEnqueueEvents(PeriodicOperation):
         event_directory_full_path = os.path.join(conf.get_lib_dir(), EVENTS_DIRECTORY)
         event_files = os.listdir(event_directory_full_path)
         debug_info = CollectOrReportEventDebugInfo(operation=CollectOrReportEventDebugInfo.OP_COLLECT)
+        delivery_ledger = _get_delivery_ledger(self._send_telemetry_events_handler)
+
+        self._process_spooled_events(event_directory_full_path, event_files, debug_info, delivery_ledger)
 
         for event_file in event_files:
             try:
@@ -421,6 +450,12 @@ class _CollectAndEnqueueEvents(PeriodicOperation):
 
                 event_file_path = os.path.join(event_directory_full_path, event_file)
 
+                if delivery_ledger is not None:
+                    if delivery_ledger.is_pending(event_file_path):
+                        continue
+                    delivery_ledger.begin(event_file_path)
+
+                service_stopped = False
                 try:
                     logger.verbose("Processing event file: {0}", event_file_path)
 
@@ -446,12 +481,21 @@ class _CollectAndEnqueueEvents(PeriodicOperation):
                             _CollectAndEnqueueEvents._update_legacy_agent_event(event,
                                                                                 event_file_creation_time)
 
+                    if delivery_ledger is not None:
+                        delivery_ledger.track(event_file_path, event)
                     self._send_telemetry_events_handler.enqueue_event(event)
+                except ServiceStoppedError:
+                    service_stopped = True
+                    raise
                 finally:
-                    # Todo: We should delete files after ensuring that we sent the data to Wireserver successfully
-                    # from our end rather than deleting first and sending later. This is to ensure the data reliability
-                    # of the agent telemetry pipeline.
-                    os.remove(event_file_path)
+                    # Without the delivery ledger, the file is deleted before its event is sent; the ledger deletes
+                    # it only after the event is sent successfully.
+                    if delivery_ledger is None:
+                        os.remove(event_file_path)
+                    elif service_stopped:
+                        delivery_ledger.abort(event_file_path)
+                    else:
+                        delivery_ledger.end(event_file_path)
             except ServiceStoppedError as stopped_error:
                 logger.error(
                     "Unable to enqueue events as service stopped: {0}, skipping events collection".format(
@@ -463,21 +507,56 @@ class _CollectAndEnqueueEvents(PeriodicOperation):
 
         debug_info.report_debug_info()
 
+    def _process_spooled_events(self, event_directory_full_path, event_files, debug_info, delivery_ledger=None):
+        """
+        Streams the events in the spool segments (see EventSpool) into the send queue. Events in the spool are
+        always created by the current agent, so they do not need the processing done for legacy events.
+        """
+        try:
+            for segment_path in EventSpool.claim_segments(event_directory_full_path, event_files):
+                if delivery_ledger is not None:
+                    if delivery_ledger.is_pending(segment_path):
+                        continue
+                    delivery_ledger.begin(segment_path)
+
+                try:
+                    for event_data in EventSpool.read_segment(segment_path):
+                        try:
+                            event = parse_event(event_data.decode("utf-8"))
+                            if delivery_ledger is not None:
+                                delivery_ledger.track(segment_path, event)
+                            self._send_telemetry_events_handler.enqueue_event(event)
+                        except ServiceStoppedError:
+                            raise
+                        except UnicodeError as uni_err:
+                            debug_info.update_unicode_error(uni_err)
+                        except Exception as error:
+                            debug_info.update_op_error(error)
+                except Exception:
+                    # the segment is left in the spool and its events are collected again on the next run
+                    if delivery_ledger is not None:
+                        delivery_ledger.abort(segment_path)
+                    raise
+
+                if delivery_ledger is None:
+                    os.remove(segment_path)
+                else:
+                    delivery_ledger.end(segment_path)
+        except ServiceStoppedError as stopped_error:
+            logger.error(
+                "Unable to enqueue events as service stopped: {0}, skipping events collection".format(
+                    ustr(stopped_error)))
+        except Exception as error:
+            debug_info.update_op_error(error)
+
     @staticmethod
     def _update_legacy_agent_event(event, event_creation_time):
         # Ensure that if an agent event is missing a field from the schema defined since 2.2.47, the missing fields
         # will be appended, ensuring the event schema is complete before the event is reported.
         new_event = TelemetryEvent()
-        new_event.parameters = []
         CollectTelemetryEventsHandler.add_common_params_to_telemetry_event(new_event, event_creation_time)
 
-        event_params = dict([(param.name, param.value) for param in event.parameters])
-        new_event_params = dict([(param.name, param.value) for param in new_event.parameters])
-
-        missing_params = set(new_event_params.keys()).difference(set(event_params.keys()))
-        params_to_add = []
-        for param_name in missing_params:
-            params_to_add.append(TelemetryEventParam(param_name, new_event_params[param_name]))
+        params_to_add = [param for param in new_event.parameters if param.name not in event]
 
         event.parameters.extend(params_to_add)
 
@@ -517,10 +596,18 @@ class CollectTelemetryEventsHandler(ThreadHandlerInterface):
 
     _THREAD_NAME = "TelemetryEventsCollector"
 
+    # When the event directories are watched with inotify, the collection operations run when new events are written
+    # (but not more often than the minimum intervals below) and their periods are only a safety net.
+    _COLLECTION_PERIOD_WHEN_WATCHING = datetime.timedelta(minutes=30)
+    _MIN_EVENT_COLLECTION_INTERVAL = datetime.timedelta(seconds=10)
+    # The limit on extension events is per collection period, so do not collect them more often than that
+    _MIN_EXTENSION_EVENT_COLLECTION_INTERVAL = _ProcessExtensionEvents._EXTENSION_EVENT_COLLECTION_PERIOD
+
     def __init__(self, send_telemetry_events_handler):
         self.should_run = True
         self.thread = None
         self._send_telemetry_events_handler = send_telemetry_events_handler
+        self._watcher = None
 
     @staticmethod
     def get_thread_name():
@@ -544,6 +631,8 @@ class CollectTelemetryEventsHandler(ThreadHandlerInterface):
         Stop server communication and join the thread to main thread.
         """
         self.should_run = False
+        if self._watcher is not None:
+            self._watcher.interrupt()
         if self.is_alive():
             self.thread.join()
 
@@ -551,27 +640,87 @@ class CollectTelemetryEventsHandler(ThreadHandlerInterface):
         return not self.should_run
 
     def daemon(self):
-        periodic_operations = [
-            _CollectAndEnqueueEvents(self._send_telemetry_events_handler)
-        ]
+        if conf.get_enable_event_directory_watcher():
+            self._watcher = DirectoryWatcher()
+            if not self._watcher.is_available():
+                self._watcher.close()
+                self._watcher = None
+        logger.info("Watching the event directories: {0}".format(self._watcher is not None))
+
+        if self._watcher is None:
+            collect_events = _CollectAndEnqueueEvents(self._send_telemetry_events_handler)
+        else:
+            collect_events = _CollectAndEnqueueEvents(self._send_telemetry_events_handler, period=self._COLLECTION_PERIOD_WHEN_WATCHING)
+        periodic_operations = [collect_events]
+        process_extension_events = None
 
         is_etp_enabled = get_supported_feature_by_name(SupportedFeatureNames.ExtensionTelemetryPipeline).is_supported
         logger.info("Extension Telemetry pipeline enabled: {0}".format(is_etp_enabled))
         if is_etp_enabled:
-            periodic_operations.append(_ProcessExtensionEvents(self._send_telemetry_events_handler))
+            if self._watcher is None:
+                process_extension_events = _ProcessExtensionEvents(self._send_telemetry_events_handler)
+            else:
+                process_extension_events = _ProcessExtensionEvents(self._send_telemetry_events_handler, period=self._COLLECTION_PERIOD_WHEN_WATCHING)
+            periodic_operations.append(process_extension_events)
 
         logger.info("Successfully started the {0} thread".format(self.get_thread_name()))
-        while not self.stopped():
-            try:
-                for periodic_op in periodic_operations:
-                    periodic_op.run()
+        try:
+            while not self.stopped():
+                try:
+                    # watch the directories before collecting the events in them, so that no changes are missed
+                    if self._watcher is not None:
+                        self._watch_event_directories(process_extension_events is not None)
 
-            except Exception as error:
-                logger.warn(
-                    "An error occurred in the Telemetry Extension thread main loop; will skip the current iteration.\n{0}",
-                    ustr(error))
-            finally:
-                PeriodicOperation.sleep_until_next_operation(periodic_operations)
+                    for periodic_op in periodic_operations:
+                        periodic_op.run()
+
+                except Exception as error:
+                    logger.warn(
+                        "An error occurred in the Telemetry Extension thread main loop; will skip the current iteration.\n{0}",
+                        ustr(error))
+                finally:
+                    if self._watcher is None:
+                        PeriodicOperation.sleep_until_next_operation(periodic_operations)
+                    else:
+                        self._wait_for_events(periodic_operations, collect_events, process_extension_events)
+        finally:
+            if self._watcher is not None:
+                self._watcher.close()
+
+    def _watch_event_directories(self, watch_extension_events):
+        # the agent's event spool appends to its active segment without closing it, so watch for writes too
+        self._watcher.watch(os.path.join(conf.get_lib_dir(), EVENTS_DIRECTORY), IN_CLOSE_WRITE | IN_MOVED_TO | IN_MODIFY)
+        if watch_extension_events and os.path.isdir(conf.get_ext_log_dir()):
+            # the event directories of the extensions installed after this call do not exist yet; watch the extension
+            # log directory and the directories of the handlers for new subdirectories, so that the loop wakes up and
+            # watches the new event directories as soon as they are created
+            self._watcher.watch(conf.get_ext_log_dir(), IN_CREATE | IN_MOVED_TO)
+            for handler_directory in os.listdir(conf.get_ext_log_dir()):
+                handler_directory = os.path.join(conf.get_ext_log_dir(), handler_directory)
+                if os.path.isdir(handler_directory):
+                    self._watcher.watch(handler_directory, IN_CREATE | IN_MOVED_TO)
+            for _, extension_events_directory in _ProcessExtensionEvents._get_extension_events_dir_with_handler_name(conf.get_ext_log_dir()):
+                self._watcher.watch(extension_events_directory)
+
+    def _wait_for_events(self, periodic_operations, collect_events, process_extension_events):
+        """
+        Waits until the next periodic operation is due or new events are written to the event directories; in the
+        latter case, the corresponding operation is expedited.
+        """
+        try:
+            events_directory = os.path.join(conf.get_lib_dir(), EVENTS_DIRECTORY)
+            timeout = PeriodicOperation.get_seconds_until_next_operation(periodic_operations)
+            if timeout <= 0:
+                return
+
+            for directory in self._watcher.wait(timeout):
+                if directory == events_directory:
+                    collect_events.expedite(self._MIN_EVENT_COLLECTION_INTERVAL)
+                elif process_extension_events is not None:
+                    process_extension_events.expedite(self._MIN_EXTENSION_EVENT_COLLECTION_INTERVAL)
+        except Exception as error:
+            logger.warn("Error waiting for changes in the event directories, will poll them instead: {0}", ustr(error))
+            PeriodicOperation.sleep_until_next_operation(periodic_operations)
 
     @staticmethod
     def add_common_params_to_telemetry_event(event, event_time):
@@ -31,7 +31,7 @@ from azurelinuxagent.common.future import ustr
 from azurelinuxagent.common.interfaces import ThreadHandlerInterface
 from azurelinuxagent.common.osutil import get_osutil
 from azurelinuxagent.common.protocol.util import get_protocol_util
-from azurelinuxagent.common.utils.archive import StateArchiver
+from azurelinuxagent.common.utils.archive import StateArchiver, GoalStateHistoryStore
 from azurelinuxagent.common.version import AGENT_NAME, CURRENT_VERSION
 from azurelinuxagent.ga.periodic_operation import PeriodicOperation
 
@@ -103,11 +103,15 @@ class CleanupGoalStateHistory(PeriodicOperation):
     def __init__(self):
         super(CleanupGoalStateHistory, self).__init__(conf.get_goal_state_history_cleanup_period())
         self.archiver = StateArchiver(conf.get_lib_dir())
+        self.history_store = GoalStateHistoryStore(conf.get_lib_dir())
 
     def _operation(self):
         """
         Purge history and create a .zip of the history that has been preserved.
         """
+        if conf.get_enable_goal_state_history_store():
+            self.history_store.start_compaction(conf.get_goal_state_history_max_size_kb() * 1024, archiver=self.archiver)
+            return
         self.archiver.purge()
         self.archiver.archive()
 
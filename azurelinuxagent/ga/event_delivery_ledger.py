@@ -0,0 +1,170 @@
+# Microsoft Azure Linux Agent
+#
+# Copyright 2020 Microsoft Corporation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# Requires Python 2.6+ and Openssl 1.0+
+#
+import datetime
+import errno
+import os
+import threading
+
+import azurelinuxagent.common.logger as logger
+from azurelinuxagent.common.future import ustr
+
+
+class _Source(object):
+    def __init__(self):
+        self.pending = 0
+        self.events = set()
+        self.complete = False
+        self.failed = False
+        self.failed_attempts = 0
+        self.start_time = None
+        self.retry_time = None
+
+    def in_flight(self):
+        return self.retry_time is None
+
+
+class EventDeliveryLedger(object):
+    """
+    Tracks the delivery of the events collected from disk (event files and spool segments) so that a source file is
+    deleted only after all its events have been sent to the WireServer (at-least-once delivery).
+
+    The collectors call begin() before enqueueing the events of a source, track() for each event before enqueueing
+    it, and end() once all the events of the source have been enqueued (or abort() if the collection was interrupted
+    and the source should be collected again on the next run). The sender calls ack() for the events that were sent,
+    or that were dropped because they can never be sent (e.g. they are too large), and nack() for the events that
+    could not be sent.
+
+    Once all the events of a source are acknowledged the source is deleted. If any of them failed, the source is kept
+    on disk and is_pending() returns True until its retry time, which backs off exponentially with the number of
+    failed attempts; after _MAX_DELIVERY_ATTEMPTS the source is deleted and its events are dropped.
+    """
+    _MAX_DELIVERY_ATTEMPTS = 6
+    _RETRY_DELAY = datetime.timedelta(minutes=1)
+    _MAX_RETRY_DELAY = datetime.timedelta(minutes=30)
+    # Sources whose events have not been acknowledged after this time are considered lost and are collected again
+    _IN_FLIGHT_TIMEOUT = datetime.timedelta(minutes=30)
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._sources = {}
+        self._events = {}
+
+    def is_pending(self, source):
+        """
+        True if the events of the given source are being delivered, or if their delivery failed and it is not time
+        to retry yet. Collectors should skip pending sources.
+        """
+        with self._lock:
+            entry = self._sources.get(source)
+            if entry is None:
+                return False
+            now = datetime.datetime.utcnow()
+            if entry.in_flight():
+                return now < entry.start_time + EventDeliveryLedger._IN_FLIGHT_TIMEOUT
+            return now < entry.retry_time
+
+    def begin(self, source):
+        with self._lock:
+            entry = self._sources.get(source)
+            if entry is None:
+                entry = _Source()
+                self._sources[source] = entry
+            self._forget_events(entry)
+            entry.complete = False
+            entry.failed = False
+            entry.start_time = datetime.datetime.utcnow()
+            entry.retry_time = None
+
+    def track(self, source, event):
+        with self._lock:
+            entry = self._sources[source]
+            self._events[id(event)] = (event, source)
+            entry.events.add(id(event))
+            entry.pending += 1
+
+    def end(self, source):
+        with self._lock:
+            entry = self._sources.get(source)
+            if entry is not None:
+                entry.complete = True
+                self._update(source, entry)
+
+    def abort(self, source):
+        with self._lock:
+            entry = self._sources.pop(source, None)
+            if entry is not None:
+                self._forget_events(entry)
+
+    def ack(self, events):
+        self._acknowledge(events, failed=False)
+
+    def nack(self, events):
+        self._acknowledge(events, failed=True)
+
+    def _acknowledge(self, events, failed):
+        with self._lock:
+            for event in events:
+                tracked = self._events.pop(id(event), None)
+                # ignore events that are not tracked (or that were already acknowledged)
+                if tracked is None or tracked[0] is not event:
+                    continue
+                source = tracked[1]
+                entry = self._sources.get(source)
+                if entry is None:
+                    continue
+                entry.events.discard(id(event))
+                entry.pending -= 1
+                if failed:
+                    entry.failed = True
+                self._update(source, entry)
+
+    def _forget_events(self, entry):
+        # events that were never acknowledged (e.g. they were lost when the agent stopped)
+        for event_id in entry.events:
+            self._events.pop(event_id, None)
+        entry.events = set()
+        entry.pending = 0
+
+    def _update(self, source, entry):
+        if not entry.complete or entry.pending > 0:
+            return
+
+        if not entry.failed:
+            del self._sources[source]
+            self._delete(source)
+            return
+
+        entry.failed_attempts += 1
+        if entry.failed_attempts >= EventDeliveryLedger._MAX_DELIVERY_ATTEMPTS:
+            logger.warn("Failed to deliver the events in {0} after {1} attempts; dropping them", source, entry.failed_attempts)
+            del self._sources[source]
+            self._delete(source)
+            return
+
+        delay = min(EventDeliveryLedger._RETRY_DELAY * (2 ** (entry.failed_attempts - 1)), EventDeliveryLedger._MAX_RETRY_DELAY)
+        entry.retry_time = datetime.datetime.utcnow() + delay
+        logger.verbose("Failed to deliver the events in {0}; will retry in {1}", source, delay)
+
+    @staticmethod
+    def _delete(source):
+        try:
+            os.remove(source)
+        except OSError as e:
+            if e.errno != errno.ENOENT:
+                logger.warn("Failed to delete event source {0}: {1}", source, ustr(e))
@@ -25,6 +25,7 @@ import re
 import shutil
 import stat
 import tempfile
+import threading
 import time
 import zipfile
 from collections import defaultdict
@@ -44,7 +45,7 @@ from azurelinuxagent.common.event import add_event, elapsed_milliseconds, WALAEv
 from azurelinuxagent.common.exception import ExtensionDownloadError, ExtensionError, ExtensionErrorCodes, \
     ExtensionOperationError, ExtensionUpdateError, ProtocolError, ProtocolNotFoundError, ExtensionConfigError, \
     GoalStateAggregateStatusCodes, MultiConfigExtensionEnableError
-from azurelinuxagent.common.future import ustr, is_file_not_found_error
+from azurelinuxagent.common.future import ustr, is_file_not_found_error, Queue
 from azurelinuxagent.common.protocol.restapi import ExtensionStatus, ExtensionSubStatus, ExtHandler, ExtHandlerStatus, \
     VMStatus, GoalStateAggregateStatus, ExtensionState, ExtHandlerRequestedState, Extension
 from azurelinuxagent.common.utils import textutil
@@ -52,6 +53,7 @@ from azurelinuxagent.common.utils.archive import ARCHIVE_DIRECTORY_NAME
 from azurelinuxagent.common.utils.flexible_version import FlexibleVersion
 from azurelinuxagent.common.version import AGENT_NAME, CURRENT_VERSION, \
     PY_VERSION_MAJOR, PY_VERSION_MICRO, PY_VERSION_MINOR
+from azurelinuxagent.ga.goal_state_differ import GoalStateDiffer, get_ext_handler_fingerprint
 
 _HANDLER_NAME_PATTERN = r'^([^-]+)'
 _HANDLER_VERSION_PATTERN = r'(\d+(?:\.\d+)*)'
@@ -74,6 +76,11 @@ NOT_RUN = "NOT_RUN"
 
 # Max size of individual status file
 _MAX_STATUS_FILE_SIZE_IN_BYTES = 128 * 1024  # 128K
+# With Debug.EnableExtensionStatusCache, status files larger than this are rejected without reading them
+_MAX_STATUS_FILE_READ_SIZE_IN_BYTES = 4 * 1024 * 1024  # 4M
+# With Debug.EnableExtensionStatusCache, the listing of a config directory is not cached while its modification time is
+# this recent, since files created within the timestamp granularity of the file system may not change that time
+_MIN_CONFIG_DIRECTORY_CACHE_AGE_IN_SECONDS = 2
 
 # Truncating length of fields.
 _MAX_STATUS_MESSAGE_LENGTH = 1024  # 1k message allowed to be shown in the portal.
@@ -261,6 +268,49 @@ def list_agent_lib_directory(skip_agent_package=True, ignore_names=None):
         yield name, path
 
 
+class _ConcurrentOperations(object):
+    """
+    Runs the operations passed to submit() on a pool of up to 'max_operations' worker threads. wait() waits for all the
+    submitted operations to complete and then raises the first exception raised by any of them, if any.
+    """
+    def __init__(self, max_operations, name):
+        self._max_operations = max(max_operations, 1)
+        self._name = name
+        self._queue = Queue()
+        self._workers = []
+        self._errors = []
+
+    def submit(self, operation):
+        self._queue.put(operation)
+        if len(self._workers) < self._max_operations:
+            worker = threading.Thread(target=self._run_worker)
+            worker.setName("{0}-{1}".format(self._name, len(self._workers)))
+            worker.setDaemon(True)
+            worker.start()
+            self._workers.append(worker)
+
+    def wait(self):
+        for _ in self._workers:
+            self._queue.put(None)
+        for worker in self._workers:
+            worker.join()
+        self._workers = []
+        if len(self._errors) > 0:
+            error = self._errors[0]
+            self._errors = []
+            raise error
+
+    def _run_worker(self):
+        while True:
+            operation = self._queue.get()
+            if operation is None:
+                return
+            try:
+                operation()
+            except Exception as error:
+                self._errors.append(error)
+
+
 class ExtHandlersHandler(object):
     def __init__(self, protocol):
         self.protocol = protocol
@@ -273,6 +323,9 @@ class ExtHandlersHandler(object):
 
         self.report_status_error_state = ErrorState()
 
+        # Used to skip the handlers that did not change since the last goal state (if incremental processing is enabled)
+        self._goal_state_differ = GoalStateDiffer()
+
     def __last_gs_unsupported(self):
 
         # Return if the last GoalState was unsupported
@@ -494,68 +547,175 @@ class ExtHandlersHandler(object):
     def handle_ext_handlers(self, etag=None):
         if not self.ext_handlers.extHandlers:
             logger.info("No extension handlers found, not processing anything.")
+            self._goal_state_differ.reset()
             return
 
+        try:
+            self.__handle_ext_handlers(etag)
+        except Exception:
+            # we don't know which handlers were processed; process all of them on the next goal state
+            self._goal_state_differ.reset()
+            raise
+
+    def __handle_ext_handlers(self, etag):
         wait_until = datetime.datetime.utcnow() + datetime.timedelta(minutes=_DEFAULT_EXT_TIMEOUT_MINUTES)
 
         all_extensions = self.__get_sorted_extensions_for_processing()
         # Since all_extensions are sorted based on sort_key, the last element would be the maximum based on the sort_key
         max_dep_level = self.__get_dependency_level(all_extensions[-1]) if any(all_extensions) else 0
 
-        depends_on_err_msg = None
+        # If incremental processing is enabled, the handlers that did not change since the last goal state (and were
+        # processed successfully then) are not processed again; the status they reported is kept.
+        incremental_processing = conf.get_enable_incremental_extension_processing()
+        fingerprints = {}
+        if incremental_processing:
+            for ext_handler in self.ext_handlers.extHandlers:
+                fingerprints[ext_handler.name] = get_ext_handler_fingerprint(ext_handler)
+        handler_results = {}
+        handler_instances = {}
+        unchanged_handlers = set()
+
+        # The extensions are processed in batches. By default each batch has a single extension; if concurrent operations
+        # are enabled, each batch has all the extensions of a dependency level (all_extensions is sorted by level), and
+        # the batch is completed (including waiting for the extensions to reach a terminal state) before the next one.
+        max_concurrent_operations = conf.get_max_concurrent_extension_operations()
+        batches = []
         for extension, ext_handler in all_extensions:
+            if max_concurrent_operations > 1 and len(batches) > 0 and \
+                    self.__get_dependency_level(batches[-1][-1]) == self.__get_dependency_level((extension, ext_handler)):
+                batches[-1].append((extension, ext_handler))
+            else:
+                batches.append([(extension, ext_handler)])
+
+        depends_on_err_msg = None
+        for batch in batches:
+            operations = []
+            for extension, ext_handler in batch:
+
+                handler_i = ExtHandlerInstance(ext_handler, self.protocol, extension=extension)
+                handler_instances[ext_handler.name] = handler_i
+
+                # In case of depends-on errors, we skip processing extensions if there was an error processing dependent extensions.
+                # But CRP is still waiting for some status back for the skipped extensions. In order to propagate the status back to CRP,
+                # we will report status back here with the relevant error message for each of the dependent extension.
+                if depends_on_err_msg is not None:
 
-            handler_i = ExtHandlerInstance(ext_handler, self.protocol, extension=extension)
+                    # For MC extensions, report the HandlerStatus as is and create a new placeholder per extension if doesnt exist
+                    if handler_i.should_perform_multi_config_op(extension):
+                        # Ensure some handler status exists for the Handler, if not, set it here
+                        if handler_i.get_handler_status() is None:
+                            handler_i.set_handler_status(message=depends_on_err_msg, code=-1)
 
-            # In case of depends-on errors, we skip processing extensions if there was an error processing dependent extensions.
-            # But CRP is still waiting for some status back for the skipped extensions. In order to propagate the status back to CRP,
-            # we will report status back here with the relevant error message for each of the dependent extension.
-            if depends_on_err_msg is not None:
+                        handler_i.create_status_file_if_not_exist(extension, status=ValidHandlerStatus.error, code=-1,
+                                                                  operation=WALAEventOperation.ExtensionProcessing,
+                                                                  message=depends_on_err_msg)
 
-                # For MC extensions, report the HandlerStatus as is and create a new placeholder per extension if doesnt exist
-                if handler_i.should_perform_multi_config_op(extension):
-                    # Ensure some handler status exists for the Handler, if not, set it here
-                    if handler_i.get_handler_status() is None:
+                    # For SC extensions, overwrite the HandlerStatus with the relevant message
+                    else:
                         handler_i.set_handler_status(message=depends_on_err_msg, code=-1)
 
-                    handler_i.create_status_file_if_not_exist(extension, status=ValidHandlerStatus.error, code=-1,
-                                                              operation=WALAEventOperation.ExtensionProcessing,
-                                                              message=depends_on_err_msg)
+                    handler_results[ext_handler.name] = False
+                    continue
 
-                # For SC extensions, overwrite the HandlerStatus with the relevant message
-                else:
-                    handler_i.set_handler_status(message=depends_on_err_msg, code=-1)
+                unchanged = incremental_processing and (ext_handler.name in unchanged_handlers or self._goal_state_differ.is_unchanged(
+                    ext_handler, fingerprints[ext_handler.name], handler_i.get_handler_state()))
+                if unchanged:
+                    unchanged_handlers.add(ext_handler.name)
 
-                continue
+                dep_level = self.__get_dependency_level((extension, ext_handler))
+                operations.append((handler_i, extension, unchanged, 0 <= dep_level < max_dep_level))
 
-            # Process extensions and get if it was successfully executed or not
-            extension_success = self.handle_ext_handler(handler_i, extension, etag)
+            results = self.__process_extensions(operations, etag, wait_until, max_concurrent_operations)
 
-            dep_level = self.__get_dependency_level((extension, ext_handler))
-            if 0 <= dep_level < max_dep_level:
-                extension_full_name = handler_i.get_extension_full_name(extension)
-                try:
-                    # Do no wait for extension status if the handler failed
-                    if not extension_success:
-                        raise Exception("Skipping processing of extensions since execution of dependent extension {0} failed".format(
-                                extension_full_name))
-
-                    # Wait for the extension installation until it is handled.
-                    # This is done for the install and enable. Not for the uninstallation.
-                    # If handled successfully, proceed with the current handler.
-                    # Otherwise, skip the rest of the extension installation.
-                    self.wait_for_handler_completion(handler_i, wait_until, extension=extension)
-
-                except Exception as error:
+            for (handler_i, extension, _, _), (extension_success, dependency_error) in zip(operations, results):
+                ext_handler = handler_i.ext_handler
+                handler_results[ext_handler.name] = handler_results.get(ext_handler.name, True) and extension_success
+
+                if dependency_error is not None:
+                    extension_full_name = handler_i.get_extension_full_name(extension)
                     logger.warn(
                         "Dependent extension {0} failed or timed out, will skip processing the rest of the extensions".format(
                             extension_full_name))
-                    depends_on_err_msg = ustr(error)
+                    if depends_on_err_msg is None:
+                        depends_on_err_msg = dependency_error
                     add_event(name=extension_full_name,
-                              version=handler_i.ext_handler.properties.version,
+                              version=ext_handler.properties.version,
                               op=WALAEventOperation.ExtensionProcessing,
                               is_success=False,
-                              message=depends_on_err_msg)
+                              message=dependency_error)
+
+        if incremental_processing:
+            if len(unchanged_handlers) > 0:
+                logger.info("Skipped the handlers that did not change since the last goal state: {0}", ', '.join(sorted(unchanged_handlers)))
+            processed_handlers = {}
+            for name, success in handler_results.items():
+                if success:
+                    processed_handlers[name] = (fingerprints[name], handler_instances[name].get_handler_state())
+            self._goal_state_differ.update(processed_handlers)
+
+    def __process_extensions(self, operations, etag, wait_until, max_concurrent_operations):
+        """
+        Processes the extensions in 'operations', a list of (handler instance, extension, unchanged, wait for completion)
+        tuples, and returns the (success, dependency error) tuple of each of them (see __process_extension()).
+
+        If 'max_concurrent_operations' is greater than 1, the extensions of different handlers are processed concurrently;
+        the extensions of the same handler are always processed sequentially, in the given order.
+        """
+        results = [None] * len(operations)
+
+        def process(indexes):
+            for i in indexes:
+                handler_i, extension, unchanged, wait_for_completion = operations[i]
+                results[i] = self.__process_extension(handler_i, extension, etag, unchanged, wait_until if wait_for_completion else None)
+
+        handler_names = []
+        indexes_by_handler = defaultdict(list)
+        for i, operation in enumerate(operations):
+            handler_name = operation[0].ext_handler.name
+            if handler_name not in indexes_by_handler:
+                handler_names.append(handler_name)
+            indexes_by_handler[handler_name].append(i)
+
+        if max_concurrent_operations <= 1 or len(handler_names) <= 1:
+            process(range(len(operations)))
+        else:
+            executor = _ConcurrentOperations(max_concurrent_operations, "ExtensionProcessing")
+            for handler_name in handler_names:
+                executor.submit(partial(process, indexes_by_handler[handler_name]))
+            executor.wait()
+
+        return results
+
+    def __process_extension(self, handler_i, extension, etag, unchanged, wait_until):
+        """
+        Processes the extension, unless it is unchanged since the last goal state, and, if 'wait_until' is not None,
+        waits for it to reach a terminal state. Returns a tuple with whether the extension was processed successfully
+        and, if the extensions that depend on it must not be processed, the error message to report for them (else None).
+        """
+        if unchanged:
+            handler_i.logger.verbose("The handler did not change since the last goal state, skipping it [incarnation {0}]", etag)
+            extension_success = True
+        else:
+            # Process extensions and get if it was successfully executed or not
+            extension_success = self.handle_ext_handler(handler_i, extension, etag)
+
+        if wait_until is not None:
+            try:
+                # Do no wait for extension status if the handler failed
+                if not extension_success:
+                    raise Exception("Skipping processing of extensions since execution of dependent extension {0} failed".format(
+                            handler_i.get_extension_full_name(extension)))
+
+                # Wait for the extension installation until it is handled.
+                # This is done for the install and enable. Not for the uninstallation.
+                # If handled successfully, proceed with the current handler.
+                # Otherwise, skip the rest of the extension installation.
+                self.wait_for_handler_completion(handler_i, wait_until, extension=extension)
+
+            except Exception as error:
+                return extension_success, ustr(error)
+
+        return extension_success, None
 
     @staticmethod
     def wait_for_handler_completion(handler_i, wait_until, extension=None):
@@ -922,6 +1082,10 @@ class ExtHandlersHandler(object):
                 except ExtensionError as error:
                     add_event(op=WALAEventOperation.ExtensionProcessing, is_success=False, message=ustr(error))
 
+            # evict the status files and config directories of the extensions that are no longer reported
+            _STATUS_FILE_CACHE.prune()
+            _CONFIG_DIRECTORY_CACHE.prune()
+
             logger.verbose("Report vm agent status")
             try:
                 self.protocol.report_vm_status(vm_status)
@@ -968,12 +1132,12 @@ class ExtHandlersHandler(object):
 
     def write_ext_handlers_status_to_info_file(self, vm_status):
         status_path = os.path.join(conf.get_lib_dir(), AGENT_STATUS_FILE.format(self.protocol.get_incarnation()))
-        status_blob_data = self.protocol.get_status_blob_data()
-        data = dict()
-        if status_blob_data is not None:
-            data = json.loads(status_blob_data)
+        # The status file is built from the same report that was serialized for the status blob. The report is shared
+        # with the status blob, so any dictionary that needs changes is copied rather than modified.
+        status_report = self.protocol.get_status_report()
+        data = dict(status_report) if status_report is not None else dict()
 
-        # Populating the fields that does not come from vm_status or status_blob_data
+        # Populating the fields that does not come from vm_status or the status report
         _metadataNotSentToCRP = {
             "agentName": AGENT_NAME,
             "daemonVersion": str(version.get_daemon_version()),
@@ -986,20 +1150,30 @@ class ExtHandlersHandler(object):
         # Consuming supports_multi_config info from vm_status. creating a dict out of it for easy lookup in the next step.
         support_multi_config = dict()
         if vm_status is not None:
-            # Convert VMStatus class to Dict.
-            vm_status_data = get_properties(vm_status)
-            vm_handler_statuses = vm_status_data.get('vmAgent', dict()).get('extensionHandlers')
-            for handler_status in vm_handler_statuses:
-                if handler_status.get('name') is not None:
-                    support_multi_config[handler_status.get('name')] = handler_status.get('supports_multi_config')
-
-        handler_aggregate_status = data.get('aggregateStatus', dict()).get('handlerAggregateStatus', dict())
-
-        for handler_status in handler_aggregate_status:
-            handler_status['supportsMultiConfig'] = support_multi_config.get(handler_status.get('handlerName'))
-            status = handler_status.get('runtimeSettingsStatus', dict()).get('settingsStatus', dict()).get('status', dict())
-            status.pop('formattedMessage', None)
-            status.pop('substatus', None)
+            for handler_status in vm_status.vmAgent.extensionHandlers:
+                if handler_status.name is not None:
+                    support_multi_config[handler_status.name] = handler_status.supports_multi_config
+
+        aggregate_status = data.get('aggregateStatus')
+        if aggregate_status is not None:
+            handler_aggregate_status = []
+            for handler_status in aggregate_status.get('handlerAggregateStatus', []):
+                handler_status = dict(handler_status)
+                handler_status['supportsMultiConfig'] = support_multi_config.get(handler_status.get('handlerName'))
+                runtime_settings_status = handler_status.get('runtimeSettingsStatus')
+                if runtime_settings_status is not None and 'status' in runtime_settings_status.get('settingsStatus', dict()):
+                    runtime_settings_status = dict(runtime_settings_status)
+                    settings_status = dict(runtime_settings_status['settingsStatus'])
+                    status = dict(settings_status['status'])
+                    status.pop('formattedMessage', None)
+                    status.pop('substatus', None)
+                    settings_status['status'] = status
+                    runtime_settings_status['settingsStatus'] = settings_status
+                    handler_status['runtimeSettingsStatus'] = runtime_settings_status
+                handler_aggregate_status.append(handler_status)
+            aggregate_status = dict(aggregate_status)
+            aggregate_status['handlerAggregateStatus'] = handler_aggregate_status
+            data['aggregateStatus'] = aggregate_status
 
         fileutil.write_file(status_path, json.dumps(data))
 
@@ -1044,6 +1218,49 @@ class ExtHandlersHandler(object):
         vm_status.vmAgent.extensionHandlers.extend(ext_handler_statuses)
 
 
+class _FileCache(object):
+    """
+    Data computed previously from files or directories (when Debug.EnableExtensionStatusCache is set), keyed on their
+    stat() (e.g. modification time, size and inode). prune() evicts the paths that were not used since it was last
+    called, e.g. those of extensions that were uninstalled or those of previous sequence numbers.
+    """
+    def __init__(self):
+        self._entries = {}  # path -> (key, value)
+        self._used = set()
+
+    def get(self, path, key):
+        """
+        Returns the value cached for the path, or None if the path is not cached or its key changed
+        """
+        self._used.add(path)
+        entry = self._entries.get(path)
+        if entry is None or entry[0] != key:
+            return None
+        return entry[1]
+
+    def set(self, path, key, value):
+        self._used.add(path)
+        self._entries[path] = (key, value)
+
+    def remove(self, path):
+        self._entries.pop(path, None)
+
+    def prune(self):
+        for path in list(self._entries.keys()):
+            if path not in self._used:
+                del self._entries[path]
+        self._used = set()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+# status file -> (data_str, data)
+_STATUS_FILE_CACHE = _FileCache()
+# config directory -> [(path, extension name, sequence number)] of its settings files
+_CONFIG_DIRECTORY_CACHE = _FileCache()
+
+
 class ExtHandlerInstance(object):
 
     def __init__(self, ext_handler, protocol, execution_log_max_size=(10 * 1024 * 1024), extension=None):
@@ -1592,33 +1809,53 @@ class ExtHandlerInstance(object):
 
         try:
             largest_modified_time = 0
-            conf_dir = self.get_conf_dir()
-            for item in os.listdir(conf_dir):
-                item_path = os.path.join(conf_dir, item)
-                if not os.path.isfile(item_path):
-                    continue
-                try:
-                    # Settings file for Multi Config look like - <extName>.<seqNo>.settings
-                    # Settings file for Single Config look like - <seqNo>.settings
-                    match = re.search("((?P<ext_name>\\w+)\\.)*(?P<seq_no>\\d+)\\.settings", item_path)
-                    if match is not None:
-                        ext_name = match.group('ext_name')
-                        if self.supports_multi_config and extension.name != ext_name:
-                            continue
-                        curr_seq_no = int(match.group("seq_no"))
-                        curr_modified_time = os.path.getmtime(item_path)
-                        if curr_modified_time > largest_modified_time:
-                            seq_no = curr_seq_no
-                            largest_modified_time = curr_modified_time
-                except (ValueError, IndexError, TypeError):
-                    self.logger.verbose("Failed to parse file name: {0}", item)
+            for item_path, ext_name, curr_seq_no in self._get_settings_files(self.get_conf_dir()):
+                if self.supports_multi_config and extension.name != ext_name:
                     continue
+                curr_modified_time = os.path.getmtime(item_path)
+                if curr_modified_time > largest_modified_time:
+                    seq_no = curr_seq_no
+                    largest_modified_time = curr_modified_time
         except Exception as error:
             logger.verbose("Error fetching sequence number from config files: {0}".format(ustr(error)))
             seq_no = -1
 
         return seq_no
 
+    def _get_settings_files(self, conf_dir):
+        """
+        Returns the (path, extension name, sequence number) of the settings files in the config directory. With
+        Debug.EnableExtensionStatusCache, the list is cached until the modification time of the directory changes;
+        files that are rewritten in place do not change that time, but the caller stats the files on every call.
+        """
+        cache_key = None
+        if conf.get_enable_extension_status_cache():
+            dir_stat = os.stat(conf_dir)
+            if time.time() - dir_stat.st_mtime >= _MIN_CONFIG_DIRECTORY_CACHE_AGE_IN_SECONDS:
+                cache_key = (getattr(dir_stat, "st_mtime_ns", dir_stat.st_mtime), dir_stat.st_ino)
+                settings_files = _CONFIG_DIRECTORY_CACHE.get(conf_dir, cache_key)
+                if settings_files is not None:
+                    return settings_files
+
+        settings_files = []
+        for item in os.listdir(conf_dir):
+            item_path = os.path.join(conf_dir, item)
+            if not os.path.isfile(item_path):
+                continue
+            try:
+                # Settings file for Multi Config look like - <extName>.<seqNo>.settings
+                # Settings file for Single Config look like - <seqNo>.settings
+                match = re.search("((?P<ext_name>\\w+)\\.)*(?P<seq_no>\\d+)\\.settings", item_path)
+                if match is not None:
+                    settings_files.append((item_path, match.group('ext_name'), int(match.group("seq_no"))))
+            except (ValueError, IndexError, TypeError):
+                self.logger.verbose("Failed to parse file name: {0}", item)
+                continue
+
+        if cache_key is not None:
+            _CONFIG_DIRECTORY_CACHE.set(conf_dir, cache_key, settings_files)
+        return settings_files
+
     def get_status_file_path(self, extension=None):
         """
         We should technically only fetch the sequence number from GoalState and not rely on the filesystem at all,
@@ -1675,6 +1912,10 @@ class ExtHandlerInstance(object):
                 msg = u"The status reported by the extension {0}(Sequence number {1}), was in an " \
                       u"incorrect format and the agent could not parse it correctly. Failed due to {2}" \
                       .format(self.get_full_name(ext), seq_no, ustr(e))
+            elif e.code == ExtensionStatusError.MaxSizeExceeded:
+                ext_status.code = ExtensionErrorCodes.PluginSettingsStatusInvalid
+                msg = u"The status reported by the extension {0}(Sequence number {1}) could not be read: {2}" \
+                      .format(self.get_full_name(ext), seq_no, ustr(e))
             elif e.code == ExtensionStatusError.FileNotExists:
                 msg = "This status is being reported by the Guest Agent since no status file was " \
                       "reported by extension {0}: {1}".format(self.get_extension_full_name(ext), ustr(e))
@@ -2165,7 +2406,10 @@ class ExtHandlerInstance(object):
         while True:
             try:
                 return ExtHandlerInstance._read_and_parse_json_status_file(ext_status_file)
-            except Exception:
+            except Exception as e:
+                # the size of the file will not change by retrying
+                if isinstance(e, ExtensionStatusError) and e.code == ExtensionStatusError.MaxSizeExceeded:
+                    raise
                 err_count += 1
                 if err_count >= _NUM_OF_STATUS_FILE_RETRIES:
                     raise
@@ -2173,6 +2417,8 @@ class ExtHandlerInstance(object):
 
     @staticmethod
     def _read_and_parse_json_status_file(ext_status_file):
+        if conf.get_enable_extension_status_cache():
+            return ExtHandlerInstance._read_and_parse_json_status_file_cached(ext_status_file)
 
         if not os.path.exists(ext_status_file):
             raise ExtensionStatusError(msg="Status file {0} does not exist".format(ext_status_file),
@@ -2190,6 +2436,47 @@ class ExtHandlerInstance(object):
                                        code=ExtensionStatusError.InvalidJsonFile)
         return data_str, data
 
+    @staticmethod
+    def _read_and_parse_json_status_file_cached(ext_status_file):
+        """
+        Same as _read_and_parse_json_status_file, but the file is checked with a single stat() and its content is
+        read and parsed only if its modification time, size or inode changed since it was last read. Files over
+        _MAX_STATUS_FILE_READ_SIZE_IN_BYTES are rejected without reading them.
+        """
+        try:
+            file_stat = os.stat(ext_status_file)
+        except OSError as e:
+            _STATUS_FILE_CACHE.remove(ext_status_file)
+            if is_file_not_found_error(e):
+                raise ExtensionStatusError(msg="Status file {0} does not exist".format(ext_status_file),
+                                           code=ExtensionStatusError.FileNotExists)
+            raise ExtensionStatusError(msg=ustr(e), inner=e, code=ExtensionStatusError.CouldNotReadStatusFile)
+
+        if file_stat.st_size > _MAX_STATUS_FILE_READ_SIZE_IN_BYTES:
+            _STATUS_FILE_CACHE.remove(ext_status_file)
+            raise ExtensionStatusError(msg="The status file {0} is too big to be read ({1} bytes; max allowed: {2} bytes)".format(
+                                           ext_status_file, file_stat.st_size, _MAX_STATUS_FILE_READ_SIZE_IN_BYTES),
+                                       code=ExtensionStatusError.MaxSizeExceeded)
+
+        key = (getattr(file_stat, "st_mtime_ns", file_stat.st_mtime), file_stat.st_size, file_stat.st_ino)
+        cached = _STATUS_FILE_CACHE.get(ext_status_file, key)
+        if cached is not None:
+            return cached
+
+        try:
+            data_str = fileutil.read_file(ext_status_file)
+        except IOError as e:
+            raise ExtensionStatusError(msg=ustr(e), inner=e, code=ExtensionStatusError.CouldNotReadStatusFile)
+        try:
+            data = json.loads(data_str)
+        except (ValueError, TypeError) as e:
+            _STATUS_FILE_CACHE.remove(ext_status_file)
+            raise ExtensionStatusError(msg="{0} \n First 2000 Bytes of status file:\n {1}".format(ustr(e), ustr(data_str)[:2000]),
+                                       inner=e,
+                                       code=ExtensionStatusError.InvalidJsonFile)
+        _STATUS_FILE_CACHE.set(ext_status_file, key, (data_str, data))
+        return data_str, data
+
     def _process_substatus_list(self, substatus_list, current_status_size=0):
         processed_substatus = []
 
@@ -0,0 +1,74 @@
+# Microsoft Azure Linux Agent
+#
+# Copyright 2020 Microsoft Corporation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# Requires Python 2.6+ and Openssl 1.0+
+#
+import hashlib
+import json
+
+
+def get_ext_handler_fingerprint(ext_handler):
+    """
+    Returns a hash of the parts of the handler that determine how it is processed: its version and requested state,
+    and the sequence number, state, dependency level and settings of each of its extensions.
+    """
+    extensions = []
+    for extension in ext_handler.properties.extensions:
+        extensions.append([
+            extension.name,
+            extension.sequenceNumber,
+            extension.state,
+            extension.dependencyLevel,
+            extension.certificateThumbprint,
+            extension.publicSettings,
+            extension.protectedSettings])
+
+    fingerprint = [
+        ext_handler.name,
+        ext_handler.properties.version,
+        ext_handler.properties.state,
+        ext_handler.supports_multi_config,
+        ext_handler.invalid_setting_reason,
+        extensions]
+
+    return hashlib.sha256(json.dumps(fingerprint, sort_keys=True).encode('utf-8')).hexdigest()
+
+
+class GoalStateDiffer(object):
+    """
+    Keeps the fingerprints of the handlers that were processed successfully in the last goal state, so that the
+    handlers that did not change in a new goal state do not need to be processed again.
+
+    A handler is considered unchanged if its fingerprint (see get_ext_handler_fingerprint()) is the same as in the
+    last goal state and its state on disk (the HandlerState) is the same as after it was processed. Handlers that
+    failed, or that were not processed, are always considered changed.
+    """
+    def __init__(self):
+        self._processed = {}
+
+    def is_unchanged(self, ext_handler, fingerprint, handler_state):
+        processed = self._processed.get(ext_handler.name)
+        return processed is not None and processed == (fingerprint, handler_state)
+
+    def update(self, processed_handlers):
+        """
+        Sets the handlers that were processed successfully in the current goal state; 'processed_handlers' is a
+        dictionary of handler name -> (fingerprint, handler state after processing).
+        """
+        self._processed = dict(processed_handlers)
+
+    def reset(self):
+        self._processed = {}
@@ -16,12 +16,44 @@
 #
 
 import datetime
+import hashlib
+import random
 import time
 
+from azurelinuxagent.common import conf
 from azurelinuxagent.common import logger
+from azurelinuxagent.common.AgentGlobals import AgentGlobals
 from azurelinuxagent.common.future import ustr
 
 
+def _total_seconds(delta):
+    # timedelta.total_seconds() is not available on Python 2.6, do the computation manually
+    return ((delta.days * 24 * 3600 + delta.seconds) * 10.0 ** 6 + delta.microseconds) / 10.0 ** 6
+
+
+def get_scheduling_jitter(period):
+    """
+    Returns a random delay (in seconds) to add to the given period (in seconds) when Debug.EnableJitteredScheduling
+    is set, or 0 otherwise. The delay is at most a tenth of the period and at most Debug.MaxSchedulingJitter.
+    """
+    if not conf.get_enable_jittered_scheduling():
+        return 0
+    return random.uniform(0, min(period / 10.0, conf.get_max_scheduling_jitter()))
+
+
+def get_scheduling_phase_offset(name, period):
+    """
+    Returns the offset (in seconds) of the first run of the operation with the given name and period (in seconds)
+    when Debug.EnableJitteredScheduling is set, or 0 otherwise. The offset is derived from the Container ID, so it
+    is the same across restarts of the agent but different on each VM, and it is less than both the period and
+    Debug.MaxSchedulingJitter.
+    """
+    if not conf.get_enable_jittered_scheduling():
+        return 0
+    digest = hashlib.sha256("{0}:{1}".format(AgentGlobals.get_container_id(), name).encode('utf-8')).hexdigest()
+    return min(period, conf.get_max_scheduling_jitter()) * int(digest[:8], 16) / float(0x100000000)
+
+
 class PeriodicOperation(object):
     '''
     Instances of PeriodicOperation are tasks that are executed only after the given
@@ -36,7 +68,9 @@ class PeriodicOperation(object):
     def __init__(self, period):
         self._name = self.__class__.__name__
         self._period = period if isinstance(period, datetime.timedelta) else datetime.timedelta(seconds=period)
-        self._next_run_time = datetime.datetime.utcnow()
+        phase_offset = get_scheduling_phase_offset(self._name, _total_seconds(self._period))
+        self._next_run_time = datetime.datetime.utcnow() + datetime.timedelta(seconds=phase_offset)
+        self._last_run_time = None
         self._last_warning = None
         self._last_warning_time = None
 
@@ -47,7 +81,9 @@ class PeriodicOperation(object):
                     logger.verbose("Executing {0}...", self._name)
                     self._operation()
                 finally:
-                    self._next_run_time = datetime.datetime.utcnow() + self._period
+                    self._last_run_time = datetime.datetime.utcnow()
+                    jitter = get_scheduling_jitter(_total_seconds(self._period))
+                    self._next_run_time = self._last_run_time + self._period + datetime.timedelta(seconds=jitter)
         except Exception as e:
             warning = "Error in {0}: {1} --- [NOTE: Will not log the same error for the next hour]".format(self._name, ustr(e))
             if warning != self._last_warning or self._last_warning_time is None or datetime.datetime.utcnow() >= self._last_warning_time + self._LOG_WARNING_PERIOD:
@@ -58,6 +94,15 @@ class PeriodicOperation(object):
     def next_run_time(self):
         return self._next_run_time
 
+    def expedite(self, min_interval):
+        """
+        Moves the next run of the operation earlier, to 'min_interval' after its last run (the operation runs on the
+        next call to run() if that time has already passed). Used when the operation has work to do before its period
+        elapses.
+        """
+        if self._last_run_time is not None:
+            self._next_run_time = min(self._next_run_time, self._last_run_time + min_interval)
+
     def _operation(self):
         """
         Derived classes must override this with the definition of the operation they need to perform
@@ -70,12 +115,17 @@ class PeriodicOperation(object):
         Takes a list of operations, finds the operation that should be executed next (that with the closest next_run_time)
         and sleeps until it is time to execute that operation.
         """
-        next_operation_time = min([op.next_run_time() for op in operations])
-
-        sleep_timedelta = next_operation_time - datetime.datetime.utcnow()
-        # timedelta.total_seconds() is not available on Python 2.6, do the computation manually
-        sleep_seconds = ((sleep_timedelta.days * 24 * 3600 + sleep_timedelta.seconds) * 10.0 ** 6 + sleep_timedelta.microseconds) / 10.0 ** 6
+        sleep_seconds = PeriodicOperation.get_seconds_until_next_operation(operations)
 
         if sleep_seconds > 0:
             time.sleep(sleep_seconds)
 
+    @staticmethod
+    def get_seconds_until_next_operation(operations):
+        """
+        Returns the number of seconds until the operation that should be executed next (negative if it is overdue).
+        """
+        next_operation_time = min([op.next_run_time() for op in operations])
+
+        return _total_seconds(next_operation_time - datetime.datetime.utcnow())
+
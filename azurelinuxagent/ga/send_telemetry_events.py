@@ -20,12 +20,14 @@ import datetime
 import threading
 import time
 
-from azurelinuxagent.common import logger
-from azurelinuxagent.common.event import add_event, WALAEventOperation
+from azurelinuxagent.common import conf, logger
+from azurelinuxagent.common.event import add_event, WALAEventOperation, CollectOrReportEventDebugInfo
 from azurelinuxagent.common.exception import ServiceStoppedError
-from azurelinuxagent.common.future import ustr, Queue, Empty
+from azurelinuxagent.common.future import ustr, Empty
 from azurelinuxagent.common.interfaces import ThreadHandlerInterface
 from azurelinuxagent.common.utils import textutil
+from azurelinuxagent.ga.event_delivery_ledger import EventDeliveryLedger
+from azurelinuxagent.ga.telemetry_event_queue import TelemetryEventQueue
 
 
 def get_send_telemetry_events_handler(protocol_util):
@@ -52,10 +54,12 @@ class SendTelemetryEventsHandler(ThreadHandlerInterface):
         # filesystem in the future and use add_event to directly queue events into the queue rather than writing to
         # a file and then parsing it later.
 
-        # Once we move add_event to directly queue events, we need to add a maxsize here to ensure some limitations are
-        # being set (currently our limits are enforced by collector_threads but that would become obsolete once we
-        # start enqueuing events directly).
-        self._queue = Queue()
+        # The queue is bounded (by number of events and size) to keep the memory usage of the agent predictable; when
+        # it is full, lower priority events are dropped first (see TelemetryEventQueue for the drop policy).
+        self._queue = TelemetryEventQueue(conf.get_telemetry_queue_max_events(), conf.get_telemetry_queue_max_size_kb() * 1024)
+
+        # When enabled, the collectors use the ledger to delete the event files only after their events have been sent
+        self._delivery_ledger = EventDeliveryLedger() if conf.get_enable_telemetry_delivery_ledger() else None
 
     @staticmethod
     def get_thread_name():
@@ -89,6 +93,9 @@ class SendTelemetryEventsHandler(ThreadHandlerInterface):
     def stopped(self):
         return not self.should_run
 
+    def get_delivery_ledger(self):
+        return self._delivery_ledger
+
     def enqueue_event(self, event):
         # Add event to queue and set event
         if self.stopped():
@@ -96,15 +103,16 @@ class SendTelemetryEventsHandler(ThreadHandlerInterface):
 
         # Queue.put() can block if the queue is full which can be an uninterruptible wait. Blocking for a max of
         # SendTelemetryEventsHandler._MAX_TIMEOUT seconds and raising a ServiceStoppedError to retry later.
-
-        # Todo: Queue.put() will only raise a Full exception if a maxsize is set for the Queue. Once some size
-        # limitations are set for the Queue, ensure to handle that correctly here.
         try:
-            self._queue.put(event, timeout=SendTelemetryEventsHandler._MAX_TIMEOUT)
+            dropped_events = self._queue.put(event, timeout=SendTelemetryEventsHandler._MAX_TIMEOUT)
         except Exception as error:
             raise ServiceStoppedError(
                 "Unable to enqueue due to: {0}, stopping any more enqueuing until the next run".format(ustr(error)))
 
+        # Lower priority events dropped to make room for this event are retried later if their files are tracked
+        if len(dropped_events) > 0 and self._delivery_ledger is not None:
+            self._delivery_ledger.nack(dropped_events)
+
     def _wait_for_event_in_queue(self):
         """
         Wait for atleast one event in Queue or timeout after SendTelemetryEventsHandler._MAX_TIMEOUT seconds.
@@ -133,6 +141,7 @@ class SendTelemetryEventsHandler(ThreadHandlerInterface):
                     # Start processing queue only if first event is not None (i.e. Queue has atleast 1 event),
                     # else do nothing
                     self._send_events_in_queue(first_event)
+                    self._report_dropped_events()
 
         except Exception as error:
             err_msg = "An unknown error occurred in the {0} thread main loop, stopping thread.{1}".format(
@@ -150,8 +159,31 @@ class SendTelemetryEventsHandler(ThreadHandlerInterface):
             logger.verbose("Waiting for events to batch. Total events so far: {0}, Time elapsed: {1} secs",
                            self._queue.qsize()+1, (datetime.datetime.utcnow() - start_time).seconds)
             time.sleep(1)
-        # Delete files after sending the data rather than deleting and sending
-        self._protocol.report_event(self._get_events_in_queue(first_event))
+        if self._delivery_ledger is None:
+            self._protocol.report_event(self._get_events_in_queue(first_event))
+            return
+
+        # The ledger deletes the event files after their events are acknowledged by report_event; any event dequeued
+        # but not acknowledged (e.g. report_event raised) is marked as failed so that its file is retried later
+        dequeued_events = []
+
+        def _record_events():
+            for event in self._get_events_in_queue(first_event):
+                dequeued_events.append(event)
+                yield event
+
+        try:
+            self._protocol.report_event(_record_events(), event_acknowledger=self._delivery_ledger)
+        finally:
+            self._delivery_ledger.nack(dequeued_events)
+
+    def _report_dropped_events(self):
+        dropped_events = self._queue.get_and_reset_dropped_events()
+        if len(dropped_events) > 0:
+            debug_info = CollectOrReportEventDebugInfo(operation=CollectOrReportEventDebugInfo.OP_COLLECT)
+            for priority, count in dropped_events.items():
+                debug_info.update_queue_overflow(priority, count)
+            debug_info.report_debug_info()
 
     def _get_events_in_queue(self, first_event):
         yield first_event
@@ -0,0 +1,220 @@
+# Microsoft Azure Linux Agent
+#
+# Copyright 2020 Microsoft Corporation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# Requires Python 2.6+ and Openssl 1.0+
+#
+import threading
+import time
+from collections import deque
+
+from azurelinuxagent.common import logger
+from azurelinuxagent.common.event import TELEMETRY_EVENT_PROVIDER_ID, TELEMETRY_METRICS_EVENT_ID, \
+    TELEMETRY_LOG_PROVIDER_ID, WALAEventOperation
+from azurelinuxagent.common.future import ustr, Empty, Full
+from azurelinuxagent.common.telemetryevent import GuestAgentExtensionEventsSchema, GuestAgentGenericLogsSchema
+
+
+class EventPriority(object):
+    """
+    The lanes of the TelemetryEventQueue; events in a lane are sent before the events in the lanes that follow it.
+    """
+    ERROR = 0  # failed operations, unhandled errors and error logs
+    DEFAULT = 1
+    INFORMATIONAL = 2  # performance metrics and informational/verbose logs
+
+    NAMES = ["Error", "Default", "Informational"]
+
+
+_HIGH_PRIORITY_OPERATIONS = [WALAEventOperation.UnhandledError]
+_HIGH_PRIORITY_LOG_LEVELS = ["ERROR", "CRITICAL"]
+_LOW_PRIORITY_LOG_LEVELS = ["VERBOSE", "INFO", "INFORMATIONAL", "LOGALWAYS"]
+
+
+def get_event_priority(event):
+    operation = None
+    operation_success = None
+    log_level = None
+
+    for param in event.parameters:
+        if param.name == GuestAgentExtensionEventsSchema.Operation:
+            operation = param.value
+        elif param.name == GuestAgentExtensionEventsSchema.OperationSuccess:
+            operation_success = param.value
+        elif param.name == GuestAgentGenericLogsSchema.CapabilityUsed:
+            log_level = ustr(param.value).upper()
+
+    if operation_success is False or ustr(operation_success).lower() == "false" or operation in _HIGH_PRIORITY_OPERATIONS:
+        return EventPriority.ERROR
+
+    if event.providerId == TELEMETRY_LOG_PROVIDER_ID:
+        if log_level in _HIGH_PRIORITY_LOG_LEVELS:
+            return EventPriority.ERROR
+        if log_level in _LOW_PRIORITY_LOG_LEVELS:
+            return EventPriority.INFORMATIONAL
+
+    if event.providerId == TELEMETRY_EVENT_PROVIDER_ID and event.eventId == TELEMETRY_METRICS_EVENT_ID:
+        return EventPriority.INFORMATIONAL
+
+    return EventPriority.DEFAULT
+
+
+def get_event_size(event):
+    """
+    Approximate size of the event (the size of the names and values of its parameters), used to enforce the byte budget
+    of the queue.
+    """
+    size = 0
+    for param in event.parameters:
+        size += len(param.name) + len(ustr(param.value))
+    return size
+
+
+class TelemetryEventQueue(object):
+    """
+    Bounded queue for the events waiting to be sent to the WireServer, with a budget on both the number of events and
+    their (approximate) size in bytes. Events are kept in separate lanes by priority (see EventPriority) and get()
+    returns the oldest event in the highest priority lane.
+
+    Drop policy: when an event does not fit in the budget, the oldest events in the lanes with lower priority than the
+    event are dropped, lowest priority lane first, until the event fits. If the event still does not fit (the queue is
+    full of events with the same or higher priority) put() waits up to its timeout for the sender to make room, then
+    drops the event and raises Full, so the caller can stop enqueueing until the next collection (backpressure).
+    Events larger than the whole byte budget are dropped immediately.
+
+    Dropped events are counted per lane; get_and_reset_dropped_events() returns those counts so that they can be
+    reported. The interface mimics the subset of Queue that is used by the SendTelemetryEventsHandler.
+    """
+    def __init__(self, max_events, max_size):
+        self._max_events = max_events
+        self._max_size = max_size
+        self._lanes = [deque() for _ in EventPriority.NAMES]
+        self._count = 0
+        self._size = 0
+        self._unfinished_tasks = 0
+        self._dropped_events = [0 for _ in EventPriority.NAMES]
+        self._mutex = threading.Lock()
+        self._not_empty = threading.Condition(self._mutex)
+        self._not_full = threading.Condition(self._mutex)
+        self._all_tasks_done = threading.Condition(self._mutex)
+
+    def put(self, event, timeout=None):
+        """
+        Adds the event to the queue and returns the list of events that were dropped to make room for it (if any).
+        Raises Full if the event could not be added.
+        """
+        priority = get_event_priority(event)
+        size = get_event_size(event)
+        dropped = []
+        end_time = None if timeout is None else time.time() + timeout
+
+        with self._not_full:
+            if size > self._max_size:
+                self._dropped_events[priority] += 1
+                raise Full("The event is larger than the queue budget ({0} bytes)".format(self._max_size))
+
+            while not self._fits(size):
+                if self._drop_lower_priority_event(priority, dropped):
+                    continue
+                remaining = None if end_time is None else end_time - time.time()
+                if remaining is not None and remaining <= 0:
+                    self._dropped_events[priority] += 1
+                    raise Full("The telemetry queue is full ({0} events, {1} bytes)".format(self._count, self._size))
+                self._not_full.wait(remaining)
+
+            self._lanes[priority].append((event, size))
+            self._count += 1
+            self._size += size
+            self._unfinished_tasks += 1
+            self._not_empty.notify()
+
+        if len(dropped) > 0:
+            logger.periodic_warn(logger.EVERY_FIFTEEN_MINUTES, "[PERIODIC] The telemetry queue is full; dropped {0} "
+                                                               "lower priority events".format(len(dropped)))
+        return dropped
+
+    def get(self, timeout=None):
+        end_time = None if timeout is None else time.time() + timeout
+        with self._not_empty:
+            while self._count == 0:
+                remaining = None if end_time is None else end_time - time.time()
+                if remaining is not None and remaining <= 0:
+                    raise Empty()
+                self._not_empty.wait(remaining)
+            return self._pop()
+
+    def get_nowait(self):
+        with self._mutex:
+            if self._count == 0:
+                raise Empty()
+            return self._pop()
+
+    def task_done(self):
+        with self._all_tasks_done:
+            if self._unfinished_tasks <= 0:
+                raise ValueError('task_done() called too many times')
+            self._unfinished_tasks -= 1
+            if self._unfinished_tasks == 0:
+                self._all_tasks_done.notify_all()
+
+    def join(self):
+        with self._all_tasks_done:
+            while self._unfinished_tasks > 0:
+                self._all_tasks_done.wait()
+
+    def qsize(self):
+        with self._mutex:
+            return self._count
+
+    def empty(self):
+        return self.qsize() == 0
+
+    def get_and_reset_dropped_events(self):
+        """
+        Returns a dictionary with the number of events dropped in each lane (by lane name) since the last call.
+        """
+        with self._mutex:
+            dropped_events = dict((EventPriority.NAMES[p], c) for p, c in enumerate(self._dropped_events) if c > 0)
+            self._dropped_events = [0 for _ in EventPriority.NAMES]
+        return dropped_events
+
+    def _fits(self, size):
+        return self._count < self._max_events and self._size + size <= self._max_size
+
+    def _drop_lower_priority_event(self, priority, dropped):
+        for lower_priority in range(len(self._lanes) - 1, priority, -1):
+            lane = self._lanes[lower_priority]
+            if len(lane) > 0:
+                event, size = lane.popleft()
+                self._count -= 1
+                self._size -= size
+                # the dropped event will never be returned by get(), so it is done
+                self._unfinished_tasks -= 1
+                if self._unfinished_tasks == 0:
+                    self._all_tasks_done.notify_all()
+                self._dropped_events[lower_priority] += 1
+                dropped.append(event)
+                return True
+        return False
+
+    def _pop(self):
+        for lane in self._lanes:
+            if len(lane) > 0:
+                event, size = lane.popleft()
+                self._count -= 1
+                self._size -= size
+                self._not_full.notify()
+                return event
+        raise Empty()
@@ -58,6 +58,7 @@ from azurelinuxagent.ga.collect_telemetry_events import get_collect_telemetry_ev
 
 from azurelinuxagent.ga.exthandlers import HandlerManifest, ExtHandlersHandler, list_agent_lib_directory, ValidHandlerStatus
 from azurelinuxagent.ga.monitor import get_monitor_handler
+from azurelinuxagent.ga.periodic_operation import get_scheduling_jitter
 
 from azurelinuxagent.ga.send_telemetry_events import get_send_telemetry_events_handler
 
@@ -162,6 +163,13 @@ class UpdateHandler(object):
             else:
                 self._goal_state_period = conf.get_goal_state_period()
 
+        # when Debug.MaxGoalStatePeriod is set, the period actually used by the main loop adapts to the activity
+        # in the goal state (see _update_polling_period)
+        self._polling_period = self._goal_state_period
+        self._last_etag = None
+        self._last_status_fingerprint = None
+        self._status_changed = False
+
     def run_latest(self, child_args=None):
         """
         This method is called from the daemon to find and launch the most
@@ -301,7 +309,14 @@ class UpdateHandler(object):
             # call ensures the required info is initialized (e.g telemetry depends on the container ID.)
             #
             protocol = self.protocol_util.get_protocol()
+            warm_start_snapshot = self._report_warm_start_status(protocol)
             protocol.client.update_goal_state(force_update=True)
+            if warm_start_snapshot is not None:
+                incarnation, etag = protocol.get_incarnation(), protocol.get_etag()
+                if warm_start_snapshot["incarnation"] == incarnation and warm_start_snapshot["etag"] == etag:
+                    logger.info("The goal state matches the warm start snapshot")
+                else:
+                    logger.info("The goal state changed since the warm start snapshot [incarnation: {0} etag: {1}]", incarnation, etag)
 
             # Initialize the common parameters for telemetry events
             initialize_event_logger_vminfo_common_parameters(protocol)
@@ -366,7 +381,7 @@ class UpdateHandler(object):
                 self._check_threads_running(all_thread_handlers)
                 self._process_goal_state(exthandlers_handler, remote_access_handler)
                 self._send_heartbeat_telemetry(protocol)
-                time.sleep(self._goal_state_period)
+                time.sleep(self._polling_period + get_scheduling_jitter(self._polling_period))
 
         except ExitException as exitException:
             logger.info(exitException.reason)
@@ -382,6 +397,26 @@ class UpdateHandler(object):
         self._shutdown()
         sys.exit(0)
 
+    @staticmethod
+    def _report_warm_start_status(protocol):
+        """
+        Reports the status saved by the previous run of the agent (if Debug.EnableWarmStart is set and there is a
+        recent snapshot), so that status reporting resumes before the goal state is fetched. Returns the snapshot
+        that was reported, or None.
+        """
+        if not conf.get_enable_warm_start():
+            return None
+        snapshot = protocol.client.load_warm_start_snapshot()
+        if snapshot is None:
+            return None
+        try:
+            protocol.client.report_warm_start_status(snapshot)
+            logger.info("Reported the status from the warm start snapshot [incarnation: {0} etag: {1}]", snapshot["incarnation"], snapshot["etag"])
+            return snapshot
+        except Exception as e:
+            logger.warn("Failed to report the status from the warm start snapshot: {0}", ustr(e))
+            return None
+
     def _check_daemon_running(self, debug):
         # Check that the parent process (the agent's daemon) is still running
         if not debug and self._is_orphaned:
@@ -422,6 +457,8 @@ class UpdateHandler(object):
         protocol = exthandlers_handler.protocol
         if not self._try_update_goal_state(protocol):
             self._heartbeat_update_goal_state_error_count += 1
+            # back off while the goal state cannot be retrieved, rather than polling the WireServer at the fast period
+            self._update_polling_period(changed=False, converged=True)
             return
 
         if self._upgrade_available(protocol):
@@ -433,9 +470,16 @@ class UpdateHandler(object):
             raise ExitException(reason)
 
         incarnation = protocol.get_incarnation()
+        etag = protocol.get_etag()
+        self._status_changed = False
+
+        # When the extensions are processed from the vmSettings, a new ETag is a new goal state for the extensions
+        extensions_goal_state_changed = incarnation != self.last_incarnation
+        if conf.get_enable_fast_track() and conf.get_enable_vm_settings_extension_processing() and etag != self._last_etag:
+            extensions_goal_state_changed = True
 
         try:
-            if incarnation != self.last_incarnation:  # TODO: This check should be based in the etag for the extensions goal state
+            if extensions_goal_state_changed:
                 if not self._extensions_summary.converged:
                     message = "A new goal state was received, but not all the extensions in the previous goal state have completed: {0}".format(self._extensions_summary)
                     logger.warn(message)
@@ -447,12 +491,39 @@ class UpdateHandler(object):
 
             # report status always, even if the goal state did not change
             # do it before processing the remote access, since that operation can take a long time
-            self._report_status(exthandlers_handler, incarnation_changed=incarnation != self.last_incarnation)
+            self._report_status(exthandlers_handler, incarnation_changed=extensions_goal_state_changed)
 
             if incarnation != self.last_incarnation:
                 remote_access_handler.run()
         finally:
+            self._update_polling_period(incarnation != self.last_incarnation or etag != self._last_etag or self._status_changed, self._extensions_summary.converged)
             self.last_incarnation = incarnation
+            self._last_etag = etag
+
+    def _update_polling_period(self, changed, converged):
+        """
+        Adapts the period of the main loop when Debug.MaxGoalStatePeriod is greater than the goal state period: the
+        agent polls every Debug.MinGoalStatePeriod seconds while the goal state or the status of the extensions is
+        changing (or the extensions are transitioning), then switches back to the goal state period and doubles it on
+        each iteration with no changes, up to Debug.MaxGoalStatePeriod. The caller passes converged=True when the
+        goal state could not be retrieved, so that the agent backs off instead of polling a failing WireServer at the
+        fast period.
+        """
+        max_period = conf.get_max_goal_state_period()
+        if max_period <= self._goal_state_period:
+            self._polling_period = self._goal_state_period
+            return
+
+        if changed or not converged:
+            polling_period = min(conf.get_min_goal_state_period(), self._goal_state_period)
+        elif self._polling_period < self._goal_state_period:
+            polling_period = self._goal_state_period
+        else:
+            polling_period = min(self._polling_period * 2, max_period)
+
+        if polling_period != self._polling_period:
+            logger.verbose("Goal state polling period: {0} sec", polling_period)
+            self._polling_period = polling_period
 
     def _report_status(self, exthandlers_handler, incarnation_changed):
         # report_ext_handlers_status does its own error handling and returns None if an error occurred
@@ -460,7 +531,15 @@ class UpdateHandler(object):
         if vm_status is None:
             return
 
+        if conf.get_enable_warm_start():
+            exthandlers_handler.protocol.client.save_warm_start_snapshot()
+
         try:
+            status_fingerprint = UpdateHandler._get_status_fingerprint(vm_status)
+            if status_fingerprint != self._last_status_fingerprint:
+                self._last_status_fingerprint = status_fingerprint
+                self._status_changed = True
+
             extensions_summary = ExtensionsSummary(vm_status)
             if self._extensions_summary != extensions_summary:
                 self._extensions_summary = extensions_summary
@@ -481,6 +560,21 @@ class UpdateHandler(object):
                 logger.warn(msg)
                 add_event(op=WALAEventOperation.GoalState, is_success=False, message=msg)
 
+    @staticmethod
+    def _get_status_fingerprint(vm_status):
+        """
+        Returns a summary of the status of the extensions that changes whenever an extension writes a new status
+        """
+        fingerprint = []
+        for handler_status in vm_status.vmAgent.extensionHandlers:
+            fingerprint.append((handler_status.name, handler_status.status, handler_status.code, handler_status.message))
+            extension_status = handler_status.extension_status
+            if extension_status is not None:
+                fingerprint.append((extension_status.name, extension_status.sequenceNumber, extension_status.status,
+                                    extension_status.configurationAppliedTime, extension_status.code, extension_status.message,
+                                    len(extension_status.substatusList)))
+        return fingerprint
+
     def _on_initial_goal_state_completed(self, extensions_summary):
         fileutil.write_file(self._initial_goal_state_file_path(), ustr(extensions_summary))
         if conf.get_extensions_enabled() and self._goal_state_period != conf.get_goal_state_period():
@@ -23,6 +23,7 @@ import os
 import re
 import shutil
 import threading
+import time
 import xml.dom
 from datetime import datetime, timedelta
 
@@ -31,13 +32,16 @@ from mock import MagicMock
 import azurelinuxagent.common.utils.textutil as textutil
 from azurelinuxagent.common import event, logger
 from azurelinuxagent.common.AgentGlobals import AgentGlobals
+from azurelinuxagent.common.datacontract import get_properties, set_properties
 from azurelinuxagent.common.event import add_event, add_periodic, add_log_event, elapsed_milliseconds, report_metric, \
     WALAEventOperation, parse_xml_event, parse_json_event, AGENT_EVENT_FILE_EXTENSION, EVENTS_DIRECTORY, \
     TELEMETRY_EVENT_EVENT_ID, TELEMETRY_EVENT_PROVIDER_ID, TELEMETRY_LOG_EVENT_ID, TELEMETRY_LOG_PROVIDER_ID
+from azurelinuxagent.common.event_spool import is_segment_file
 from azurelinuxagent.common.future import ustr
 from azurelinuxagent.common.osutil import get_osutil
+from azurelinuxagent.common.protocol.wire import event_to_v1_encoded
 from azurelinuxagent.common.telemetryevent import CommonTelemetryEventSchema, GuestAgentGenericLogsSchema, \
-    GuestAgentExtensionEventsSchema, GuestAgentPerfCounterEventsSchema
+    GuestAgentExtensionEventsSchema, GuestAgentPerfCounterEventsSchema, TelemetryEvent
 from azurelinuxagent.common.version import CURRENT_AGENT, CURRENT_VERSION, AGENT_EXECUTION_MODE
 from azurelinuxagent.ga.collect_telemetry_events import _CollectAndEnqueueEvents
 from tests.protocol import mockwiredata
@@ -125,6 +129,65 @@ class TestEvent(HttpRequestPredicates, AgentTestCase):
         self.assertNotEqual(0, event.parameters)
         self.assertTrue(all(param is not None for param in event.parameters))
 
+    @staticmethod
+    def _parse_json_event_with_set_properties(data_str):
+        # the implementation of parse_json_event before the fast path was added
+        event = TelemetryEvent()  # pylint: disable=redefined-outer-name
+        set_properties("TelemetryEvent", event, json.loads(data_str))
+        event.file_type = "json"
+        return event
+
+    def _assert_events_are_identical(self, expected, actual):
+        self.assertEqual(type(expected), type(actual))
+        self.assertEqual(type(expected.parameters), type(actual.parameters))
+        self.assertEqual(expected.parameters.item_cls, actual.parameters.item_cls)
+        self.assertEqual([type(p) for p in expected.parameters], [type(p) for p in actual.parameters])
+        self.assertEqual(get_properties(expected), get_properties(actual))
+
+    def test_parse_json_event_should_produce_the_same_events_as_set_properties(self):
+        test_data = [
+            load_data('ext/event.json'),
+            json.dumps({"eventId": 1, "providerId": "X", "parameters": [{"name": "Message", "value": u"\u00e9\u00e8"}, {"name": "Duration", "value": 12}]}),
+            json.dumps({"eventId": 1, "providerId": "X", "parameters": [], "file_type": "xml"}),
+            json.dumps({"eventId": 1}),
+            # data that does not follow the schema is handled by set_properties
+            json.dumps({"eventId": 1, "providerId": "X", "unknown": 1, "parameters": [{"name": "Message", "value": "a", "unknown": 2}]}),
+            json.dumps({"eventId": 1, "providerId": "X", "parameters": [{"name": "Message", "value": {"nested": [1, 2]}}]}),
+        ]
+        for data_str in test_data:
+            self._assert_events_are_identical(self._parse_json_event_with_set_properties(data_str), parse_json_event(data_str))
+
+        for data_str in ['[]', '{"parameters": null}', '{"parameters": [1]}']:
+            with self.assertRaises(Exception) as context_manager:
+                self._parse_json_event_with_set_properties(data_str)
+            expected_error = ustr(context_manager.exception)
+            with self.assertRaises(Exception) as context_manager:
+                parse_json_event(data_str)
+            self.assertEqual(expected_error, ustr(context_manager.exception))
+
+    def test_parse_json_event_should_not_be_slower_than_set_properties(self):
+        # 300 events is the maximum number of events an extension can emit per collection period
+        event.add_event(name="DummyExtension", op=WALAEventOperation.Install, message="x" * 1024, is_success=True)
+        event_files = os.listdir(self.event_dir)
+        self.assertEqual(1, len(event_files), "Expected exactly 1 event file")
+        with open(os.path.join(self.event_dir, event_files[0]), "rb") as event_file:
+            data_str = event_file.read().decode("utf-8")
+        iterations = 300 * 10
+
+        def benchmark(parse):
+            start_time = time.time()
+            for _ in range(iterations):
+                parse(data_str)
+            return time.time() - start_time
+
+        set_properties_time = benchmark(self._parse_json_event_with_set_properties)
+        fast_path_time = benchmark(parse_json_event)
+
+        self._assert_events_are_identical(self._parse_json_event_with_set_properties(data_str), parse_json_event(data_str))
+        self.assertTrue(fast_path_time <= set_properties_time,
+                        "Parsing {0} events with the fast path ({1:.3f}s) should not be slower than with set_properties ({2:.3f}s)".format(
+                            iterations, fast_path_time, set_properties_time))
+
     def test_add_event_should_use_the_container_id_from_the_most_recent_goal_state(self):
         def create_event_and_return_container_id():  # pylint: disable=inconsistent-return-statements
             event.add_event(name='Event')
@@ -153,6 +216,44 @@ class TestEvent(HttpRequestPredicates, AgentTestCase):
             self.assertEqual(contained_id, '11111111-2222-3333-4444-555555555555', "Incorrect container ID")
 
 
+    def test_common_parameter_blocks_should_be_updated_when_the_container_id_or_the_vminfo_change(self):
+        event_logger = event.get_event_logger()
+
+        with mock_wire_protocol(mockwiredata.DATA_FILE) as protocol:
+            blocks = event_logger.get_common_parameter_blocks()
+            self.assertEqual([b is c for b, c in zip(blocks, event_logger.get_common_parameter_blocks())], [True, True], "The blocks should be cached")
+            self.assertIn((CommonTelemetryEventSchema.ContainerId, 'c6d5526c-5ac2-4200-b6e2-56f2b70c5ab2'), blocks[0].params)
+
+            protocol.mock_wire_data.set_container_id('AAAAAAAA-BBBB-CCCC-DDDD-EEEEEEEEEEEE')
+            protocol.update_goal_state()
+            updated_blocks = event_logger.get_common_parameter_blocks()
+            self.assertIn((CommonTelemetryEventSchema.ContainerId, 'AAAAAAAA-BBBB-CCCC-DDDD-EEEEEEEEEEEE'), updated_blocks[0].params)
+            self.assertIs(blocks[1], updated_blocks[1], "The VM-wide block should not change when the container ID changes")
+
+            with patch("azurelinuxagent.common.event.get_imds_client") as mock_get_imds_client:
+                mock_get_imds_client.return_value.get_compute.return_value.location = 'useast'
+                mock_get_imds_client.return_value.get_compute.return_value.image_origin = 1
+                event_logger.initialize_vminfo_common_parameters(protocol)
+            updated_blocks = event_logger.get_common_parameter_blocks()
+            self.assertIn((CommonTelemetryEventSchema.Location, 'useast'), updated_blocks[1].params)
+            self.assertNotIn((CommonTelemetryEventSchema.Location, 'useast'), blocks[1].params, "The blocks should be immutable")
+
+    def test_report_event_should_encode_the_events_as_before_when_using_the_common_parameter_blocks(self):
+        event.add_event(name="DummyExtension", op=WALAEventOperation.Install, message=u"\u00e9 <&> \"", is_success=False)
+        event.add_event(name="DummyExtension", op=WALAEventOperation.Download, message="test", duration=5, is_success=True)
+        event.report_metric("Test", "Counter", "Instance", 12.5)
+        event_list = self._collect_events()
+        self.assertEqual(3, len(event_list), "Expected 3 events")
+
+        # modify one of the common parameters in the last event; it should not match the block and be encoded as is
+        event_list[2].set_param_value(CommonTelemetryEventSchema.RoleName, "AnotherRole")
+
+        blocks = event.get_event_logger().get_common_parameter_blocks()
+        for e in event_list:
+            self.assertEqual(event_to_v1_encoded(e), event_to_v1_encoded(e, param_blocks=blocks))
+        self.assertIsNotNone(blocks[1].find(event_list[0].parameters), "The VM-wide parameters should have matched the block")
+        self.assertIsNone(blocks[1].find(event_list[2].parameters), "The modified parameters should not match the block")
+
     def test_add_event_should_handle_event_errors(self):
         with patch("azurelinuxagent.common.utils.fileutil.mkdir", side_effect=OSError):
             with patch('azurelinuxagent.common.logger.periodic_error') as mock_logger_periodic_error:
@@ -381,6 +482,30 @@ class TestEvent(HttpRequestPredicates, AgentTestCase):
             self.assertTrue(filename.endswith(AGENT_EVENT_FILE_EXTENSION),
                 'Event file does not have the correct extension ({0}): {1}'.format(AGENT_EVENT_FILE_EXTENSION, filename))
 
+    def test_save_event_should_append_to_the_spool_when_enabled(self):
+        with patch("azurelinuxagent.common.conf.get_enable_event_spool", return_value=True):
+            for i in range(3):
+                add_event('test', message='test event {0}'.format(i))
+
+        event_files = os.listdir(self.event_dir)
+        self.assertEqual(1, len(event_files), "All the events should be in a single segment: {0}".format(event_files))
+        self.assertTrue(is_segment_file(event_files[0]), "Unexpected segment name: {0}".format(event_files[0]))
+
+    def test_collect_events_should_process_spooled_and_legacy_events(self):
+        self._create_test_event_file("custom_script_1.tld")
+        add_event('test', message='per-file event')
+        with patch("azurelinuxagent.common.conf.get_enable_event_spool", return_value=True):
+            for i in range(3):
+                add_event('test', message='spooled event {0}'.format(i))
+
+        event_list = self._collect_events()
+
+        messages = [TestEvent._get_event_message(evt) for evt in event_list]
+        self.assertEqual(5, len(messages), "Did not collect all the events that were created: {0}".format(messages))
+        for expected in ['per-file event', 'spooled event 0', 'spooled event 1', 'spooled event 2', 'A test telemetry message.']:
+            self.assertIn(expected, messages)
+        self.assertEqual(0, len(os.listdir(self.event_dir)), "The event files and segments were not deleted")
+
     @staticmethod
     def _get_event_message(evt):
         for p in evt.parameters:
@@ -0,0 +1,123 @@
+# Copyright 2020 Microsoft Corporation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# Requires Python 2.6+ and Openssl 1.0+
+#
+
+import os
+
+from azurelinuxagent.common.event_spool import EventSpool, is_segment_file, SEGMENT_FILE_EXTENSION, \
+    ACTIVE_SEGMENT_SUFFIX, COLLECTING_SEGMENT_SUFFIX
+from tests.tools import AgentTestCase, patch
+
+
+class TestEventSpool(AgentTestCase):
+    def setUp(self):
+        AgentTestCase.setUp(self)
+        self.spool_dir = os.path.join(self.tmp_dir, "events")
+        self.spool = EventSpool(self.spool_dir, 1000)
+
+    def tearDown(self):
+        self.spool.close()
+        AgentTestCase.tearDown(self)
+
+    def _collect(self):
+        return [e.decode("utf-8") for e in EventSpool.collect(self.spool_dir)]
+
+    def test_it_should_append_events_to_a_single_active_segment(self):
+        events = [u'{"event": 1}', u'{"event": "עיות"}', u'{"event": 3}']
+        for e in events:
+            self.spool.append(e)
+
+        segments = os.listdir(self.spool_dir)
+        self.assertEqual(1, len(segments), "Expected a single segment: {0}".format(segments))
+        self.assertTrue(segments[0].endswith(SEGMENT_FILE_EXTENSION + ACTIVE_SEGMENT_SUFFIX))
+        self.assertEqual(events, self._collect())
+        self.assertEqual(0, len(os.listdir(self.spool_dir)), "The segment should have been deleted")
+
+    def test_it_should_seal_segments_when_they_reach_the_maximum_number_of_events(self):
+        with patch("azurelinuxagent.common.event_spool.SEGMENT_MAX_EVENTS", 10):
+            for i in range(25):
+                self.spool.append(u"event {0}".format(i))
+
+        segments = sorted(os.listdir(self.spool_dir))
+        self.assertEqual(3, len(segments), "Expected 2 sealed segments and an active one: {0}".format(segments))
+        self.assertEqual(2, len([s for s in segments if s.endswith(SEGMENT_FILE_EXTENSION)]))
+        self.assertEqual([u"event {0}".format(i) for i in range(25)], self._collect())
+
+    def test_it_should_remove_the_oldest_segments_when_the_spool_is_full(self):
+        spool = EventSpool(self.spool_dir, 50)
+        try:
+            with patch("azurelinuxagent.common.event_spool.SEGMENT_MAX_EVENTS", 10):
+                for i in range(100):
+                    spool.append(u"event {0}".format(i))
+        finally:
+            spool.close()
+
+        # 50 events in 10-event segments allow for 4 sealed segments (plus the active one)
+        self.assertEqual([u"event {0}".format(i) for i in range(60, 100)], self._collect())
+
+    def test_it_should_start_a_new_segment_when_the_active_segment_is_claimed(self):
+        self.spool.append(u"event 0")
+        collector = EventSpool.collect(self.spool_dir)
+        self.assertEqual(b"event 0", next(collector))
+
+        # the segment is claimed, but not deleted yet (the collector is still iterating over it)
+        self.spool.append(u"event 1")
+        self.assertRaises(StopIteration, next, collector)
+
+        self.assertEqual([u"event 1"], self._collect())
+
+    def test_it_should_reprocess_segments_that_were_not_completely_collected(self):
+        self.spool.append(u"event 0")
+        self.spool.append(u"event 1")
+
+        collector = EventSpool.collect(self.spool_dir)
+        next(collector)
+        collector.close()
+
+        segments = os.listdir(self.spool_dir)
+        self.assertTrue(segments[0].endswith(COLLECTING_SEGMENT_SUFFIX), "The segment should be claimed: {0}".format(segments))
+        self.assertEqual([u"event 0", u"event 1"], self._collect())
+
+    def test_it_should_ignore_truncated_records(self):
+        self.spool.append(u"event 0")
+        self.spool.append(u"event 1")
+        segment = os.path.join(self.spool_dir, os.listdir(self.spool_dir)[0])
+        with open(segment, "ab") as f:
+            f.write(b"\x00\x00\x01\x00partial")
+
+        self.assertEqual([u"event 0", u"event 1"], self._collect())
+
+    def test_it_should_not_collect_other_files(self):
+        os.makedirs(self.spool_dir)
+        for f in ["1234.tld", "1234.waagent.tld", "1234.waagent.tld.tmp", "1-2.waagent.seg.tmp"]:
+            with open(os.path.join(self.spool_dir, f), "w") as fh:
+                fh.write("data")
+            self.assertFalse(is_segment_file(f))
+
+        self.assertEqual([], self._collect())
+        self.assertEqual(4, len(os.listdir(self.spool_dir)))
+
+    def test_it_should_seal_segments_when_they_reach_the_maximum_size(self):
+        # each record is the 4-byte length of the event followed by the event, so each segment holds 2 of these events
+        events = [u"event {0} {1}".format(i, "x" * 38) for i in range(5)]
+        with patch("azurelinuxagent.common.event_spool.SEGMENT_MAX_SIZE", 100):
+            for e in events:
+                self.spool.append(e)
+
+        segments = sorted(os.listdir(self.spool_dir))
+        self.assertEqual(3, len(segments), "Expected 2 sealed segments and an active one: {0}".format(segments))
+        self.assertEqual(2, len([s for s in segments if s.endswith(SEGMENT_FILE_EXTENSION)]))
+        self.assertEqual(events, self._collect())
@@ -14,8 +14,10 @@
 #
 # Requires Python 2.6+ and Openssl 1.0+
 #
+from azurelinuxagent.common.datacontract import get_properties
+from azurelinuxagent.common.protocol.wire import event_to_v1_encoded
 from azurelinuxagent.common.telemetryevent import TelemetryEvent, TelemetryEventParam, GuestAgentExtensionEventsSchema, \
-    CommonTelemetryEventSchema
+    CommonTelemetryEventSchema, TelemetryEventParamList, TelemetryEventParamBlock
 from tests.tools import AgentTestCase
 
 
@@ -47,4 +49,76 @@ class TestTelemetryEvent(AgentTestCase):
         self.assertTrue(GuestAgentExtensionEventsSchema.ExtensionType in test_event)
 
         self.assertFalse(CommonTelemetryEventSchema.GAVersion in test_event)
-        self.assertFalse(CommonTelemetryEventSchema.ContainerId in test_event)
\ No newline at end of file
+        self.assertFalse(CommonTelemetryEventSchema.ContainerId in test_event)
+
+    def test_set_param_value_should_replace_or_add_parameters(self):
+        test_event = get_test_event(message="Dummy Event")
+        param_count = len(test_event.parameters)
+
+        test_event.set_param_value(GuestAgentExtensionEventsSchema.Message, "Updated")
+        test_event.set_param_value(CommonTelemetryEventSchema.GAVersion, "1.0")
+
+        self.assertEqual(param_count + 1, len(test_event.parameters))
+        self.assertEqual("Updated", test_event.get_param_value(GuestAgentExtensionEventsSchema.Message))
+        self.assertEqual("1.0", test_event.parameters[-1].value)
+        self.assertIsNone(test_event.get_param_value(CommonTelemetryEventSchema.ContainerId))
+
+    def test_parameter_lookups_should_reflect_any_modification_of_the_parameters(self):
+        test_event = get_test_event()
+
+        del test_event.parameters[0]
+        self.assertFalse(GuestAgentExtensionEventsSchema.Name in test_event)
+        self.assertEqual("foo", test_event.get_version())
+
+        test_event.parameters.insert(0, TelemetryEventParam(GuestAgentExtensionEventsSchema.Version, "bar"))
+        self.assertEqual("bar", test_event.get_version())
+
+        test_event.parameters = [param for param in test_event.parameters if param.name != GuestAgentExtensionEventsSchema.Version]
+        self.assertIsInstance(test_event.parameters, TelemetryEventParamList)
+        self.assertIsNone(test_event.get_version())
+
+        test_event.parameters += [TelemetryEventParam(GuestAgentExtensionEventsSchema.Version, "baz")]
+        self.assertEqual("baz", test_event.get_version())
+
+    def test_events_should_not_have_a_dict(self):
+        test_event = get_test_event()
+        self.assertFalse(hasattr(test_event, "__dict__"))
+        self.assertFalse(hasattr(test_event.parameters[0], "__dict__"))
+
+    def test_events_should_be_serialized_as_before(self):
+        test_event = get_test_event(message="Dummy Event")
+
+        self.assertEqual({
+            "eventId": 1,
+            "providerId": "XXXXXXXX-XXXX-XXXX-XXXX-XXXXXXXXXXXX",
+            "file_type": "",
+            "parameters": [{"name": param.name, "value": param.value} for param in test_event.parameters]
+        }, get_properties(test_event))
+
+        self.assertEqual(
+            b'<Event id="1"><![CDATA[<Param Name="Name" Value="DummyExtension" T="mt:wstr" /><Param Name="Version" Value="foo" T="mt:wstr" />'
+            b'<Param Name="IsInternal" Value="False" T="mt:bool" /><Param Name="Operation" Value="Unknown" T="mt:wstr" />'
+            b'<Param Name="OperationSuccess" Value="True" T="mt:bool" /><Param Name="Message" Value="Dummy Event" T="mt:wstr" />'
+            b'<Param Name="Duration" Value="0" T="mt:uint64" /><Param Name="ExtensionType" Value="" T="mt:wstr" />]]></Event>',
+            event_to_v1_encoded(test_event))
+
+    def test_param_blocks_should_match_parameters_with_the_same_names_values_and_types(self):
+        test_event = get_test_event(message="Dummy Event", duration=1)
+        block = TelemetryEventParamBlock([
+            TelemetryEventParam(GuestAgentExtensionEventsSchema.Message, "Dummy Event"),
+            TelemetryEventParam(GuestAgentExtensionEventsSchema.Duration, 1)])
+        self.assertEqual(5, block.find(test_event.parameters))
+
+        test_event.set_param_value(GuestAgentExtensionEventsSchema.Duration, True)
+        self.assertIsNone(block.find(test_event.parameters), "A bool should not match an int")
+        test_event.set_param_value(GuestAgentExtensionEventsSchema.Duration, 2)
+        self.assertIsNone(block.find(test_event.parameters), "Different values should not match")
+        test_event.set_param_value(GuestAgentExtensionEventsSchema.Duration, 1)
+        test_event.parameters.insert(6, TelemetryEventParam("Other", 1))
+        self.assertIsNone(block.find(test_event.parameters), "Non-consecutive parameters should not match")
+        partial_event = TelemetryEvent()
+        partial_event.parameters = get_test_event(message="Dummy Event", duration=1).parameters[:6]
+        self.assertIsNone(block.find(partial_event.parameters), "Partial blocks should not match")
+
+        test_event = get_test_event(message="Dummy Event", duration=1)
+        self.assertEqual(event_to_v1_encoded(test_event), event_to_v1_encoded(test_event, param_blocks=[block]))
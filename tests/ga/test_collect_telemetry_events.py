@@ -16,6 +16,7 @@
 #
 
 import contextlib
+import datetime
 import glob
 import json
 import os
@@ -23,21 +24,25 @@ import random
 import re
 import shutil
 import string
+import threading
+import time
 import uuid
 from collections import defaultdict
 
 from mock import patch, MagicMock
 
 from azurelinuxagent.common import conf
-from azurelinuxagent.common.event import EVENTS_DIRECTORY
+from azurelinuxagent.common.event import EVENTS_DIRECTORY, add_event
 from azurelinuxagent.common.exception import InvalidExtensionEventError, ServiceStoppedError
 from azurelinuxagent.common.protocol.util import ProtocolUtil
 from azurelinuxagent.common.telemetryevent import GuestAgentGenericLogsSchema, \
     CommonTelemetryEventSchema
 from azurelinuxagent.common.utils import fileutil
-from azurelinuxagent.ga.collect_telemetry_events import ExtensionEventSchema, _ProcessExtensionEvents
+from azurelinuxagent.ga.collect_telemetry_events import ExtensionEventSchema, _ProcessExtensionEvents, \
+    CollectTelemetryEventsHandler
 from tests.protocol.mocks import HttpRequestPredicates
-from tests.tools import AgentTestCase, clear_singleton_instances, data_dir
+from tests.tools import AgentTestCase, clear_singleton_instances, data_dir, skip_if_predicate_true, is_inotify_not_available
+from tests.utils.event_logger_tools import EventLoggerTools
 
 
 class TestExtensionTelemetryHandler(AgentTestCase, HttpRequestPredicates):
@@ -564,3 +569,80 @@ class TestExtensionTelemetryHandler(AgentTestCase, HttpRequestPredicates):
                 total_file_count += file_count
 
             self.assertEqual(expected_event_file_count, total_file_count, "Expected File count doesn't match")
+
+
+class TestCollectTelemetryEventsHandler(AgentTestCase):
+    @skip_if_predicate_true(is_inotify_not_available, "inotify is not available")
+    def test_it_should_collect_events_as_soon_as_they_are_written_when_watching_the_event_directories(self):
+        EventLoggerTools.initialize_event_logger(os.path.join(conf.get_lib_dir(), EVENTS_DIRECTORY))
+
+        event_list = []
+        event_enqueued = threading.Event()
+
+        def enqueue_event(event):
+            event_list.append(event)
+            event_enqueued.set()
+
+        telemetry_handler = MagicMock()
+        telemetry_handler.stopped = MagicMock(return_value=False)
+        telemetry_handler.enqueue_event = MagicMock(side_effect=enqueue_event)
+
+        with patch("azurelinuxagent.common.conf.get_enable_event_directory_watcher", return_value=True):
+            with patch.object(CollectTelemetryEventsHandler, "_MIN_EVENT_COLLECTION_INTERVAL", datetime.timedelta(0)):
+                collector = CollectTelemetryEventsHandler(telemetry_handler)
+                collector.start()
+                try:
+                    # give the collector time to do its initial collection; the next periodic collection would be
+                    # 30 minutes later, so the event can only be collected if the collector is notified
+                    time.sleep(0.5)
+                    add_event(name="WALinuxAgent", op="TestOperation", message="test event", is_success=True)
+
+                    self.assertTrue(event_enqueued.wait(10), "The event was not collected")
+                    self.assertEqual(1, len(event_list))
+                finally:
+                    start_time = time.time()
+                    collector.stop()
+                    self.assertTrue(time.time() - start_time < 10, "The collector did not stop promptly")
+
+
+    @skip_if_predicate_true(is_inotify_not_available, "inotify is not available")
+    def test_it_should_collect_the_events_of_extensions_installed_after_it_started_watching_the_event_directories(self):
+        fileutil.mkdir(conf.get_ext_log_dir())
+
+        event_enqueued = threading.Event()
+
+        telemetry_handler = MagicMock()
+        telemetry_handler.stopped = MagicMock(return_value=False)
+        telemetry_handler.enqueue_event = MagicMock(side_effect=lambda _: event_enqueued.set())
+
+        with patch("azurelinuxagent.common.conf.get_enable_event_directory_watcher", return_value=True):
+            with patch.object(CollectTelemetryEventsHandler, "_MIN_EXTENSION_EVENT_COLLECTION_INTERVAL", datetime.timedelta(0)):
+                collector = CollectTelemetryEventsHandler(telemetry_handler)
+                collector.start()
+                try:
+                    # give the collector time to do its initial collection; the next periodic collection would be
+                    # 30 minutes later, so the events can only be collected if the collector is notified
+                    time.sleep(0.5)
+                    handler_directory = os.path.join(conf.get_ext_log_dir(), "Microsoft.OSTCExtensions.NewExtension")
+                    fileutil.mkdir(handler_directory)
+                    time.sleep(0.5)
+                    events_directory = os.path.join(handler_directory, EVENTS_DIRECTORY)
+                    fileutil.mkdir(events_directory)
+                    time.sleep(0.5)
+                    shutil.copy(os.path.join(TestExtensionTelemetryHandler._WELL_FORMED_FILES, "1591905451.json"), events_directory)
+
+                    self.assertTrue(event_enqueued.wait(10), "The events of the new extension were not collected")
+                finally:
+                    collector.stop()
+
+    def test_it_should_close_the_directory_watcher_when_inotify_is_not_available(self):
+        watcher = MagicMock()
+        watcher.is_available = MagicMock(return_value=False)
+
+        with patch("azurelinuxagent.common.conf.get_enable_event_directory_watcher", return_value=True):
+            with patch("azurelinuxagent.ga.collect_telemetry_events.DirectoryWatcher", return_value=watcher):
+                collector = CollectTelemetryEventsHandler(MagicMock())
+                with patch.object(collector, "stopped", return_value=True):
+                    collector.daemon()
+
+        self.assertEqual(1, watcher.close.call_count, "The directory watcher should have been closed")
@@ -0,0 +1,121 @@
+# Copyright 2020 Microsoft Corporation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# Requires Python 2.6+ and Openssl 1.0+
+#
+import datetime
+import os
+
+from azurelinuxagent.common.telemetryevent import TelemetryEvent
+from azurelinuxagent.ga.event_delivery_ledger import EventDeliveryLedger
+from tests.tools import AgentTestCase, patch
+
+
+class TestEventDeliveryLedger(AgentTestCase):
+    def _create_source(self, name="1.tld"):
+        source = os.path.join(self.tmp_dir, name)
+        with open(source, "w") as file_:
+            file_.write("test")
+        return source
+
+    @staticmethod
+    def _collect(ledger, source, count):
+        events = [TelemetryEvent(eventId=i) for i in range(count)]
+        ledger.begin(source)
+        for event in events:
+            ledger.track(source, event)
+        ledger.end(source)
+        return events
+
+    def test_it_should_delete_the_source_after_all_its_events_are_acknowledged(self):
+        ledger = EventDeliveryLedger()
+        source = self._create_source()
+
+        events = self._collect(ledger, source, 3)
+        self.assertTrue(ledger.is_pending(source))
+
+        ledger.ack(events[:2])
+        self.assertTrue(os.path.exists(source), "The source should not be deleted until all its events are acknowledged")
+
+        ledger.ack(events[2:])
+        self.assertFalse(os.path.exists(source), "The source should have been deleted")
+        self.assertFalse(ledger.is_pending(source))
+
+    def test_it_should_wait_for_the_end_of_the_collection_before_deleting_the_source(self):
+        ledger = EventDeliveryLedger()
+        source = self._create_source()
+
+        event = TelemetryEvent()
+        ledger.begin(source)
+        ledger.track(source, event)
+        ledger.ack([event])
+        self.assertTrue(os.path.exists(source), "The source should not be deleted before the collection ends")
+
+        ledger.end(source)
+        self.assertFalse(os.path.exists(source), "The source should have been deleted")
+
+    def test_it_should_delete_sources_without_events(self):
+        ledger = EventDeliveryLedger()
+        source = self._create_source()
+
+        self._collect(ledger, source, 0)
+
+        self.assertFalse(os.path.exists(source), "The source should have been deleted")
+
+    def test_it_should_keep_the_source_and_back_off_when_an_event_fails(self):
+        ledger = EventDeliveryLedger()
+        source = self._create_source()
+
+        events = self._collect(ledger, source, 2)
+        ledger.ack(events[:1])
+        ledger.nack(events[1:])
+        # an event can be acknowledged only once
+        ledger.ack(events)
+
+        self.assertTrue(os.path.exists(source), "The source should have been kept")
+        self.assertTrue(ledger.is_pending(source), "The source should not be retried before its retry time")
+
+        retry_time = datetime.datetime.utcnow() + EventDeliveryLedger._RETRY_DELAY + datetime.timedelta(seconds=1)
+        with patch("azurelinuxagent.ga.event_delivery_ledger.datetime") as mock_datetime:
+            mock_datetime.datetime.utcnow.return_value = retry_time
+            self.assertFalse(ledger.is_pending(source), "The source should be retried after its retry time")
+
+        # the retry succeeds
+        ledger.ack(self._collect(ledger, source, 2))
+        self.assertFalse(os.path.exists(source), "The source should have been deleted after the retry")
+
+    def test_it_should_drop_the_source_after_the_max_number_of_attempts(self):
+        ledger = EventDeliveryLedger()
+        source = self._create_source()
+
+        for _ in range(EventDeliveryLedger._MAX_DELIVERY_ATTEMPTS - 1):
+            ledger.nack(self._collect(ledger, source, 1))
+            self.assertTrue(os.path.exists(source), "The source should have been kept")
+
+        ledger.nack(self._collect(ledger, source, 1))
+        self.assertFalse(os.path.exists(source), "The source should have been deleted after the max number of attempts")
+        self.assertFalse(ledger.is_pending(source))
+
+    def test_abort_should_keep_the_source_and_ignore_its_events(self):
+        ledger = EventDeliveryLedger()
+        source = self._create_source()
+
+        events = [TelemetryEvent()]
+        ledger.begin(source)
+        ledger.track(source, events[0])
+        ledger.abort(source)
+
+        self.assertFalse(ledger.is_pending(source), "An aborted source should be collected again")
+        ledger.ack(events)
+        self.assertTrue(os.path.exists(source), "An aborted source should not be deleted")
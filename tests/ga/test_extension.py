@@ -16,6 +16,7 @@
 #
 import contextlib
 import glob
+import hashlib
 import json
 import os.path
 import random
@@ -23,6 +24,7 @@ import re
 import shutil
 import subprocess
 import tempfile
+import threading
 import time
 import unittest
 
@@ -41,13 +43,13 @@ from azurelinuxagent.common.version import PY_VERSION_MAJOR, PY_VERSION_MINOR, P
 from azurelinuxagent.common.exception import ResourceGoneError, ExtensionDownloadError, ProtocolError, \
     ExtensionErrorCodes, ExtensionError, GoalStateAggregateStatusCodes
 from azurelinuxagent.common.protocol.restapi import Extension, ExtHandler, ExtHandlerStatus, \
-    ExtensionStatus, ExtHandlerRequestedState
-from azurelinuxagent.common.protocol.wire import WireProtocol, InVMArtifactsProfile
+    ExtensionStatus, ExtensionSubStatus, ExtHandlerRequestedState, VMStatus
+from azurelinuxagent.common.protocol.wire import WireProtocol, InVMArtifactsProfile, vm_status_to_v1
 from azurelinuxagent.common.utils.restutil import KNOWN_WIRESERVER_IP
 
 from azurelinuxagent.ga.exthandlers import ExtHandlerInstance, migrate_handler_state, \
     get_exthandlers_handler, AGENT_STATUS_FILE, ExtCommandEnvVariable, HandlerManifest, NOT_RUN, \
-    ValidHandlerStatus, HANDLER_COMPLETE_NAME_PATTERN, HandlerEnvironment, GoalStateStatus
+    ValidHandlerStatus, HANDLER_COMPLETE_NAME_PATTERN, HandlerEnvironment, GoalStateStatus, _FileCache
 
 from tests.protocol import mockwiredata
 from tests.protocol.mocks import mock_wire_protocol, HttpRequestPredicates, MockHttpResponse
@@ -994,6 +996,48 @@ class TestExtension_Deprecated(AgentTestCase):
                 (dep_ext_level_5, ExtensionCommandNames.UNINSTALL)
             )
 
+    def test_ext_handler_incremental_processing_should_skip_unchanged_handlers(self, *args):
+        test_data = mockwiredata.WireProtocolData(mockwiredata.DATA_FILE_EXT_SEQUENCING)
+        exthandlers_handler, protocol = self._create_mock(test_data, *args)  # pylint: disable=no-value-for-parameter
+
+        first_ext = extension_emulator(name="OSTCExtensions.ExampleHandlerLinux")
+        second_ext = extension_emulator(name="OSTCExtensions.OtherExampleHandlerLinux")
+
+        with patch("azurelinuxagent.common.conf.get_enable_incremental_extension_processing", return_value=True):
+            with enable_invocations(first_ext, second_ext) as invocation_record:
+                exthandlers_handler.run()
+                invocation_record.compare(
+                    (second_ext, ExtensionCommandNames.INSTALL),
+                    (second_ext, ExtensionCommandNames.ENABLE),
+                    (first_ext, ExtensionCommandNames.INSTALL),
+                    (first_ext, ExtensionCommandNames.ENABLE)
+                )
+
+            # A new goal state with the same extensions should not invoke any of them
+            test_data.set_incarnation(2)
+            protocol.update_goal_state()
+
+            with enable_invocations(first_ext, second_ext) as invocation_record:
+                exthandlers_handler.run()
+                exthandlers_handler.report_ext_handlers_status()
+                invocation_record.compare()
+
+            self._assert_handler_status(protocol.report_vm_status, "Ready", 1, "1.0.0",
+                                        expected_handler_name=first_ext.name)
+            self._assert_handler_status(protocol.report_vm_status, "Ready", 1, "1.0.0",
+                                        expected_handler_name=second_ext.name)
+
+            # Only the handler whose settings changed should be invoked
+            test_data.set_incarnation(3)
+            test_data.ext_conf = test_data.ext_conf.replace('<RuntimeSettings seqNo="0">', '<RuntimeSettings seqNo="1">', 1)
+            protocol.update_goal_state()
+
+            with enable_invocations(first_ext, second_ext) as invocation_record:
+                exthandlers_handler.run()
+                invocation_record.compare(
+                    (first_ext, ExtensionCommandNames.ENABLE)
+                )
+
     def test_ext_handler_sequencing_should_fail_if_handler_failed(self, mock_get, mock_crypt, *args):
         test_data = mockwiredata.WireProtocolData(mockwiredata.DATA_FILE_EXT_SEQUENCING)
         exthandlers_handler, protocol = self._create_mock(test_data, mock_get, mock_crypt, *args)
@@ -2762,6 +2806,50 @@ class TestExtensionSequencing(AgentTestCase):
         self._run_test(extensions_to_be_failed, expected_sequence, exthandlers_handler)
 
 
+    def test_handle_ext_handlers_should_process_the_extensions_of_a_dependency_level_concurrently(self, *args):
+        exthandlers_handler = self._create_mock(*args)  # pylint: disable=no-value-for-parameter
+
+        self._set_dependency_levels([("A", 2), ("B", 1), ("C", 1), ("D", 1)], exthandlers_handler)
+
+        def run_test(extensions_to_be_failed):
+            operations = []
+            lock = threading.Lock()
+            active = [0, 0]  # [current, max]
+
+            def handle_ext_handler(handler_i, *_):
+                with lock:
+                    operations.append(("start", handler_i.ext_handler.name))
+                    active[0] += 1
+                    active[1] = max(active)
+                time.sleep(0.2)
+                with lock:
+                    operations.append(("end", handler_i.ext_handler.name))
+                    active[0] -= 1
+                return True
+
+            def get_ext_handling_status(ext):
+                return "error" if ext.name in extensions_to_be_failed else "success"
+
+            exthandlers_handler.handle_ext_handler = Mock(side_effect=handle_ext_handler)
+            exthandlers_handler.reset_etag()
+
+            with patch("azurelinuxagent.common.conf.get_max_concurrent_extension_operations", return_value=4):
+                with patch.object(ExtHandlerInstance, "get_ext_handling_status", side_effect=get_ext_handling_status):
+                    with patch.object(ExtHandlerInstance, "get_handler_status", ExtHandlerStatus):
+                        with patch('azurelinuxagent.ga.exthandlers._DEFAULT_EXT_TIMEOUT_MINUTES', 0.01):
+                            exthandlers_handler.run()
+
+            return operations, active[1]
+
+        operations, max_active = run_test(extensions_to_be_failed=[])
+        self.assertEqual(3, max_active, "The extensions of dependency level 1 should have been processed concurrently")
+        self.assertEqual(["B", "C", "D"], sorted([name for op, name in operations[:3]]))
+        self.assertEqual([("start", "A"), ("end", "A")], operations[-2:], "The extension of dependency level 2 should have been processed after the level 1 completed")
+
+        operations, _ = run_test(extensions_to_be_failed=["C"])
+        self.assertEqual(["B", "C", "D"], sorted([name for op, name in operations if op == "start"]),
+                         "A failure in level 1 should not prevent the other extensions in that level from being processed, but should skip level 2")
+
 class TestInVMArtifactsProfile(AgentTestCase):
     def test_it_should_parse_boolean_values(self):
         profile_json = '{ "onHold": true }'
@@ -3255,6 +3343,43 @@ class TestCollectExtensionStatus(AgentTestCase):
                                                  "non lacinia urna, sit amet venenatis orci.*")
             self.assertEqual(ValidHandlerStatus.success, sub_status.status)
 
+    @patch("azurelinuxagent.common.conf.get_lib_dir")
+    def test_collect_ext_status_should_read_the_status_file_only_when_it_changes(self, mock_lib_dir):
+        ext_handler_i, extension = self._setup_extension_for_validating_collect_ext_status(mock_lib_dir, "sample-status.json")
+        status_file = ext_handler_i.get_status_file_path(extension)[1]
+
+        status_file_cache = _FileCache()
+
+        with patch("azurelinuxagent.common.conf.get_enable_extension_status_cache", return_value=True):
+            with patch("azurelinuxagent.ga.exthandlers._STATUS_FILE_CACHE", status_file_cache):
+                with patch("azurelinuxagent.ga.exthandlers.fileutil.read_file", wraps=fileutil.read_file) as mock_read_file:
+                    first_status = ext_handler_i.collect_ext_status(extension)
+                    second_status = ext_handler_i.collect_ext_status(extension)
+                    self.assertEqual(1, mock_read_file.call_count, "The status file should have been read only once")
+                    self.assertEqual(get_properties(first_status), get_properties(second_status))
+
+                    with open(status_file, "r") as file_:
+                        status = json.load(file_)
+                    status[0]["status"]["status"] = ValidHandlerStatus.error
+                    with open(status_file, "w") as file_:
+                        json.dump(status, file_)
+                    os.utime(status_file, (0, 0))
+                    self.assertEqual(ValidHandlerStatus.error, ext_handler_i.collect_ext_status(extension).status)
+                    self.assertEqual(2, mock_read_file.call_count, "The status file should have been read after it changed")
+
+                    with patch("azurelinuxagent.ga.exthandlers._MAX_STATUS_FILE_READ_SIZE_IN_BYTES", 16):
+                        ext_status = ext_handler_i.collect_ext_status(extension)
+                    self.assertEqual(2, mock_read_file.call_count, "A status file that is too big should not have been read")
+                    self.assertEqual(ValidHandlerStatus.error, ext_status.status)
+                    self.assertIn("too big", ext_status.message)
+
+                    ext_handler_i.collect_ext_status(extension)
+                    self.assertEqual(1, len(status_file_cache), "The status file should be cached")
+                    status_file_cache.prune()
+                    self.assertEqual(1, len(status_file_cache), "A status file that was read since the last prune should be kept")
+                    status_file_cache.prune()
+                    self.assertEqual(0, len(status_file_cache), "A status file that is no longer read should be evicted")
+
     @patch("azurelinuxagent.common.conf.get_lib_dir")
     def test_collect_ext_status_read_file_read_exceptions(self, mock_lib_dir):
         """
@@ -3539,6 +3664,108 @@ class TestExtension(AgentTestCase):
 
             self.assertEqual(expected_status, actual_status_json)
 
+    @staticmethod
+    def _create_vm_status(handler_count, substatus_count):
+        vm_status = VMStatus(status="Ready", message="Guest Agent is running")
+        for i in range(handler_count):
+            handler_status = ExtHandlerStatus(name="Publisher.Handler{0}".format(i), version="1.0.{0}".format(i), status="Ready", message="Plugin enabled")
+            handler_status.supports_multi_config = i % 2 == 0
+            extension_status = ExtensionStatus(name="Extension{0}".format(i), operation="Enable", status="success", seq_no=i, code=0, message="Enabled")
+            for j in range(substatus_count):
+                extension_status.substatusList.append(ExtensionSubStatus(name="substatus{0}".format(j), status="success", code=0, message="x" * 256))
+            handler_status.extension_status = extension_status
+            vm_status.vmAgent.extensionHandlers.append(handler_status)
+        return vm_status
+
+    @staticmethod
+    def _write_status_with_round_trip(status_blob, status_path, vm_status):
+        # Serializes the status the way it was done before the status report was shared by the status blob and the status file
+        report = vm_status_to_v1(status_blob.vm_status)
+        status_blob.data = json.dumps(report)
+        report = dict(report)
+        report.pop("timestampUTC", None)
+        status_blob.digest = hashlib.sha256(json.dumps(report, sort_keys=True).encode("utf-8")).hexdigest()
+
+        data = json.loads(status_blob.data)
+        support_multi_config = dict()
+        for handler_status in get_properties(vm_status)['vmAgent']['extensionHandlers']:
+            support_multi_config[handler_status['name']] = handler_status['supports_multi_config']
+        for handler_status in data['aggregateStatus']['handlerAggregateStatus']:
+            handler_status['supportsMultiConfig'] = support_multi_config.get(handler_status['handlerName'])
+            status = handler_status['runtimeSettingsStatus']['settingsStatus']['status']
+            status.pop('formattedMessage', None)
+            status.pop('substatus', None)
+        fileutil.write_file(status_path, json.dumps(data))
+
+    @patch('time.gmtime', MagicMock(return_value=time.gmtime(0)))
+    def test_status_serialization_should_produce_the_same_status_as_the_round_trip(self):
+        with mock_wire_protocol(mockwiredata.DATA_FILE) as protocol:
+            exthandlers_handler = get_exthandlers_handler(protocol)
+            status_blob = protocol.client.status_blob
+            status_blob.set_vm_status(self._create_vm_status(handler_count=50, substatus_count=10))
+            status_path = os.path.join(conf.get_lib_dir(), AGENT_STATUS_FILE.format(1))
+
+            self._write_status_with_round_trip(status_blob, status_path, status_blob.vm_status)
+            round_trip_data = status_blob.data
+            round_trip_status_file = json.loads(fileutil.read_file(status_path))
+
+            status_blob.prepare("BlockBlob")
+            exthandlers_handler.write_ext_handlers_status_to_info_file(status_blob.vm_status)
+
+            self.assertEqual(json.loads(round_trip_data), json.loads(status_blob.data), "The status blob should not have changed")
+            status_file = json.loads(fileutil.read_file(status_path))
+            status_file.pop("_metadataNotSentToCRP")
+            self.assertEqual(round_trip_status_file, status_file, "The status file should not have changed")
+            self.assertTrue(status_file['aggregateStatus']['handlerAggregateStatus'][0]['supportsMultiConfig'])
+            self.assertIn("substatus", status_blob.report['aggregateStatus']['handlerAggregateStatus'][0]['runtimeSettingsStatus']['settingsStatus']['status'],
+                          "Writing the status file should not modify the status report")
+
+    # the round trip computes the digest of the status blob, so compute it in the shared report path too
+    @patch("azurelinuxagent.common.conf.get_status_upload_refresh_period", MagicMock(return_value=300))
+    def test_status_serialization_should_not_be_slower_than_the_round_trip(self):
+        with mock_wire_protocol(mockwiredata.DATA_FILE) as protocol:
+            exthandlers_handler = get_exthandlers_handler(protocol)
+            status_blob = protocol.client.status_blob
+            status_blob.set_vm_status(self._create_vm_status(handler_count=50, substatus_count=10))
+            status_path = os.path.join(conf.get_lib_dir(), AGENT_STATUS_FILE.format(1))
+            iterations = 50
+
+            def benchmark(write_status):
+                start_time = time.time()
+                for _ in range(iterations):
+                    write_status()
+                return time.time() - start_time
+
+            def write_status_with_shared_report():
+                status_blob.prepare("BlockBlob")
+                exthandlers_handler.write_ext_handlers_status_to_info_file(status_blob.vm_status)
+
+            round_trip_time = benchmark(lambda: self._write_status_with_round_trip(status_blob, status_path, status_blob.vm_status))
+            shared_report_time = benchmark(write_status_with_shared_report)
+
+            self.assertTrue(shared_report_time <= round_trip_time,
+                            "Serializing the status of 50 handlers {0} times with the shared report ({1:.3f}s) should not be slower than the round trip ({2:.3f}s)".format(
+                                iterations, shared_report_time, round_trip_time))
+
+    @patch("azurelinuxagent.common.conf.get_status_upload_refresh_period", MagicMock(return_value=300))
+    def test_status_blob_digest_should_not_depend_on_the_time_of_the_report(self):
+        with mock_wire_protocol(mockwiredata.DATA_FILE) as protocol:
+            status_blob = protocol.client.status_blob
+            status_blob.set_vm_status(self._create_vm_status(handler_count=2, substatus_count=1))
+
+            with patch('time.gmtime', MagicMock(return_value=time.gmtime(0))):
+                status_blob.prepare("BlockBlob")
+            digest, data = status_blob.digest, status_blob.data
+            with patch('time.gmtime', MagicMock(return_value=time.gmtime(3600))):
+                status_blob.prepare("BlockBlob")
+
+            self.assertNotEqual(data, status_blob.data, "The timestamps of the status should have changed")
+            self.assertEqual(digest, status_blob.digest, "The digest should not depend on the timestamps")
+
+            status_blob.vm_status.vmAgent.extensionHandlers[0].extension_status.substatusList[0].message = "Changed"
+            status_blob.prepare("BlockBlob")
+            self.assertNotEqual(digest, status_blob.digest, "The digest should change when the status changes")
+
     def test_it_should_zip_waagent_status_when_incarnation_changes(self):
         with mock_wire_protocol(mockwiredata.DATA_FILE) as protocol:
 
@@ -31,7 +31,7 @@ from azurelinuxagent.common.utils import fileutil
 from azurelinuxagent.common.utils.extensionprocessutil import TELEMETRY_MESSAGE_MAX_LEN, format_stdout_stderr, \
     read_output
 from azurelinuxagent.ga.exthandlers import parse_ext_status, ExtHandlerInstance, ExtCommandEnvVariable, \
-    ExtensionStatusError, _DEFAULT_SEQ_NO
+    ExtensionStatusError, _DEFAULT_SEQ_NO, _FileCache
 from tests.protocol import mockwiredata
 from tests.protocol.mocks import mock_wire_protocol
 from tests.tools import AgentTestCase, patch, mock_sleep, clear_singleton_instances
@@ -249,6 +249,52 @@ class TestExtHandlers(AgentTestCase):
                                               disk_sequence_number=3,
                                               expected_sequence_number=-1)
 
+    def test_get_status_file_path_should_list_the_config_directory_only_when_it_changes(self):
+        ext_handler_props = ExtHandlerProperties()
+        ext_handler_props.version = "1.2.3"
+        ext_handler = ExtHandler(name='foo')
+        ext_handler.properties = ext_handler_props
+        instance = ExtHandlerInstance(ext_handler=ext_handler, protocol=None)
+        conf_dir = instance.get_conf_dir()
+        fileutil.mkdir(conf_dir)
+        now = time.time()
+
+        def write_settings_file(seq_no, modified_time):
+            settings_file = os.path.join(conf_dir, "{0}.settings".format(seq_no))
+            fileutil.write_file(settings_file, "{}")
+            os.utime(settings_file, (modified_time, modified_time))
+
+        def set_conf_dir_modified_time(modified_time):
+            os.utime(conf_dir, (modified_time, modified_time))
+
+        write_settings_file(0, now - 300)
+        write_settings_file(1, now - 200)
+        set_conf_dir_modified_time(now - 100)
+
+        with patch("azurelinuxagent.common.conf.get_enable_extension_status_cache", return_value=True):
+            with patch("azurelinuxagent.ga.exthandlers._CONFIG_DIRECTORY_CACHE", _FileCache()):
+                with patch("azurelinuxagent.ga.exthandlers.os.listdir", wraps=os.listdir) as mock_listdir:
+                    self.assertEqual(1, instance.get_status_file_path()[0])
+                    self.assertEqual(1, instance.get_status_file_path()[0])
+                    self.assertEqual(1, mock_listdir.call_count, "The config directory should have been listed only once")
+
+                    # rewriting a settings file does not change the directory, but the modification time of the file is still checked
+                    write_settings_file(0, now - 50)
+                    set_conf_dir_modified_time(now - 100)
+                    self.assertEqual(0, instance.get_status_file_path()[0])
+                    self.assertEqual(1, mock_listdir.call_count, "The config directory should not have been listed again")
+
+                    write_settings_file(2, now - 10)
+                    set_conf_dir_modified_time(now - 20)
+                    self.assertEqual(2, instance.get_status_file_path()[0])
+                    self.assertEqual(2, mock_listdir.call_count, "The config directory should have been listed after it changed")
+
+                    # the listing of a directory modified within the timestamp granularity of the file system is not cached
+                    set_conf_dir_modified_time(now)
+                    self.assertEqual(2, instance.get_status_file_path()[0])
+                    self.assertEqual(2, instance.get_status_file_path()[0])
+                    self.assertEqual(4, mock_listdir.call_count, "A recently modified config directory should have been listed every time")
+
     def test_it_should_report_error_if_plugin_settings_version_mismatch(self):
         with mock_wire_protocol(mockwiredata.DATA_FILE_PLUGIN_SETTINGS_MISMATCH) as protocol:
             with patch("azurelinuxagent.common.protocol.goal_state.add_event") as mock_add_event:
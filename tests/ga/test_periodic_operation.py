@@ -77,6 +77,31 @@ class TestPeriodicOperation(AgentTestCase):
 
         self.assertEqual(pop.invoke_count, 5, "The operation was not invoked after the period elapsed")
 
+    def test_it_should_offset_and_jitter_its_runs_when_jittered_scheduling_is_enabled(self):
+        with patch("azurelinuxagent.common.conf.get_enable_jittered_scheduling", return_value=True):
+            with patch("azurelinuxagent.common.conf.get_max_scheduling_jitter", return_value=30):
+                with patch("azurelinuxagent.common.AgentGlobals.AgentGlobals.get_container_id", return_value="CONTAINER-1"):
+                    before = datetime.datetime.utcnow()
+                    op = TestPeriodicOperation.CountInvocations(datetime.timedelta(hours=1))
+                    offset = op.next_run_time() - before
+                    self.assertTrue(datetime.timedelta(0) <= offset <= datetime.timedelta(seconds=31), "The phase offset should be at most 30 seconds: {0}".format(offset))
+                    self.assertTrue(abs(TestPeriodicOperation.CountInvocations(datetime.timedelta(hours=1)).next_run_time() - op.next_run_time()) < datetime.timedelta(seconds=1),
+                                    "The phase offset should be deterministic")
+
+                    offsets = set()
+                    for container_id in ["CONTAINER-{0}".format(i) for i in range(10)]:
+                        with patch("azurelinuxagent.common.AgentGlobals.AgentGlobals.get_container_id", return_value=container_id):
+                            offsets.add(int((TestPeriodicOperation.CountInvocations(datetime.timedelta(hours=1)).next_run_time() - before).seconds))
+                    self.assertTrue(len(offsets) > 1, "The phase offset should depend on the Container ID")
+
+                    op = TestPeriodicOperation.CountInvocations(5)
+                    with patch("azurelinuxagent.ga.periodic_operation.random.uniform", return_value=0.5) as uniform:
+                        op._next_run_time = datetime.datetime.utcnow()
+                        op.run()
+                    self.assertEqual(1, op.invoke_count)
+                    uniform.assert_called_once_with(0, 0.5)
+                    self.assertTrue(op.next_run_time() - op._last_run_time == datetime.timedelta(seconds=5.5), "Expected the period plus the jitter")
+
     class RaiseException(PeriodicOperation):
         def _operation(self):
             raise Exception("A test exception")
@@ -154,3 +179,18 @@ class TestPeriodicOperation(AgentTestCase):
             self.assertAlmostEqual(mock_sleep.seconds, 10, 0, "did not sleep for the expected time")
 
 
+
+    def test_expedite_should_move_the_next_run_to_the_minimum_interval_after_the_last_run(self):
+        op = TestPeriodicOperation.CountInvocations(datetime.timedelta(hours=1))
+        op.run()
+
+        op.expedite(datetime.timedelta(minutes=1))
+        self.assertAlmostEqual(PeriodicOperation.get_seconds_until_next_operation([op]), 60, 0, "The next run should be 1 minute after the last run")
+
+        # expediting should never delay the next run
+        op.expedite(datetime.timedelta(hours=2))
+        self.assertAlmostEqual(PeriodicOperation.get_seconds_until_next_operation([op]), 60, 0, "The next run should not have been delayed")
+
+        op.expedite(datetime.timedelta(0))
+        op.run()
+        self.assertEqual(op.invoke_count, 2, "The expedited operation should have been invoked")
@@ -297,6 +297,22 @@ class TestSendTelemetryEventsHandler(AgentTestCase, HttpRequestPredicates):
 
                     self._assert_error_event_reported(mock_add_event, test_str, operation=WALAEventOperation.UnhandledError)
 
+    def test_it_should_report_the_events_dropped_when_the_queue_is_full(self):
+        with patch("azurelinuxagent.common.conf.get_telemetry_queue_max_events", return_value=2):
+            with self._create_send_telemetry_events_handler(start_thread=False) as telemetry_handler:
+                for _ in range(2):
+                    telemetry_handler.enqueue_event(TelemetryEvent(eventId=ustr(uuid.uuid4())))
+                with self.assertRaises(ServiceStoppedError):
+                    telemetry_handler.enqueue_event(TelemetryEvent(eventId=ustr(uuid.uuid4())))
+
+                with patch("azurelinuxagent.common.event.add_event") as mock_add_event:
+                    telemetry_handler.start()
+                    TestSendTelemetryEventsHandler._stop_handler(telemetry_handler)
+
+                    self._assert_error_event_reported(mock_add_event, "DroppedEventsCount: 1\nReason: telemetry queue full",
+                                                      operation=WALAEventOperation.CollectEventErrors)
+                self.assertEqual(2, len(re.findall(r'<Event id=', b"".join([body for _, body in telemetry_handler.event_calls]).decode('utf-8'))))
+
     def _create_extension_event(self,
                                size=0,
                                name="DummyExtension",
@@ -420,4 +436,49 @@ class TestSendTelemetryEventsHandler(AgentTestCase, HttpRequestPredicates):
                 self.assertEqual(3, patch_periodic_warn.call_count)
 
                 # The send_event call should never be called as the events are larger than 2**16.
-                self.assertEqual(0, len(telemetry_handler.event_calls))
\ No newline at end of file
+                self.assertEqual(0, len(telemetry_handler.event_calls))
+
+    @patch("azurelinuxagent.common.conf.get_lib_dir")
+    def test_it_should_delete_event_files_only_after_their_events_are_sent_when_the_delivery_ledger_is_enabled(self, mock_lib_dir):
+        mock_lib_dir.return_value = self.lib_dir
+        fail_requests = [True]
+
+        with patch("azurelinuxagent.common.conf.get_enable_telemetry_delivery_ledger", return_value=True):
+            with patch("azurelinuxagent.ga.event_delivery_ledger.EventDeliveryLedger._RETRY_DELAY", timedelta(seconds=0)):
+                with self._create_send_telemetry_events_handler() as telemetry_handler:
+                    def http_post_handler(url, body, **__):
+                        if self.is_telemetry_request(url):
+                            if fail_requests[0]:
+                                return HttpError("A test exception")
+                            telemetry_handler.event_calls.append((datetime.now(), body))
+                            return MockHttpResponse(status=200)
+                        return None
+
+                    telemetry_handler.get_mock_wire_protocol().set_http_handlers(http_post_handler=http_post_handler)
+                    ledger = telemetry_handler.get_delivery_ledger()
+
+                    self._create_extension_event(message="Message-Test")
+                    event_file = os.path.join(self.event_dir, os.listdir(self.event_dir)[0])
+
+                    def wait_for_delivery_attempt():
+                        for _ in range(50):
+                            if not ledger.is_pending(event_file):
+                                return
+                            time.sleep(0.1)
+                        self.fail("The event was not processed")
+
+                    # the file should be kept if its event cannot be sent...
+                    _CollectAndEnqueueEvents(telemetry_handler).run()
+                    wait_for_delivery_attempt()
+                    self.assertTrue(os.path.exists(event_file), "The event file should not have been deleted")
+                    self.assertEqual(0, len(telemetry_handler.event_calls), "The event should not have been sent")
+
+                    # ...and deleted once it is sent on the next collection
+                    fail_requests[0] = False
+                    _CollectAndEnqueueEvents(telemetry_handler).run()
+                    wait_for_delivery_attempt()
+                    TestSendTelemetryEventsHandler._stop_handler(telemetry_handler)
+
+                    self.assertFalse(os.path.exists(event_file), "The event file should have been deleted")
+                    # (the agent may also send events reporting the failure of the first attempt)
+                    self.assertTrue(any(b"Message-Test" in body for _, body in telemetry_handler.event_calls), "The event should have been sent")
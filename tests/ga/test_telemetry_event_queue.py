@@ -0,0 +1,122 @@
+# Copyright 2020 Microsoft Corporation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# Requires Python 2.6+ and Openssl 1.0+
+#
+from azurelinuxagent.common import logger
+from azurelinuxagent.common.event import TELEMETRY_EVENT_PROVIDER_ID, TELEMETRY_METRICS_EVENT_ID, \
+    TELEMETRY_LOG_PROVIDER_ID, TELEMETRY_LOG_EVENT_ID, WALAEventOperation
+from azurelinuxagent.common.future import Empty, Full
+from azurelinuxagent.common.telemetryevent import TelemetryEvent, TelemetryEventParam, \
+    GuestAgentExtensionEventsSchema, GuestAgentGenericLogsSchema
+from azurelinuxagent.ga.telemetry_event_queue import TelemetryEventQueue, EventPriority, get_event_priority, \
+    get_event_size
+from tests.tools import AgentTestCase
+
+
+def _create_event(operation=WALAEventOperation.Unknown, is_success=True, message="test"):
+    event = TelemetryEvent(1, TELEMETRY_EVENT_PROVIDER_ID)
+    event.parameters.append(TelemetryEventParam(GuestAgentExtensionEventsSchema.Operation, operation))
+    event.parameters.append(TelemetryEventParam(GuestAgentExtensionEventsSchema.OperationSuccess, is_success))
+    event.parameters.append(TelemetryEventParam(GuestAgentExtensionEventsSchema.Message, message))
+    return event
+
+
+def _create_log_event(level):
+    event = TelemetryEvent(TELEMETRY_LOG_EVENT_ID, TELEMETRY_LOG_PROVIDER_ID)
+    event.parameters.append(TelemetryEventParam(GuestAgentGenericLogsSchema.CapabilityUsed, level))
+    return event
+
+
+class TestTelemetryEventQueue(AgentTestCase):
+    def test_get_event_priority_should_classify_the_events(self):
+        self.assertEqual(EventPriority.ERROR, get_event_priority(_create_event(is_success=False)))
+        self.assertEqual(EventPriority.ERROR, get_event_priority(_create_event(operation=WALAEventOperation.ExtensionProcessing, is_success="False")))
+        self.assertEqual(EventPriority.ERROR, get_event_priority(_create_event(operation=WALAEventOperation.UnhandledError)))
+        self.assertEqual(EventPriority.ERROR, get_event_priority(_create_log_event(logger.LogLevel.STRINGS[logger.LogLevel.ERROR])))
+        self.assertEqual(EventPriority.DEFAULT, get_event_priority(_create_event()))
+        self.assertEqual(EventPriority.DEFAULT, get_event_priority(_create_log_event("Warning")))
+        self.assertEqual(EventPriority.INFORMATIONAL, get_event_priority(_create_log_event(logger.LogLevel.STRINGS[logger.LogLevel.INFO])))
+        self.assertEqual(EventPriority.INFORMATIONAL, get_event_priority(_create_log_event("Informational")))
+        self.assertEqual(EventPriority.INFORMATIONAL, get_event_priority(TelemetryEvent(TELEMETRY_METRICS_EVENT_ID, TELEMETRY_EVENT_PROVIDER_ID)))
+
+    def test_get_should_return_higher_priority_events_first(self):
+        queue = TelemetryEventQueue(100, 1024 * 1024)
+        metric = TelemetryEvent(TELEMETRY_METRICS_EVENT_ID, TELEMETRY_EVENT_PROVIDER_ID)
+        default_1 = _create_event()
+        default_2 = _create_event()
+        error = _create_event(is_success=False)
+
+        for event in [metric, default_1, error, default_2]:
+            queue.put(event)
+
+        self.assertEqual(4, queue.qsize())
+        self.assertEqual([error, default_1, default_2, metric], [queue.get_nowait() for _ in range(4)])
+        self.assertTrue(queue.empty())
+        self.assertRaises(Empty, queue.get, timeout=0.01)
+
+    def test_put_should_drop_the_oldest_lower_priority_events_when_the_queue_is_full(self):
+        queue = TelemetryEventQueue(3, 1024 * 1024)
+        metric_1 = TelemetryEvent(TELEMETRY_METRICS_EVENT_ID, TELEMETRY_EVENT_PROVIDER_ID)
+        metric_2 = TelemetryEvent(TELEMETRY_METRICS_EVENT_ID, TELEMETRY_EVENT_PROVIDER_ID)
+        default = _create_event()
+        error_1 = _create_event(is_success=False)
+        error_2 = _create_event(is_success=False)
+
+        for event in [metric_1, metric_2, default]:
+            self.assertEqual([], queue.put(event))
+
+        self.assertEqual([metric_1], queue.put(error_1))
+        self.assertEqual([metric_2], queue.put(error_2))
+        self.assertEqual({"Informational": 2}, queue.get_and_reset_dropped_events())
+        self.assertEqual({}, queue.get_and_reset_dropped_events())
+
+        self.assertEqual([error_1, error_2, default], [queue.get_nowait() for _ in range(3)])
+
+    def test_put_should_raise_when_there_are_no_lower_priority_events_to_drop(self):
+        queue = TelemetryEventQueue(2, 1024 * 1024)
+        errors = [_create_event(is_success=False), _create_event(is_success=False)]
+        for event in errors:
+            queue.put(event)
+
+        self.assertRaises(Full, queue.put, _create_event(), timeout=0.01)
+        self.assertRaises(Full, queue.put, _create_event(is_success=False), timeout=0.01)
+        self.assertEqual({"Default": 1, "Error": 1}, queue.get_and_reset_dropped_events())
+        self.assertEqual(errors, [queue.get_nowait() for _ in range(2)])
+
+    def test_put_should_enforce_the_byte_budget(self):
+        event_size = get_event_size(_create_event(message="x" * 100))
+        queue = TelemetryEventQueue(100, event_size * 2)
+
+        queue.put(_create_event(message="x" * 100))
+        queue.put(_create_event(message="x" * 100))
+        self.assertRaises(Full, queue.put, _create_event(message="x" * 100), timeout=0.01)
+        # events larger than the budget are dropped right away
+        self.assertRaises(Full, queue.put, _create_event(message="x" * event_size * 2))
+        self.assertEqual(2, queue.qsize())
+
+        queue.get_nowait()
+        queue.put(_create_event(message="x" * 100))
+        self.assertEqual(2, queue.qsize())
+
+    def test_join_should_wait_for_all_the_events_to_be_processed(self):
+        queue = TelemetryEventQueue(1, 1024 * 1024)
+        queue.put(TelemetryEvent(TELEMETRY_METRICS_EVENT_ID, TELEMETRY_EVENT_PROVIDER_ID))
+        # the dropped event is not counted as an unfinished task
+        queue.put(_create_event())
+
+        queue.get_nowait()
+        queue.task_done()
+        queue.join()
+        self.assertRaises(ValueError, queue.task_done)
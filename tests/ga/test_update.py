@@ -2179,6 +2179,58 @@ class GoalStateIntervalTestCase(AgentTestCase):
                     update_handler._process_goal_state(exthandlers_handler, remote_access_handler)
                     self.assertEqual(goal_state_period, update_handler._goal_state_period, "Expected the regular goal state period when the goal state does not converge")
 
+    def test_update_handler_should_adapt_the_polling_period_to_the_changes_in_the_goal_state(self):
+        with patch('azurelinuxagent.common.conf.get_initial_goal_state_period', return_value=6):
+            with patch('azurelinuxagent.common.conf.get_goal_state_period', return_value=6):
+                with patch('azurelinuxagent.common.conf.get_min_goal_state_period', return_value=2):
+                    with patch('azurelinuxagent.common.conf.get_max_goal_state_period', return_value=40):
+                        statuses = [ValidHandlerStatus.transitioning, ValidHandlerStatus.success] + [ValidHandlerStatus.success] * 7
+                        with _mock_exthandlers_handler(statuses) as exthandlers_handler:
+                            remote_access_handler = Mock()
+                            update_handler = _create_update_handler()
+
+                            polling_periods = []
+                            for _ in range(7):
+                                update_handler._process_goal_state(exthandlers_handler, remote_access_handler)
+                                polling_periods.append(update_handler._polling_period)
+                            # fast while the extension is transitioning and its status changes, then back off
+                            self.assertEqual([2, 2, 6, 12, 24, 40, 40], polling_periods)
+
+                            exthandlers_handler.protocol.mock_wire_data.set_incarnation(100)
+                            update_handler._process_goal_state(exthandlers_handler, remote_access_handler)
+                            self.assertEqual(2, update_handler._polling_period, "Expected the fast period after a new goal state")
+
+                            update_handler._process_goal_state(exthandlers_handler, remote_access_handler)
+                            self.assertEqual(6, update_handler._polling_period, "Expected the goal state period after the fast period")
+
+    def test_update_handler_should_back_off_the_polling_period_when_the_goal_state_cannot_be_retrieved(self):
+        with patch('azurelinuxagent.common.conf.get_initial_goal_state_period', return_value=6):
+            with patch('azurelinuxagent.common.conf.get_goal_state_period', return_value=6):
+                with patch('azurelinuxagent.common.conf.get_min_goal_state_period', return_value=2):
+                    with patch('azurelinuxagent.common.conf.get_max_goal_state_period', return_value=40):
+                        with _mock_exthandlers_handler([ValidHandlerStatus.transitioning] * 5) as exthandlers_handler:
+                            remote_access_handler = Mock()
+                            update_handler = _create_update_handler()
+
+                            update_handler._process_goal_state(exthandlers_handler, remote_access_handler)
+                            self.assertEqual(2, update_handler._polling_period, "Expected the fast period after a new goal state")
+
+                            polling_periods = []
+                            with patch.object(exthandlers_handler.protocol, "update_goal_state", side_effect=ProtocolError("WireServer is not available")):
+                                for _ in range(4):
+                                    update_handler._process_goal_state(exthandlers_handler, remote_access_handler)
+                                    polling_periods.append(update_handler._polling_period)
+                            self.assertEqual([6, 12, 24, 40], polling_periods, "Expected the polling period to back off while the goal state cannot be retrieved")
+
+    def test_update_handler_should_use_the_goal_state_period_when_the_adaptive_period_is_disabled(self):
+        with patch('azurelinuxagent.common.conf.get_goal_state_period', return_value=6):
+            with patch('azurelinuxagent.common.conf.get_initial_goal_state_period', return_value=6):
+                with _mock_exthandlers_handler([ValidHandlerStatus.transitioning, ValidHandlerStatus.success, ValidHandlerStatus.success]) as exthandlers_handler:
+                    update_handler = _create_update_handler()
+                    for _ in range(3):
+                        update_handler._process_goal_state(exthandlers_handler, Mock())
+                        self.assertEqual(6, update_handler._polling_period)
+
 
 if __name__ == '__main__':
     unittest.main()
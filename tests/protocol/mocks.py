@@ -214,12 +214,13 @@ class HttpRequestPredicates(object):
 
 
 class MockHttpResponse:
-    def __init__(self, status, body=b''):
+    def __init__(self, status, body=b'', headers=None):
         self.body = body
         self.status = status
+        self.headers = headers if headers is not None else []
 
     def read(self, *_):
         return self.body
 
     def getheaders(self):
-        return {}
+        return self.headers
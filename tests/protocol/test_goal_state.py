@@ -3,17 +3,27 @@
 
 import json
 import os
+import random
+import string
 
+try:
+    import tracemalloc
+except ImportError:
+    # tracemalloc is not available in Python 2
+    tracemalloc = None
+
+from azurelinuxagent.common.datacontract import get_properties
 from azurelinuxagent.common.future import httpclient
 from azurelinuxagent.common import conf
 from azurelinuxagent.common.exception import IncompleteGoalStateError
-from azurelinuxagent.common.protocol.goal_state import GoalState, ExtensionsConfig, _NUM_GS_FETCH_RETRIES
+from azurelinuxagent.common.protocol.extensions_goal_state import ExtensionsGoalState
+from azurelinuxagent.common.protocol.goal_state import GoalState, Certificates, ExtensionsConfig, _NUM_GS_FETCH_RETRIES
 from azurelinuxagent.common.protocol import hostplugin
 from azurelinuxagent.common.utils import restutil
 from tests.protocol.mocks import mock_wire_protocol
 from tests.protocol import mockwiredata
 from tests.protocol.mocks import HttpRequestPredicates, MockHttpResponse
-from tests.tools import AgentTestCase, patch
+from tests.tools import AgentTestCase, patch, data_dir, load_data, skip_if_predicate_true
 
 _original_http_request = restutil.http_request
 
@@ -98,3 +108,212 @@ class GoalStateTestCase(HttpRequestPredicates, AgentTestCase):
             self.assertEqual("GET_VM_SETTINGS_TEST_CONTAINER_ID", request_headers[1][hostplugin._HEADER_CONTAINER_ID], "The retry request did not include the expected header for the ContainerId")
             self.assertEqual("GET_VM_SETTINGS_TEST_ROLE_CONFIG_NAME", request_headers[1][hostplugin._HEADER_HOST_CONFIG_NAME], "The retry request did not include the expected header for the RoleConfigName")
 
+
+
+@patch("azurelinuxagent.common.conf.get_enable_goal_state_component_cache", return_value=True)
+class GoalStateComponentCacheTestCase(AgentTestCase):
+    def test_update_goal_state_should_reuse_the_components_that_did_not_change(self, _):
+        with mock_wire_protocol(mockwiredata.DATA_FILE) as protocol:
+            hosting_env = protocol.client.get_hosting_env()
+            shared_conf = protocol.client.get_shared_conf()
+            certs = protocol.client.get_certs()
+            self.assertTrue(len(certs.cert_list.certificates) > 0, "The test data should include certificates")
+
+            protocol.mock_wire_data.set_incarnation(2)
+            with patch("azurelinuxagent.common.protocol.goal_state.CryptUtil.decrypt_p7m") as decrypt_p7m:
+                protocol.update_goal_state()
+            self.assertEqual(0, decrypt_p7m.call_count, "The certificates should not have been decrypted again")
+            self.assertIs(hosting_env, protocol.client.get_hosting_env())
+            self.assertIs(shared_conf, protocol.client.get_shared_conf())
+            self.assertIs(certs, protocol.client.get_certs())
+
+            # if the certificate files are removed the certificates need to be processed again
+            os.remove(os.path.join(conf.get_lib_dir(), "{0}.crt".format(certs.cert_list.certificates[0].thumbprint)))
+            protocol.mock_wire_data.set_incarnation(3)
+            protocol.update_goal_state()
+            self.assertIsNot(certs, protocol.client.get_certs())
+            self.assertEqual(
+                [c.thumbprint for c in certs.cert_list.certificates],
+                [c.thumbprint for c in protocol.client.get_certs().cert_list.certificates])
+
+            # components with different content are parsed again
+            protocol.mock_wire_data.hosting_env = protocol.mock_wire_data.hosting_env.replace('instance="', 'instance="new-')
+            protocol.mock_wire_data.set_incarnation(4)
+            protocol.update_goal_state()
+            self.assertIsNot(hosting_env, protocol.client.get_hosting_env())
+            self.assertTrue(protocol.client.get_hosting_env().vm_name.startswith("new-"))
+            self.assertIs(shared_conf, protocol.client.get_shared_conf())
+
+    def test_update_goal_state_should_make_conditional_requests_when_the_wireserver_returns_an_etag(self, _):
+        with mock_wire_protocol(mockwiredata.DATA_FILE) as protocol:
+            request_headers = []
+
+            def http_get_handler(url, *_, **kwargs):
+                if "certificatesuri" in url:
+                    request_headers.append(kwargs.get("headers", {}))
+                    if "if-none-match" in kwargs.get("headers", {}):
+                        return MockHttpResponse(status=httpclient.NOT_MODIFIED)
+                    return MockHttpResponse(status=httpclient.OK, body=protocol.mock_wire_data.certs.encode("utf-8"), headers=[("ETag", "certificates-etag")])
+                return None
+            protocol.set_http_handlers(http_get_handler=http_get_handler)
+
+            protocol.mock_wire_data.set_incarnation(2)
+            protocol.update_goal_state()
+            certs = protocol.client.get_certs()
+
+            protocol.mock_wire_data.set_incarnation(3)
+            protocol.update_goal_state()
+
+            self.assertEqual(2, len(request_headers))
+            self.assertNotIn("if-none-match", request_headers[0])
+            self.assertEqual("certificates-etag", request_headers[1]["if-none-match"])
+            self.assertIs(certs, protocol.client.get_certs())
+
+
+class CertificatesTestCase(AgentTestCase):
+    def test_in_process_certificate_parsing_should_produce_the_same_certificates_as_openssl(self):
+        with mock_wire_protocol(mockwiredata.DATA_FILE) as protocol:
+            expected = sorted(c.thumbprint for c in protocol.client.get_certs().cert_list.certificates)
+            self.assertTrue(len(expected) > 0, "The test data should include certificates")
+            expected_files = sorted(f for f in os.listdir(conf.get_lib_dir()) if f.endswith(".crt") or f.endswith(".prv"))
+            for f in expected_files:
+                os.remove(os.path.join(conf.get_lib_dir(), f))
+
+            with patch("azurelinuxagent.common.conf.get_enable_in_process_certificate_parsing", return_value=True):
+                with patch("azurelinuxagent.common.protocol.goal_state.CryptUtil.get_pubkey_from_prv") as get_pubkey_from_prv:
+                    with patch("azurelinuxagent.common.protocol.goal_state.CryptUtil.get_pubkey_from_crt") as get_pubkey_from_crt:
+                        with patch("azurelinuxagent.common.protocol.goal_state.CryptUtil.get_thumbprint_from_crt") as get_thumbprint_from_crt:
+                            certs = Certificates(protocol.mock_wire_data.certs)
+
+                self.assertEqual(expected, sorted(c.thumbprint for c in certs.cert_list.certificates))
+                self.assertEqual(expected_files, sorted(f for f in os.listdir(conf.get_lib_dir()) if f.endswith(".crt") or f.endswith(".prv")))
+                self.assertEqual(0, get_pubkey_from_prv.call_count + get_pubkey_from_crt.call_count + get_thumbprint_from_crt.call_count,
+                                 "openssl should not have been invoked for each certificate")
+
+                # the public keys of the previous goal state are reused
+                with patch("azurelinuxagent.common.protocol.goal_state.CryptUtil.get_rsa_pubkey_from_pem") as get_rsa_pubkey_from_pem:
+                    certs = Certificates(protocol.mock_wire_data.certs)
+                self.assertEqual(0, get_rsa_pubkey_from_pem.call_count)
+                self.assertEqual(expected, sorted(c.thumbprint for c in certs.cert_list.certificates))
+
+
+class ExtensionsConfigParserTestCase(AgentTestCase):
+    @staticmethod
+    def _parse_extensions_config(xml_text, streaming):
+        with patch("azurelinuxagent.common.conf.get_enable_streaming_xml_parser", return_value=streaming):
+            return ExtensionsConfig(xml_text)
+
+    def _assert_extensions_configs_are_equal(self, expected, actual, test_file):
+        self.assertEqual(get_properties(expected.ext_handlers), get_properties(actual.ext_handlers), "Handlers mismatch in {0}".format(test_file))
+        self.assertEqual([h.invalid_setting_reason for h in expected.ext_handlers.extHandlers], [h.invalid_setting_reason for h in actual.ext_handlers.extHandlers],
+                         "Invalid settings mismatch in {0}".format(test_file))
+        self.assertEqual(get_properties(expected.vmagent_manifests), get_properties(actual.vmagent_manifests), "Manifests mismatch in {0}".format(test_file))
+        self.assertEqual([(f.name, f.value) for f in expected.required_features], [(f.name, f.value) for f in actual.required_features], "Features mismatch in {0}".format(test_file))
+        self.assertEqual(get_properties(expected.in_vm_gs_metadata), get_properties(actual.in_vm_gs_metadata), "Metadata mismatch in {0}".format(test_file))
+        for attribute in ["status_upload_blob", "status_upload_blob_type", "artifacts_profile_blob"]:
+            self.assertEqual(getattr(expected, attribute), getattr(actual, attribute), "{0} mismatch in {1}".format(attribute, test_file))
+
+    def test_streaming_parser_should_produce_the_same_extensions_config_as_minidom(self):
+        test_files = []
+        for directory in ["wire", os.path.join("wire", "multi-config"), os.path.join("wire", "invalid_config")]:
+            test_files.extend([os.path.join(directory, f) for f in os.listdir(os.path.join(data_dir, directory)) if f.startswith("ext_conf") and f.endswith(".xml")])
+        self.assertTrue(len(test_files) > 20, "Could not find the test data")
+
+        for test_file in test_files:
+            xml_text = load_data(test_file)
+            self._assert_extensions_configs_are_equal(
+                self._parse_extensions_config(xml_text, streaming=False),
+                self._parse_extensions_config(xml_text, streaming=True),
+                test_file)
+
+    @staticmethod
+    def _create_large_extensions_config(handler_count, protected_settings_size):
+        plugins = []
+        plugin_settings = []
+        for i in range(handler_count):
+            name = "Microsoft.Test.Extension{0}".format(i)
+            plugins.append('<Plugin name="{0}" version="1.0.{1}" location="https://test.blob.core.windows.net/{0}_manifest.xml" state="enabled" autoUpgrade="false" '
+                           'failoverlocation="https://test2.blob.core.windows.net/{0}_manifest.xml" runAsStartupTask="false" isJson="true" useExactVersion="true" />'.format(name, i))
+            settings = {
+                "runtimeSettings": [{
+                    "handlerSettings": {
+                        "protectedSettingsCertThumbprint": "BD447EF71C3ADDF7C837E84D630F3FAC22CCD22F",
+                        "protectedSettings": ''.join(random.choice(string.ascii_letters + string.digits) for _ in range(protected_settings_size)),
+                        "publicSettings": {"index": i}
+                    }
+                }]
+            }
+            plugin_settings.append('<Plugin name="{0}" version="1.0.{1}"><DependsOn dependencyLevel="{2}"><DependsOnExtension handler="Microsoft.Test.Extension0" /></DependsOn>'
+                                   '<RuntimeSettings seqNo="{1}">{3}</RuntimeSettings></Plugin>'.format(name, i, i % 5, json.dumps(settings)))
+        return '<?xml version="1.0" encoding="utf-8"?><Extensions version="1.0.0.0" goalStateIncarnation="1">' \
+               '<GAFamilies><GAFamily><Name>Prod</Name><Uris><Uri>https://test.blob.core.windows.net/Prod_manifest.xml</Uri></Uris></GAFamily></GAFamilies>' \
+               '<Plugins>{0}</Plugins><PluginSettings>{1}</PluginSettings>' \
+               '<StatusUploadBlob statusBlobType="BlockBlob">https://test.blob.core.windows.net/status</StatusUploadBlob></Extensions>'.format(''.join(plugins), ''.join(plugin_settings))
+
+    def test_streaming_parser_should_parse_large_extensions_configs(self):
+        xml_text = self._create_large_extensions_config(handler_count=60, protected_settings_size=64 * 1024)
+
+        streaming_config = self._parse_extensions_config(xml_text, streaming=True)
+
+        self.assertEqual(60, len(streaming_config.ext_handlers.extHandlers))
+        self._assert_extensions_configs_are_equal(self._parse_extensions_config(xml_text, streaming=False), streaming_config, "the generated ExtensionsConfig")
+
+    @skip_if_predicate_true(lambda: tracemalloc is None, "tracemalloc is not available")
+    def test_streaming_parser_should_use_less_memory_than_minidom(self):
+        xml_text = self._create_large_extensions_config(handler_count=60, protected_settings_size=64 * 1024)
+
+        def get_peak_memory(streaming):
+            tracemalloc.start()
+            try:
+                self._parse_extensions_config(xml_text, streaming)
+                return tracemalloc.get_traced_memory()[1]
+            finally:
+                tracemalloc.stop()
+
+        minidom_peak = get_peak_memory(streaming=False)
+        streaming_peak = get_peak_memory(streaming=True)
+
+        self.assertTrue(streaming_peak < minidom_peak, "The streaming parser used more memory ({0} bytes) than minidom ({1} bytes)".format(streaming_peak, minidom_peak))
+
+
+class ExtensionsGoalStateTestCase(AgentTestCase):
+    def test_parse_should_create_the_same_ext_handlers_as_the_extensions_config(self):
+        for vm_settings_file, ext_conf_file in [
+                ("hostgaplugin/vm_settings.json", "hostgaplugin/ext_conf.xml"),
+                ("hostgaplugin/vm_settings-protected_settings.json", "hostgaplugin/ext_conf-protected_settings.xml")]:
+            extensions_goal_state = ExtensionsGoalState("1", load_data(vm_settings_file))
+            extensions_goal_state.parse()
+            extensions_config = ExtensionsConfig(load_data(ext_conf_file))
+
+            def get_handlers(ext_handlers):
+                # the ExtensionsConfig includes a failover location that is not in the vmSettings
+                handlers = []
+                for handler in ext_handlers.extHandlers:
+                    properties = get_properties(handler)
+                    properties["versionUris"] = properties["versionUris"][:1]
+                    handlers.append(properties)
+                return handlers
+
+            self.assertEqual(get_handlers(extensions_config.ext_handlers), get_handlers(extensions_goal_state.ext_handlers),
+                             "{0} and {1} produced different handlers".format(vm_settings_file, ext_conf_file))
+            self.assertEqual([f.name for f in extensions_config.required_features], [f.name for f in extensions_goal_state.required_features])
+
+    def test_get_ext_handlers_should_use_the_vm_settings_when_enabled(self):
+        with patch("azurelinuxagent.common.conf.get_enable_fast_track", return_value=True):
+            with patch("azurelinuxagent.common.conf.get_enable_vm_settings_extension_processing", return_value=True):
+                with mock_wire_protocol(mockwiredata.DATA_FILE_VM_SETTINGS) as protocol:
+                    ext_handlers, incarnation = protocol.get_ext_handlers()
+                    self.assertIs(protocol.client.get_extensions_goal_state().ext_handlers, ext_handlers, "The handlers should come from the vmSettings")
+                    self.assertEqual(protocol.client.get_goal_state().incarnation, incarnation)
+                    self.assertEqual("c86d8064-6f11-4145-8178-e0587e0584de", protocol.get_in_vm_gs_metadata().activity_id)
+
+                    # invalid vmSettings fall back to the ExtensionsConfig
+                    protocol.mock_wire_data.vm_settings = "invalid JSON"
+                    protocol.mock_wire_data.set_etag(2)
+                    protocol.update_goal_state()
+                    ext_handlers, _ = protocol.get_ext_handlers()
+                    self.assertIs(protocol.client.get_ext_conf().ext_handlers, ext_handlers, "The handlers should come from the ExtensionsConfig")
+
+            with mock_wire_protocol(mockwiredata.DATA_FILE_VM_SETTINGS) as protocol:
+                ext_handlers, _ = protocol.get_ext_handlers()
+                self.assertIs(protocol.client.get_ext_conf().ext_handlers, ext_handlers, "The vmSettings should not be used when the feature is disabled")
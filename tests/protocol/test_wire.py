@@ -21,6 +21,7 @@ import json
 import os
 import re
 import socket
+import threading
 import time
 import unittest
 import uuid
@@ -29,16 +30,20 @@ from datetime import datetime, timedelta
 from azurelinuxagent.common import conf
 from azurelinuxagent.common.agent_supported_feature import SupportedFeatureNames, get_supported_feature_by_name, \
     get_agent_supported_features_list_for_crp
+from azurelinuxagent.common.datacontract import get_properties
+from azurelinuxagent.common.event import WALAEventOperation
+from azurelinuxagent.common.future import httpclient
 from azurelinuxagent.common.exception import ResourceGoneError, ProtocolError, \
     ExtensionDownloadError, HttpError
 from azurelinuxagent.common.protocol.goal_state import ExtensionsConfig
 from azurelinuxagent.common.protocol.hostplugin import HostPluginProtocol
-from azurelinuxagent.common.protocol.restapi import VMAgentManifestUri
+from azurelinuxagent.common.protocol.restapi import VMAgentManifestUri, ExtHandlerStatus, ExtensionStatus
 from azurelinuxagent.common.protocol.wire import WireProtocol, WireClient, \
-    InVMArtifactsProfile, StatusBlob, VMStatus, EXT_CONF_FILE_NAME
+    InVMArtifactsProfile, StatusBlob, VMStatus, EXT_CONF_FILE_NAME, MAX_EVENT_BUFFER_SIZE, event_to_v1_encoded, \
+    ExtensionManifest, VersionInfo, WARM_START_FILE_NAME, WARM_START_SNAPSHOT_MAX_AGE_IN_SECONDS
 from azurelinuxagent.common.telemetryevent import GuestAgentExtensionEventsSchema, \
     TelemetryEventParam, TelemetryEvent
-from azurelinuxagent.common.utils import restutil
+from azurelinuxagent.common.utils import fileutil, restutil
 from azurelinuxagent.common.version import CURRENT_VERSION, DISTRO_NAME, DISTRO_VERSION
 from azurelinuxagent.ga.exthandlers import get_exthandlers_handler
 from tests.ga.test_monitor import random_generator
@@ -46,7 +51,7 @@ from tests.protocol import mockwiredata
 from tests.protocol.mocks import mock_wire_protocol, HttpRequestPredicates
 from tests.protocol.mockwiredata import DATA_FILE_NO_EXT, DATA_FILE
 from tests.protocol.mockwiredata import WireProtocolData
-from tests.tools import Mock, patch, AgentTestCase
+from tests.tools import Mock, patch, AgentTestCase, load_data
 
 data_with_bom = b'\xef\xbb\xbfhehe'
 testurl = 'http://foo'
@@ -82,6 +87,30 @@ def create_mock_protocol(artifacts_profile_blob=None, status_upload_blob=None, s
         yield protocol
 
 
+class PageBlobStorage(object):
+    """
+    Stand-in for the storage service that keeps the content of page blobs and counts the bytes uploaded to them
+    """
+    def __init__(self):
+        self.blobs = {}
+        self.bytes_uploaded = 0
+        self.creates = 0
+
+    def call_storage_service(self, _http_req, url, data, headers):
+        if "comp=page" not in url:
+            self.blobs[url] = bytearray(int(headers["x-ms-blob-content-length"]))
+            self.creates += 1
+        else:
+            url = re.sub(r"[?&]comp=page", "", url)
+            start, end = [int(x) for x in re.match(r"bytes=(\d+)-(\d+)", headers["x-ms-range"]).groups()]
+            content = bytearray(data)
+            if len(content) != end + 1 - start or int(headers["Content-Length"]) != len(content):
+                return Mock(status=httpclient.BAD_REQUEST)
+            self.blobs[url][start:end + 1] = content
+            self.bytes_uploaded += len(content)
+        return Mock(status=httpclient.CREATED)
+
+
 @patch("time.sleep")
 @patch("azurelinuxagent.common.protocol.wire.CryptUtil")
 @patch("azurelinuxagent.common.protocol.healthservice.HealthService._report")
@@ -239,6 +268,136 @@ class TestWireProtocol(AgentTestCase):
             urls = protocol.get_tracked_urls()
             self.assertEqual(len(urls), 1, 'Expected one post request to the host: [{0}]'.format(urls))
 
+    def test_warm_start_snapshot_should_report_the_last_status_on_startup(self, *_):
+        with mock_wire_protocol(mockwiredata.DATA_FILE) as protocol:
+            protocol.client.status_blob.vm_status = VMStatus(message="Ready", status="Ready")
+            with patch.object(HostPluginProtocol, "_put_block_blob_status"):
+                protocol.client.upload_status_blob()
+            protocol.client.save_warm_start_snapshot()
+            reported_status = json.loads(protocol.client.status_blob.data)
+            ext_conf = protocol.client.get_ext_conf()
+            container_id = protocol.client.get_goal_state().container_id
+
+        snapshot = WireClient.load_warm_start_snapshot()
+        self.assertIsNotNone(snapshot, "The snapshot should have been saved")
+        self.assertEqual(container_id, snapshot["containerId"])
+
+        # a new client (e.g. after an agent update) reports the status before fetching the goal state
+        client = WireClient(WIRESERVER_URL)
+        with patch("azurelinuxagent.common.protocol.wire.CURRENT_VERSION", "9.9.9.10"):
+            with patch.object(HostPluginProtocol, "ensure_initialized", return_value=True):
+                with patch.object(HostPluginProtocol, "_put_block_blob_status") as put_block_blob_status:
+                    client.report_warm_start_status(snapshot)
+
+        put_block_blob_status.assert_called_once_with(ext_conf.status_upload_blob, client.status_blob)
+        self.assertEqual(container_id, client.get_host_plugin().container_id)
+        status = json.loads(client.status_blob.data)
+        self.assertEqual("9.9.9.10", status["aggregateStatus"]["guestAgentStatus"]["version"])
+        self.assertEqual(reported_status["aggregateStatus"]["handlerAggregateStatus"], status["aggregateStatus"]["handlerAggregateStatus"])
+
+        with patch("azurelinuxagent.common.protocol.wire.time.time", return_value=snapshot["timestamp"] + 2 * 60 * 60):
+            self.assertIsNone(WireClient.load_warm_start_snapshot(), "Old snapshots should be ignored")
+
+    def test_warm_start_snapshot_should_be_saved_only_when_it_changes(self, *_):
+        with mock_wire_protocol(mockwiredata.DATA_FILE) as protocol:
+            with patch.object(HostPluginProtocol, "_put_block_blob_status"):
+                with patch("azurelinuxagent.common.protocol.wire.fileutil.write_file", wraps=fileutil.write_file) as write_file:
+                    def save_snapshot(status, timestamp, save_time):
+                        protocol.client.status_blob.vm_status = VMStatus(message=status, status=status)
+                        with patch("time.gmtime", return_value=time.gmtime(timestamp)):
+                            protocol.client.upload_status_blob()
+                        with patch("azurelinuxagent.common.protocol.wire.time.time", return_value=save_time):
+                            protocol.client.save_warm_start_snapshot()
+                        return len([c for c in write_file.call_args_list if c[0][0].endswith(WARM_START_FILE_NAME + ".tmp")])
+
+                    self.assertEqual(1, save_snapshot("Ready", timestamp=0, save_time=1000))
+                    self.assertEqual(1, save_snapshot("Ready", timestamp=60, save_time=1060), "An unchanged snapshot should not have been saved")
+                    self.assertEqual(2, save_snapshot("NotReady", timestamp=120, save_time=1120), "The snapshot should have been saved when the status changed")
+                    self.assertEqual(3, save_snapshot("NotReady", timestamp=180, save_time=1120 + WARM_START_SNAPSHOT_MAX_AGE_IN_SECONDS / 2),
+                                     "The snapshot should have been saved again before it expires")
+
+    def test_report_warm_start_status_should_default_to_block_blobs(self, *_):
+        with mock_wire_protocol(mockwiredata.DATA_FILE) as protocol:
+            protocol.client.status_blob.vm_status = VMStatus(message="Ready", status="Ready")
+            with patch.object(HostPluginProtocol, "_put_block_blob_status"):
+                protocol.client.upload_status_blob()
+            protocol.client.save_warm_start_snapshot()
+
+        snapshot = WireClient.load_warm_start_snapshot()
+        snapshot["statusUploadBlobType"] = None
+        client = WireClient(WIRESERVER_URL)
+        with patch.object(HostPluginProtocol, "put_vm_status") as put_vm_status:
+            client.report_warm_start_status(snapshot)
+
+        put_vm_status.assert_called_once_with(client.status_blob, snapshot["statusUploadBlob"], "BlockBlob")
+
+    def test_upload_status_blob_should_skip_unchanged_status_until_the_refresh_period(self, *_):
+        with patch("azurelinuxagent.common.conf.get_status_upload_refresh_period", return_value=300):
+            with mock_wire_protocol(mockwiredata.DATA_FILE) as protocol:
+                with patch.object(HostPluginProtocol, "_put_block_blob_status") as put_block_blob_status:
+                    with patch("azurelinuxagent.common.protocol.wire.time.time", return_value=1000):
+                        def create_vm_status(status):
+                            vm_status = VMStatus(message=status, status=status)
+                            handler_status = ExtHandlerStatus(name="Publisher.Handler", version="1.0.0", status="Ready", message="Plugin enabled")
+                            handler_status.extension_status = ExtensionStatus(name="Extension", operation="Enable", status="success", seq_no=0, code=0, message="Enabled")
+                            vm_status.vmAgent.extensionHandlers.append(handler_status)
+                            return vm_status
+
+                        # the timestamps of the status (including those of the extension statuses) change on each upload
+                        with patch("time.gmtime", side_effect=[time.gmtime(60 * i) for i in range(100)]):
+                            protocol.client.status_blob.vm_status = create_vm_status("Ready")
+                            protocol.client.upload_status_blob()
+                            protocol.client.upload_status_blob()
+                        self.assertEqual(1, put_block_blob_status.call_count, "The unchanged status should not have been uploaded")
+
+                        protocol.client.status_blob.vm_status = create_vm_status("NotReady")
+                        protocol.client.upload_status_blob()
+                        self.assertEqual(2, put_block_blob_status.call_count, "The new status should have been uploaded")
+
+                    with patch("azurelinuxagent.common.protocol.wire.time.time", return_value=1000 + 300):
+                        protocol.client.upload_status_blob()
+                        self.assertEqual(3, put_block_blob_status.call_count, "The status should have been uploaded after the refresh period")
+
+    def test_put_page_blob_should_upload_only_the_pages_that_changed(self, *_):
+        url = "http://storage.test/status?sig=abc"
+        storage = PageBlobStorage()
+        client = Mock(call_storage_service=storage.call_storage_service)
+        status_blob = StatusBlob(client=client)
+
+        def uploaded_status():
+            return bytes(storage.blobs[url]).rstrip(b"\0").decode("utf-8")
+
+        status = json.dumps({"extensions": [{"name": "Ext{0}".format(i), "status": "transitioning", "message": "x" * 200} for i in range(1000)]})
+        with patch("azurelinuxagent.common.conf.get_enable_delta_page_blob_upload", return_value=True):
+            status_blob.put_page_blob(url, status)
+            self.assertEqual(status, uploaded_status())
+            self.assertEqual(1, storage.creates)
+            full_upload = storage.bytes_uploaded
+            self.assertTrue(full_upload >= len(status), "The first upload should include the entire status")
+
+            status = status.replace('"Ext500", "status": "transitioning"', '"Ext500", "status": "success"      ', 1)
+            status_blob.put_page_blob(url, status)
+            self.assertEqual(status, uploaded_status())
+            self.assertEqual(1, storage.creates, "The blob should not have been created again")
+            self.assertTrue(storage.bytes_uploaded - full_upload <= 2 * 512, "Only the pages that changed should have been uploaded; uploaded {0} bytes".format(storage.bytes_uploaded - full_upload))
+
+            # a shorter status in the same size class clears the end of the previous one
+            uploaded = storage.bytes_uploaded
+            status = status[:len(status) - 600] + "}"
+            status_blob.put_page_blob(url, status)
+            self.assertEqual(status, uploaded_status())
+            self.assertEqual(1, storage.creates, "The blob should not have been created again")
+            self.assertTrue(storage.bytes_uploaded - uploaded <= 3 * 512)
+
+            # a change in the size class creates the blob again, and so does an upload through the HostGAPlugin
+            status = status + " " * 8192
+            status_blob.put_page_blob(url, status)
+            self.assertEqual(status.rstrip(), uploaded_status().rstrip())
+            self.assertEqual(2, storage.creates)
+            status_blob.discard_page_image(url)
+            status_blob.put_page_blob(url, status)
+            self.assertEqual(3, storage.creates)
+
     def test_upload_status_blob_host_ga_plugin(self, *_):
         with create_mock_protocol(status_upload_blob=testurl, status_upload_blob_type=testtype) as protocol:
             protocol.client.status_blob.vm_status = VMStatus(message="Ready", status="Ready")
@@ -491,6 +650,112 @@ class TestWireProtocol(AgentTestCase):
 
         self.assertEqual(patch_send_event.call_count, 0)
 
+    def test_report_event_should_send_large_numbers_of_events_in_order_in_batches_under_the_size_limit(self, *args):  # pylint: disable=unused-argument
+        # pushes a large backlog of events (e.g. after a WireServer outage) through report_event and verifies that
+        # every event is sent exactly once, in order, and that no batch exceeds the buffer limit
+        event_count = 30000
+        providers = ["69B669B9-4AF8-4C50-BDC4-6006FA76E975", "FFF0196F-EE4C-4EAF-9AA5-776F622DEB4F"]
+        event_list = []
+        for i in range(event_count):
+            event = get_event(message="Event {0} {1}".format(i, random_generator(100)))
+            event.providerId = providers[i % len(providers)]
+            event_list.append(event)
+
+        sent = {}
+
+        def mock_send_encoded_event(provider_id, event_str, *_, **__):
+            self.assertIsInstance(event_str, bytes)
+            self.assertTrue(len(event_str) < MAX_EVENT_BUFFER_SIZE, "The batch exceeds the maximum buffer size")
+            sent.setdefault(provider_id, []).append(event_str)
+
+        client = WireProtocol(WIRESERVER_URL).client
+        with patch("azurelinuxagent.common.protocol.wire.WireClient.send_encoded_event", side_effect=mock_send_encoded_event):
+            client.report_event(self._get_telemetry_events_generator(event_list))
+
+        for provider_id in providers:
+            expected = b"".join([event_to_v1_encoded(e) for e in event_list if e.providerId == provider_id])
+            self.assertEqual(expected, b"".join(sent[provider_id]), "The events for {0} were not sent correctly".format(provider_id))
+
+        self.assertTrue(sum([len(batches) for batches in sent.values()]) > len(providers), "The events should have been sent in multiple batches")
+
+    def test_report_event_should_send_the_events_of_different_providers_concurrently(self, *args):  # pylint: disable=unused-argument
+        providers = ["PROVIDER-{0}".format(i) for i in range(8)]
+        event_list = []
+        for provider_id in providers:
+            event = get_event(message="Event for {0}".format(provider_id))
+            event.providerId = provider_id
+            event_list.append(event)
+
+        lock = threading.Lock()
+        max_uploads_in_flight = threading.Event()
+        in_flight = [0]
+        max_in_flight = [0]
+        sent = []
+
+        def mock_send_encoded_event(provider_id, *_, **__):
+            with lock:
+                in_flight[0] += 1
+                max_in_flight[0] = max(max_in_flight[0], in_flight[0])
+                if in_flight[0] == 3:
+                    max_uploads_in_flight.set()
+            # hold the first uploads until the maximum number of concurrent uploads is reached
+            max_uploads_in_flight.wait(10)
+            with lock:
+                in_flight[0] -= 1
+                sent.append(provider_id)
+            if provider_id == "PROVIDER-5":
+                raise ProtocolError("Failed to send events for {0}".format(provider_id))
+
+        client = WireProtocol(WIRESERVER_URL).client
+        with patch("azurelinuxagent.common.conf.get_max_concurrent_event_uploads", return_value=3):
+            with patch("azurelinuxagent.common.protocol.wire.WireClient.send_encoded_event", side_effect=mock_send_encoded_event):
+                with patch("azurelinuxagent.common.event.add_event") as mock_add_event:
+                    client.report_event(self._get_telemetry_events_generator(event_list))
+
+        self.assertEqual(sorted(providers), sorted(sent), "All the providers should have been sent")
+        self.assertEqual(3, max_in_flight[0], "The uploads should be concurrent, and capped to the maximum number of concurrent uploads")
+        errors = [kw for _, kw in mock_add_event.call_args_list if kw['op'] == WALAEventOperation.ReportEventErrors]
+        self.assertEqual(1, len(errors), "The failure should have been reported. Events: {0}".format(mock_add_event.call_args_list))
+        self.assertIn("DroppedEventsCount: 1", errors[0]['message'])
+
+
+    def test_report_event_should_send_the_buffers_of_each_provider_in_order_when_uploads_are_concurrent(self, *args):  # pylint: disable=unused-argument
+        # most of the events are from the first provider, so its buffers are submitted one after the other
+        providers = ["PROVIDER-0", "PROVIDER-1"]
+        event_list = []
+        for i in range(5000):
+            event = get_event(message="Event {0} {1}".format(i, random_generator(100)))
+            event.providerId = providers[1] if i % 10 == 0 else providers[0]
+            event_list.append(event)
+
+        lock = threading.Lock()
+        started = set()
+        next_batch_started = threading.Event()
+        sent = {}
+
+        def mock_send_encoded_event(provider_id, event_str, *_, **__):
+            with lock:
+                is_first_batch = provider_id not in started
+                started.add(provider_id)
+            # hold the first batch of the first provider until the next one starts (or a timeout), so that the next
+            # batches would be sent before it if the batches of the same provider were sent concurrently
+            if provider_id == providers[0]:
+                if is_first_batch:
+                    next_batch_started.wait(0.5)
+                else:
+                    next_batch_started.set()
+            with lock:
+                sent.setdefault(provider_id, []).append(event_str)
+
+        client = WireProtocol(WIRESERVER_URL).client
+        with patch("azurelinuxagent.common.conf.get_max_concurrent_event_uploads", return_value=3):
+            with patch("azurelinuxagent.common.protocol.wire.WireClient.send_encoded_event", side_effect=mock_send_encoded_event):
+                client.report_event(self._get_telemetry_events_generator(event_list))
+
+        for provider_id in providers:
+            self.assertTrue(len(sent[provider_id]) > 1, "The events of {0} should have been sent in multiple batches".format(provider_id))
+            expected = b"".join([event_to_v1_encoded(e) for e in event_list if e.providerId == provider_id])
+            self.assertEqual(expected, b"".join(sent[provider_id]), "The events of {0} were not sent in order".format(provider_id))
 
 class TestWireClient(HttpRequestPredicates, AgentTestCase):
     def test_get_ext_conf_without_extensions_should_retrieve_vmagent_manifests_info(self, *args):  # pylint: disable=unused-argument
@@ -1028,6 +1293,37 @@ class TestWireClient(HttpRequestPredicates, AgentTestCase):
                 self.assertFalse(HostPluginProtocol.is_default_channel)
 
 
+class XmlParserTestCase(AgentTestCase):
+    """
+    Tests for the streaming (ElementTree.iterparse) parser of the ExtensionManifest and VersionInfo
+    """
+    def test_streaming_parser_should_produce_the_same_extension_manifests_as_minidom(self):
+        test_files = ["manifest.xml", "manifest_deletion.xml", "ga_manifest.xml", "ga_manifest_1.xml", "ga_manifest_2.xml"]
+        for test_file in test_files:
+            xml_text = load_data(os.path.join("wire", test_file))
+            with patch("azurelinuxagent.common.conf.get_enable_streaming_xml_parser", return_value=False):
+                expected = ExtensionManifest(xml_text)
+            with patch("azurelinuxagent.common.conf.get_enable_streaming_xml_parser", return_value=True):
+                actual = ExtensionManifest(xml_text)
+            self.assertTrue(len(actual.pkg_list.versions) > 0, "No packages in {0}".format(test_file))
+            self.assertEqual(get_properties(expected.pkg_list), get_properties(actual.pkg_list), "Packages mismatch in {0}".format(test_file))
+
+        xml_text = '<PluginVersionManifest><InternalPlugins><Plugin><Version>1.0.0</Version><Uris><Uri>http://internal</Uri></Uris></Plugin></InternalPlugins>' \
+                   '<Plugins><Plugin><Version>2.0.0</Version><DisallowMajorVersionUpgrade>True</DisallowMajorVersionUpgrade><Uris><Uri>http://public</Uri></Uris></Plugin></Plugins></PluginVersionManifest>'
+        with patch("azurelinuxagent.common.conf.get_enable_streaming_xml_parser", return_value=True):
+            manifest = ExtensionManifest(xml_text)
+        self.assertEqual([("2.0.0", False, True), ("1.0.0", True, False)], [(p.version, p.isinternal, p.disallow_major_upgrade) for p in manifest.pkg_list.versions])
+
+    def test_streaming_parser_should_produce_the_same_version_info_as_minidom(self):
+        for xml_text in [load_data("wire/version_info.xml"), "<Versions><Supported><Version>2010-12-15</Version></Supported></Versions>"]:
+            with patch("azurelinuxagent.common.conf.get_enable_streaming_xml_parser", return_value=False):
+                expected = VersionInfo(xml_text)
+            with patch("azurelinuxagent.common.conf.get_enable_streaming_xml_parser", return_value=True):
+                actual = VersionInfo(xml_text)
+            self.assertEqual(expected.get_preferred(), actual.get_preferred())
+            self.assertEqual(expected.get_supported(), actual.get_supported())
+
+
 class UpdateGoalStateTestCase(AgentTestCase):
     """
     Tests for WireClient.update_goal_state()
@@ -1175,6 +1471,13 @@ class UpdateGoalStateTestCase(AgentTestCase):
                 self.assertEqual(archives[1], second_archive_name, "The name of goal state archive should match the second goal state timestamp and incarnation")
 
     def test_update_goal_state_should_not_persist_the_protected_settings(self):
+        self._assert_update_goal_state_does_not_persist_the_protected_settings()
+
+    def test_update_goal_state_should_not_persist_the_protected_settings_when_streaming_the_goal_state_cache(self):
+        with patch("azurelinuxagent.common.conf.get_enable_streaming_goal_state_cache", return_value=True):
+            self._assert_update_goal_state_does_not_persist_the_protected_settings()
+
+    def _assert_update_goal_state_does_not_persist_the_protected_settings(self):
         with mock_wire_protocol(mockwiredata.DATA_FILE_MULTIPLE_EXT) as protocol:
             # instantiating the protocol fetches the goal state, so there is no need to do another call to update_goal_state()
             goal_state = protocol.client.get_goal_state()
@@ -33,7 +33,33 @@ Debug.CgroupCheckPeriod = 300
 Debug.CgroupDisableOnProcessCheckFailure = True
 Debug.CgroupDisableOnQuotaCheckFailure = True
 Debug.CgroupLogMetrics = False
+Debug.EnableDeltaPageBlobUpload = False
+Debug.EnableEventDirectoryWatcher = False
+Debug.EnableEventSpool = False
+Debug.EnableExtensionStatusCache = False
 Debug.EnableFastTrack = False
+Debug.EnableGoalStateComponentCache = False
+Debug.EnableGoalStateHistoryStore = False
+Debug.EnableHttpConnectionPool = False
+Debug.EnableInProcessCertificateParsing = False
+Debug.EnableIncrementalExtensionProcessing = False
+Debug.EnableJitteredScheduling = False
+Debug.EnableStreamingGoalStateCache = False
+Debug.EnableStreamingXmlParser = False
+Debug.EnableTelemetryDeliveryLedger = False
+Debug.EnableVmSettingsExtensionProcessing = False
+Debug.EnableWarmStart = False
+Debug.GoalStateHistoryMaxSizeKB = 10240
+Debug.MaxConcurrentEventUploads = 1
+Debug.MaxConcurrentExtensionOperations = 1
+Debug.MaxGoalStatePeriod = 0
+Debug.MaxSchedulingJitter = 30
+Debug.MinGoalStatePeriod = 2
+Debug.StatusUploadRefreshPeriod = 0
+Debug.TelemetryQueueMaxEvents = 5000
+Debug.TelemetryQueueMaxSizeKB = 8192
+Debug.WireServerRequestBurst = 10
+Debug.WireServerRequestRate = 0
 DetectScvmmEnv = False
 EnableOverProvisioning = True
 Extension.LogDir = /var/log/azure
@@ -90,13 +116,13 @@ class TestAgent(AgentTestCase):
 
     def test_accepts_configuration_path(self):
         conf_path = os.path.join(data_dir, "test_waagent.conf")
-        c, f, v, d, cfp, lcm, _ = parse_args(["-configuration-path:" + conf_path])  # pylint: disable=unused-variable
+        c, f, v, d, cfp, lcm, _, _ = parse_args(["-configuration-path:" + conf_path])  # pylint: disable=unused-variable
         self.assertEqual(cfp, conf_path)
 
     @patch("os.path.exists", return_value=True)
     def test_checks_configuration_path(self, mock_exists):
         conf_path = "/foo/bar-baz/something.conf"
-        c, f, v, d, cfp, lcm, _ = parse_args(["-configuration-path:"+conf_path])  # pylint: disable=unused-variable
+        c, f, v, d, cfp, lcm, _, _ = parse_args(["-configuration-path:"+conf_path])  # pylint: disable=unused-variable
         self.assertEqual(cfp, conf_path)
         self.assertEqual(mock_exists.call_count, 1)
 
@@ -105,12 +131,12 @@ class TestAgent(AgentTestCase):
     @patch("sys.exit", side_effect=Exception)
     def test_rejects_missing_configuration_path(self, mock_exit, mock_exists, mock_stderr):  # pylint: disable=unused-argument
         try:
-            c, f, v, d, cfp, lcm, _ = parse_args(["-configuration-path:/foo/bar.conf"])  # pylint: disable=unused-variable
+            c, f, v, d, cfp, lcm, _, _ = parse_args(["-configuration-path:/foo/bar.conf"])  # pylint: disable=unused-variable
         except Exception:
             self.assertEqual(mock_exit.call_count, 1)
 
     def test_configuration_path_defaults_to_none(self):
-        c, f, v, d, cfp, lcm, _ = parse_args([])  # pylint: disable=unused-variable
+        c, f, v, d, cfp, lcm, _, _ = parse_args([])  # pylint: disable=unused-variable
         self.assertEqual(cfp, None)
 
     def test_agent_accepts_configuration_path(self):
@@ -187,12 +213,12 @@ class TestAgent(AgentTestCase):
 
     def test_checks_log_collector_mode(self):
         # Specify full mode
-        c, f, v, d, cfp, lcm, _ = parse_args(["-collect-logs", "-full"])  # pylint: disable=unused-variable
+        c, f, v, d, cfp, lcm, _, _ = parse_args(["-collect-logs", "-full"])  # pylint: disable=unused-variable
         self.assertEqual(c, "collect-logs")
         self.assertEqual(lcm, True)
 
         # Defaults to None if mode not specified
-        c, f, v, d, cfp, lcm, _ = parse_args(["-collect-logs"])  # pylint: disable=unused-variable
+        c, f, v, d, cfp, lcm, _, _ = parse_args(["-collect-logs"])  # pylint: disable=unused-variable
         self.assertEqual(c, "collect-logs")
         self.assertEqual(lcm, False)
 
@@ -200,7 +226,7 @@ class TestAgent(AgentTestCase):
     @patch("sys.exit", side_effect=Exception)
     def test_rejects_invalid_log_collector_mode(self, mock_exit, mock_stderr):  # pylint: disable=unused-argument
         try:
-            c, f, v, d, cfp, lcm, _ = parse_args(["-collect-logs", "-notvalid"])  # pylint: disable=unused-variable
+            c, f, v, d, cfp, lcm, _, _ = parse_args(["-collect-logs", "-notvalid"])  # pylint: disable=unused-variable
         except Exception:
             self.assertEqual(mock_exit.call_count, 1)
 
@@ -267,7 +293,7 @@ class TestAgent(AgentTestCase):
             "uid": "9999",
             "wait": "-w"
         }
-        cmd, _, _, _, _, _, firewall_metadata = parse_args(
+        cmd, _, _, _, _, _, firewall_metadata, _ = parse_args(
             ["-{0}".format(AgentCommands.SetupFirewall), "-dst_ip=1.2.3.4", "-uid=9999", "-w"])
 
         self.assertEqual(cmd, AgentCommands.SetupFirewall)
@@ -279,10 +305,19 @@ class TestAgent(AgentTestCase):
             "uid": None,
             "wait": ""
         }
-        cmd, _, _, _, _, _, firewall_metadata = parse_args(["-{0}".format(AgentCommands.Help)])
+        cmd, _, _, _, _, _, firewall_metadata, _ = parse_args(["-{0}".format(AgentCommands.Help)])
         self.assertEqual(cmd, AgentCommands.Help)
         self.assertEqual(test_firewall_meta, firewall_metadata)
 
+    def test_it_should_parse_show_goal_state_history_properly(self):
+        cmd, _, _, _, _, _, _, incarnation = parse_args(["-{0}".format(AgentCommands.ShowGoalStateHistory), "-incarnation=12"])
+        self.assertEqual(cmd, AgentCommands.ShowGoalStateHistory)
+        self.assertEqual("12", incarnation)
+
+        cmd, _, _, _, _, _, _, incarnation = parse_args(["-{0}".format(AgentCommands.ShowGoalStateHistory)])
+        self.assertEqual(cmd, AgentCommands.ShowGoalStateHistory)
+        self.assertIsNone(incarnation)
+
     def test_it_should_ignore_empty_arguments(self):
 
         test_firewall_meta = {
@@ -290,7 +325,7 @@ class TestAgent(AgentTestCase):
             "uid": "9999",
             "wait": ""
         }
-        cmd, _, _, _, _, _, firewall_metadata = parse_args(
+        cmd, _, _, _, _, _, firewall_metadata, _ = parse_args(
             ["-{0}".format(AgentCommands.SetupFirewall), "-dst_ip=1.2.3.4", "-uid=9999", ""])
 
         self.assertEqual(cmd, AgentCommands.SetupFirewall)
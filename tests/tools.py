@@ -36,6 +36,7 @@ import azurelinuxagent.common.event as event
 import azurelinuxagent.common.logger as logger
 from azurelinuxagent.common.future import range  # pylint: disable=redefined-builtin
 from azurelinuxagent.common.utils import fileutil
+from azurelinuxagent.common.utils.inotifyutil import DirectoryWatcher
 from azurelinuxagent.common.version import PY_VERSION_MAJOR
 
 try:
@@ -121,6 +122,14 @@ def is_python_version_26():
     return sys.version_info[0] == 2 and sys.version_info[1] == 6
 
 
+def is_inotify_not_available():
+    watcher = DirectoryWatcher()
+    try:
+        return not watcher.is_available()
+    finally:
+        watcher.close()
+
+
 class AgentTestCase(unittest.TestCase):
     @classmethod
     def setUpClass(cls):
@@ -1,14 +1,18 @@
 # Copyright (c) Microsoft Corporation. All rights reserved.
 # Licensed under the Apache License.
+import fcntl
 import os
 import shutil
 import tempfile
+import threading
 import zipfile
 from datetime import datetime, timedelta
 
 import azurelinuxagent.common.logger as logger
 from azurelinuxagent.common.utils import fileutil
-from azurelinuxagent.common.utils.archive import StateFlusher, StateArchiver, _MAX_ARCHIVED_STATES
+from azurelinuxagent.common.future import ustr
+from azurelinuxagent.common.utils.archive import StateFlusher, StateArchiver, GoalStateHistoryStore, \
+    PACKED_HISTORY_DIRECTORY_NAME, _MAX_ARCHIVED_STATES
 from tests.tools import AgentTestCase, patch
 
 debug = False
@@ -208,6 +212,87 @@ class TestArchive(AgentTestCase):
         test_subject = StateArchiver(os.path.join(self.tmp_dir, 'does-not-exist'))
         test_subject.purge()
 
+    def test_flush_should_append_the_goal_state_to_the_history_store(self):
+        history_store = GoalStateHistoryStore(self.tmp_dir)
+        flusher = StateFlusher(self.tmp_dir, history_store=history_store)
+
+        for incarnation in range(1, 4):
+            self._write_file('GoalState.{0}.xml'.format(incarnation), contents='goal state {0}'.format(incarnation))
+            self._write_file('Prod.{0}.manifest.xml'.format(incarnation), contents='manifest')
+            self._write_file('VmSettings.{0}.json'.format(incarnation * 10), contents='vm settings {0}'.format(incarnation))
+            flusher.flush()
+
+        self.assertEqual([], [f for f in os.listdir(self.tmp_dir) if f.endswith('.xml') or f.endswith('.json')], "The goal state files should have been removed")
+        self.assertEqual([PACKED_HISTORY_DIRECTORY_NAME], os.listdir(self.history_dir), "No directories should have been created for the goal states")
+        self.assertEqual(9, len(history_store.get_index()))
+
+        documents = history_store.get_documents(incarnation=2)
+        self.assertEqual({'GoalState.2.xml': b'goal state 2', 'Prod.2.manifest.xml': b'manifest', 'VmSettings.20.json': b'vm settings 2'}, documents)
+        self.assertEqual(documents, history_store.get_documents(etag=20))
+        self.assertIsNone(history_store.get_documents(incarnation=4))
+
+        offsets = set([e["offset"] for e in history_store.get_index() if e["name"].endswith('manifest.xml')])
+        self.assertEqual(1, len(offsets), "The manifest should have been stored only once")
+
+    def test_purge_should_remove_the_oldest_days_of_history(self):
+        history_store = GoalStateHistoryStore(self.tmp_dir)
+        today = datetime.utcnow()
+        for days in range(4, -1, -1):
+            goal_state = self._write_file('GoalState.{0}.xml'.format(days), contents=str(days) * 2048)
+            history_store.add(ustr(days), None, [goal_state], timestamp=today - timedelta(days=days))
+
+        history_size = history_store.get_size()
+        history_store.purge(history_size - 1)
+        self.assertIsNone(history_store.get_documents(incarnation=4), "The oldest day should have been removed")
+        self.assertIsNotNone(history_store.get_documents(incarnation=3))
+
+        history_store.purge(0)
+        self.assertEqual(['0'], [e["incarnation"] for e in history_store.get_index()], "The current day should not be removed")
+
+    def test_compaction_should_run_in_the_background(self):
+        history_store = GoalStateHistoryStore(self.tmp_dir)
+        archiver = StateArchiver(self.tmp_dir)
+        with patch.object(archiver, "archive") as archive:
+            with patch.object(history_store, "purge") as purge:
+                self.assertTrue(history_store.start_compaction(1024, archiver=archiver))
+                history_store._compaction_thread.join()
+        self.assertEqual(1, archive.call_count)
+        self.assertEqual([((1024,), {})], purge.call_args_list)
+
+    def test_add_should_wait_for_the_appends_of_other_processes_to_the_pack(self):
+        history_store = GoalStateHistoryStore(self.tmp_dir)
+        timestamp = datetime.utcnow()
+        history_store.add("1", None, [self._write_file('GoalState.1.xml', contents='goal state 1')], timestamp=timestamp)
+        pack_path = os.path.join(self.history_dir, PACKED_HISTORY_DIRECTORY_NAME, "{0}.pack".format(timestamp.strftime("%Y-%m-%d")))
+        goal_state = self._write_file('GoalState.2.xml', contents='goal state 2')
+
+        with open(pack_path, "ab") as pack:
+            # the lock on this (separate) file description stands for an append from another process, e.g. the daemon
+            fcntl.flock(pack.fileno(), fcntl.LOCK_EX)
+            try:
+                add_thread = threading.Thread(target=lambda: history_store.add("2", None, [goal_state], timestamp=timestamp))
+                add_thread.start()
+                add_thread.join(0.5)
+                self.assertTrue(add_thread.is_alive(), "add() should wait for the lock on the pack")
+                pack.write(b"data appended by another process")
+                pack.flush()
+            finally:
+                fcntl.flock(pack.fileno(), fcntl.LOCK_UN)
+        add_thread.join()
+
+        self.assertEqual({'GoalState.1.xml': b'goal state 1'}, history_store.get_documents(incarnation=1))
+        self.assertEqual({'GoalState.2.xml': b'goal state 2'}, history_store.get_documents(incarnation=2))
+
+    def test_compaction_should_lower_the_priority_only_on_linux(self):
+        for system, expected_calls in [("Linux", [((19,), {})]), ("FreeBSD", []), ("OpenBSD", [])]:
+            history_store = GoalStateHistoryStore(self.tmp_dir)
+            with patch("azurelinuxagent.common.utils.archive.platform.system", return_value=system):
+                with patch("azurelinuxagent.common.utils.archive.os.nice") as nice:
+                    with patch.object(history_store, "purge"):
+                        self.assertTrue(history_store.start_compaction(1024))
+                        history_store._compaction_thread.join()
+            self.assertEqual(expected_calls, nice.call_args_list, "Unexpected calls to os.nice() on {0}".format(system))
+
     @staticmethod
     def parse_isoformat(timestamp_str):
         return datetime.strptime(timestamp_str, '%Y-%m-%dT%H:%M:%S.%f')
@@ -73,6 +73,23 @@ class TestCryptoUtilOperations(AgentTestCase):
 
         self.assertRaises(IOError, crypto.get_pubkey_from_prv, prv_key)
 
+    def test_get_thumbprint_from_pem_should_match_openssl(self):
+        crypto = CryptUtil(conf.get_openssl_cmd())
+        crt = os.path.join(data_dir, "wire", "trans_cert")
+
+        self.assertEqual(crypto.get_thumbprint_from_crt(crt), crypto.get_thumbprint_from_pem(load_data("wire/trans_cert")))
+        self.assertRaises(CryptError, crypto.get_thumbprint_from_pem, load_data("wire/trans_prv"))
+
+    def test_get_rsa_pubkey_from_pem_should_match_private_keys_to_their_certificates(self):
+        crypto = CryptUtil(conf.get_openssl_cmd())
+        crt_pubkey = crypto.get_rsa_pubkey_from_pem(load_data("wire/trans_cert"))
+        prv_pubkey = crypto.get_rsa_pubkey_from_pem(load_data("wire/trans_prv"))
+
+        self.assertIsNotNone(crt_pubkey)
+        self.assertEqual(crt_pubkey, prv_pubkey)
+        self.assertNotEqual(crt_pubkey, crypto.get_rsa_pubkey_from_pem(load_data("wire/sample.pem")))
+        self.assertRaises(CryptError, crypto.get_rsa_pubkey_from_pem, "not a PEM")
+
 
 if __name__ == '__main__':
     unittest.main()
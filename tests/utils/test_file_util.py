@@ -19,15 +19,23 @@ import errno
 import glob
 import os
 import random
+import re
 import shutil
 import string
 import tempfile
 import unittest
 import uuid
 
+try:
+    import tracemalloc
+except ImportError:
+    # tracemalloc is not available in Python 2
+    tracemalloc = None
+
 import azurelinuxagent.common.utils.fileutil as fileutil
+import azurelinuxagent.common.utils.textutil as textutil
 from azurelinuxagent.common.future import ustr
-from tests.tools import AgentTestCase, patch
+from tests.tools import AgentTestCase, Mock, patch, skip_if_predicate_true
 
 
 class TestFileOperations(AgentTestCase):
@@ -79,6 +87,42 @@ class TestFileOperations(AgentTestCase):
 
         os.remove(test_file)
 
+    def test_write_chunks_if_changed_should_skip_unchanged_content(self):
+        test_file = os.path.join(self.tmp_dir, self.test_file)
+        digests = {}
+        chunks = [ustr("abc"), ustr("\u00e9"), ustr("def")]
+
+        self.assertTrue(fileutil.write_chunks_if_changed(test_file, lambda: chunks, digests, chunk_size=2))
+        self.assertEqual("".join(chunks), fileutil.read_file(test_file))
+
+        get_chunks = Mock(side_effect=lambda: iter(chunks))
+        with patch("azurelinuxagent.common.utils.fileutil.open", create=True) as mock_open:
+            self.assertFalse(fileutil.write_chunks_if_changed(test_file, get_chunks, digests))
+        self.assertEqual(0, mock_open.call_count, "Unchanged content should not have been written")
+        self.assertEqual(1, get_chunks.call_count, "Unchanged content should have been produced only once, to hash it")
+
+        os.remove(test_file)
+        self.assertTrue(fileutil.write_chunks_if_changed(test_file, lambda: iter(chunks), digests), "A file that was removed should be written again")
+        self.assertTrue(fileutil.write_chunks_if_changed(test_file, lambda: iter([ustr("xyz")]), digests))
+        self.assertEqual("xyz", fileutil.read_file(test_file))
+        self.assertFalse(os.path.exists(test_file + ".tmp"), "The temporary file should have been renamed")
+
+    @skip_if_predicate_true(lambda: tracemalloc is None, "tracemalloc is not available")
+    def test_write_chunks_if_changed_should_use_bounded_memory(self):
+        test_file = os.path.join(self.tmp_dir, self.test_file)
+        pattern = re.compile(r'("protectedSettings"\s*:\s*)"[^"]+"')
+        text = ustr('{"protectedSettings": "secret", "publicSettings": "') + ustr("x") * (4 * 1024 * 1024) + ustr('"}')
+
+        tracemalloc.start()
+        try:
+            fileutil.write_chunks_if_changed(test_file, lambda: textutil.iter_redacted_text(text, pattern, r'\1"*** REDACTED ***"'), {})
+            peak = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+
+        self.assertEqual(pattern.sub(r'\1"*** REDACTED ***"', text), fileutil.read_file(test_file))
+        self.assertTrue(peak < 1024 * 1024, "Writing a 4 MB document should allocate much less than the size of the document; peak: {0} bytes".format(peak))
+
     def test_findre_in_file(self):
         fp = tempfile.mktemp()
         with open(fp, 'w') as f:
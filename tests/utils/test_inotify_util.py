@@ -0,0 +1,104 @@
+# Copyright 2020 Microsoft Corporation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# Requires Python 2.6+ and Openssl 1.0+
+#
+import os
+import shutil
+import threading
+import time
+
+from azurelinuxagent.common.utils.inotifyutil import DirectoryWatcher, IN_MODIFY
+from tests.tools import AgentTestCase, patch, skip_if_predicate_true, is_inotify_not_available
+
+
+class TestDirectoryWatcher(AgentTestCase):
+    def setUp(self):
+        AgentTestCase.setUp(self)
+        self.watcher = DirectoryWatcher()
+        self.directories = []
+        for i in range(2):
+            directory = os.path.join(self.tmp_dir, "events{0}".format(i))
+            os.mkdir(directory)
+            self.directories.append(directory)
+
+    def tearDown(self):
+        self.watcher.close()
+        AgentTestCase.tearDown(self)
+
+    @staticmethod
+    def _write_file(directory, name, content="test"):
+        with open(os.path.join(directory, name), "w") as file_:
+            file_.write(content)
+
+    @skip_if_predicate_true(is_inotify_not_available, "inotify is not available")
+    def test_wait_should_return_the_directories_where_files_were_written(self):
+        for directory in self.directories:
+            self.assertTrue(self.watcher.watch(directory))
+        self.assertEqual(set(), self.watcher.wait(0.01), "No changes should have been reported")
+
+        self._write_file(self.directories[1], "1.tld")
+        self.assertEqual(set([self.directories[1]]), self.watcher.wait(5))
+
+        # renames into the directory are reported too
+        self._write_file(self.tmp_dir, "2.tmp")
+        os.rename(os.path.join(self.tmp_dir, "2.tmp"), os.path.join(self.directories[0], "2.tld"))
+        self.assertEqual(set([self.directories[0]]), self.watcher.wait(5))
+
+    @skip_if_predicate_true(is_inotify_not_available, "inotify is not available")
+    def test_wait_should_report_writes_to_open_files_only_when_requested(self):
+        self.watcher.watch(self.directories[0])
+        self.watcher.watch(self.directories[1], IN_MODIFY)
+
+        files = [open(os.path.join(directory, "segment"), "w") for directory in self.directories]
+        try:
+            for file_ in files:
+                file_.write("test")
+                file_.flush()
+            self.assertEqual(set([self.directories[1]]), self.watcher.wait(5))
+        finally:
+            for file_ in files:
+                file_.close()
+
+    @skip_if_predicate_true(is_inotify_not_available, "inotify is not available")
+    def test_it_should_stop_watching_deleted_directories(self):
+        self.watcher.watch(self.directories[0])
+        self.assertFalse(self.watcher.watch(os.path.join(self.tmp_dir, "does-not-exist")))
+
+        shutil.rmtree(self.directories[0])
+        self.watcher.wait(5)
+
+        self.assertEqual([], self.watcher.get_watched_directories())
+
+    def test_interrupt_should_stop_the_wait(self):
+        self.watcher.watch(self.directories[0])
+        threading.Timer(0.1, self.watcher.interrupt).start()
+
+        start_time = time.time()
+        self.assertEqual(set(), self.watcher.wait(30))
+        self.assertTrue(time.time() - start_time < 10, "The wait was not interrupted")
+
+    def test_it_should_wait_for_the_timeout_when_inotify_is_not_available(self):
+        with patch("azurelinuxagent.common.utils.inotifyutil.ctypes.CDLL", side_effect=OSError("libc not found")):
+            watcher = DirectoryWatcher()
+        try:
+            self.assertFalse(watcher.is_available())
+            self.assertFalse(watcher.watch(self.directories[0]))
+
+            self._write_file(self.directories[0], "1.tld")
+            start_time = time.time()
+            self.assertEqual(set(), watcher.wait(0.1))
+            self.assertTrue(time.time() - start_time >= 0.1, "The wait should have timed out")
+        finally:
+            watcher.close()
@@ -16,6 +16,7 @@
 #
 
 import os
+import time
 import unittest
 
 from azurelinuxagent.common.exception import HttpError, ResourceGoneError, InvalidContainerError
@@ -823,5 +824,122 @@ class TestHttpOperations(AgentTestCase):
                 self.assertTrue(result in ustr(e))
 
 
+class TestTokenBucket(AgentTestCase):
+    def test_it_should_allow_bursts_up_to_its_capacity_and_then_delay_requests(self):
+        with patch("azurelinuxagent.common.utils.restutil.time.time", return_value=1000.0) as mock_time:
+            bucket = restutil.TokenBucket(rate=2, capacity=3)
+            self.assertEqual([0, 0, 0, 0.5, 1.0], [bucket.acquire() for _ in range(5)])
+
+            # after 2 seconds the 2 reserved tokens were used and 2 more were added
+            mock_time.return_value = 1002.0
+            self.assertEqual([0, 0, 0.5], [bucket.acquire() for _ in range(3)])
+
+    def test_http_request_should_be_rate_limited_only_for_the_wireserver(self):
+        with patch("azurelinuxagent.common.conf.get_wireserver_request_rate", return_value=1):
+            with patch("azurelinuxagent.common.conf.get_wireserver_request_burst", return_value=2):
+                with patch("azurelinuxagent.common.utils.restutil._WIRESERVER_TOKEN_BUCKET", restutil.TokenBucket(1, 1)):
+                    with patch("azurelinuxagent.common.utils.restutil._http_request", return_value=Mock(status=httpclient.OK)):
+                        with patch("azurelinuxagent.common.utils.restutil.time.sleep") as mock_sleep:
+                            for _ in range(4):
+                                restutil.http_get("http://{0}/machine/?comp=goalstate".format(restutil.KNOWN_WIRESERVER_IP))
+                            for _ in range(4):
+                                restutil.http_get("http://foo.bar/baz")
+
+        self.assertEqual(2, mock_sleep.call_count, "Only the requests to the WireServer over the burst should have been delayed")
+
+
+class TestHttpConnectionPool(AgentTestCase):
+    def setUp(self):
+        AgentTestCase.setUp(self)
+        self.patch_conf = patch("azurelinuxagent.common.conf.get_enable_http_connection_pool", return_value=True)
+        self.patch_conf.start()
+        restutil.get_http_connection_pool().close_all()
+
+    def tearDown(self):
+        restutil.get_http_connection_pool().close_all()
+        self.patch_conf.stop()
+        AgentTestCase.tearDown(self)
+
+    @staticmethod
+    def _mock_response(closed=True, will_close=False):
+        return Mock(status=httpclient.OK, isclosed=Mock(return_value=closed), will_close=will_close, read=Mock(return_value="TheResults"))
+
+    @patch("azurelinuxagent.common.future.httpclient.HTTPConnection")
+    def test_it_should_reuse_connections_once_the_response_has_been_read(self, HTTPConnection):
+        mock_conn = MagicMock(getresponse=Mock(side_effect=self._mock_response))
+        HTTPConnection.return_value = mock_conn
+
+        for _ in range(3):
+            restutil._http_request("GET", "foo", "/bar")
+
+        self.assertEqual(1, HTTPConnection.call_count, "A single connection should have been created")
+        self.assertEqual(3, mock_conn.request.call_count)
+        for request in mock_conn.request.call_args_list:
+            self.assertNotIn('Connection', request[1]['headers'])
+
+    @patch("azurelinuxagent.common.future.httpclient.HTTPConnection")
+    def test_it_should_not_reuse_connections_with_pending_responses(self, HTTPConnection):
+        connections = []
+
+        def create_connection(*_, **__):
+            connections.append(MagicMock(getresponse=Mock(return_value=self._mock_response(closed=False))))
+            return connections[-1]
+        HTTPConnection.side_effect = create_connection
+
+        for _ in range(restutil.HTTP_CONNECTION_POOL_MAX_SIZE_PER_HOST):
+            restutil._http_request("GET", "foo", "/bar")
+
+        self.assertEqual(restutil.HTTP_CONNECTION_POOL_MAX_SIZE_PER_HOST, len(connections))
+
+        # once the pool is full the request should use a one-off connection
+        restutil._http_request("GET", "foo", "/bar")
+
+        self.assertEqual(restutil.HTTP_CONNECTION_POOL_MAX_SIZE_PER_HOST + 1, len(connections))
+        self.assertEqual('close', connections[-1].request.call_args[1]['headers']['Connection'])
+
+    @patch("azurelinuxagent.common.future.httpclient.HTTPConnection")
+    def test_it_should_use_separate_connections_per_endpoint(self, HTTPConnection):
+        HTTPConnection.side_effect = lambda *_, **__: MagicMock(getresponse=Mock(side_effect=self._mock_response))
+
+        restutil._http_request("GET", "foo", "/bar")
+        restutil._http_request("GET", "foo", "/bar", port=8080)
+        restutil._http_request("GET", "foo", "/bar", proxy_host="foo.bar", proxy_port=23333)
+        restutil._http_request("GET", "foo", "/bar")
+
+        self.assertEqual(3, HTTPConnection.call_count)
+
+    @patch("azurelinuxagent.common.future.httpclient.HTTPConnection")
+    def test_it_should_evict_idle_connections(self, HTTPConnection):
+        HTTPConnection.side_effect = lambda *_, **__: MagicMock(getresponse=Mock(side_effect=self._mock_response))
+
+        restutil._http_request("GET", "foo", "/bar")
+
+        with patch("azurelinuxagent.common.utils.restutil.time.time", return_value=time.time() + restutil.HTTP_CONNECTION_POOL_IDLE_TIMEOUT_IN_SECONDS + 1):
+            restutil._http_request("GET", "foo", "/bar")
+
+        self.assertEqual(2, HTTPConnection.call_count, "The idle connection should have been replaced")
+
+    @patch("azurelinuxagent.common.future.httpclient.HTTPConnection")
+    def test_it_should_retry_on_a_new_connection_when_a_pooled_connection_is_dead(self, HTTPConnection):
+        dead_connection = MagicMock(getresponse=Mock(side_effect=[self._mock_response(), httpclient.BadStatusLine("")]))
+        new_connection = MagicMock(getresponse=Mock(return_value=self._mock_response()))
+        HTTPConnection.side_effect = [dead_connection, new_connection]
+
+        restutil._http_request("GET", "foo", "/bar")
+        response = restutil._http_request("GET", "foo", "/bar")
+
+        self.assertEqual("TheResults", response.read())
+        self.assertEqual(2, HTTPConnection.call_count)
+        self.assertTrue(dead_connection.close.called, "The dead connection should have been closed")
+        self.assertEqual('close', new_connection.request.call_args[1]['headers']['Connection'])
+
+    @patch("azurelinuxagent.common.future.httpclient.HTTPConnection")
+    def test_it_should_raise_when_a_new_pooled_connection_fails(self, HTTPConnection):
+        HTTPConnection.return_value = MagicMock(request=Mock(side_effect=IOError("Connection refused")))
+
+        self.assertRaises(IOError, restutil._http_request, "GET", "foo", "/bar")
+        self.assertEqual(1, HTTPConnection.call_count)
+
+
 if __name__ == '__main__':
     unittest.main()
@@ -17,6 +17,7 @@
 
 import hashlib
 import os
+import re
 import unittest
 from distutils.version import LooseVersion as Version  # pylint: disable=no-name-in-module,import-error
 
@@ -206,6 +207,18 @@ class TestTextUtil(AgentTestCase):
         self.assertRaises(ValueError, textutil.format_memory_value, 'KiloBytes', 1)
         self.assertRaises(TypeError, textutil.format_memory_value, 'bytes', None)
 
+    def test_iter_redacted_text_should_be_equivalent_to_sub(self):
+        pattern = re.compile(r'("protectedSettings"\s*:\s*)"[^"]+"')
+        for text in [
+                '',
+                'no settings',
+                '{"protectedSettings": "abc"}',
+                '{"protectedSettings":"abc", "publicSettings": "x", "protectedSettings" : "def"}trailer']:
+            self.assertEqual(pattern.sub(r'\1"*** REDACTED ***"', text), "".join(textutil.iter_redacted_text(text, pattern, r'\1"*** REDACTED ***"')))
+            chunks = list(textutil.iter_redacted_text(text, pattern, r'\1"*** REDACTED ***"', chunk_size=4))
+            self.assertEqual(pattern.sub(r'\1"*** REDACTED ***"', text), "".join(chunks))
+            self.assertTrue(all(len(chunk) <= 4 for chunk in chunks if "REDACTED" not in chunk), "The text should be yielded in slices of at most 4 characters")
+
 
 if __name__ == '__main__':
     unittest.main()